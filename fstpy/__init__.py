@@ -1,12 +1,13 @@
 # -*- coding: utf-8 -*-
 import os
-import pkg_resources
 import sys
 from pathlib import Path
 from threading import RLock, stack_size
-from typing import Final, Union, List
+from typing import Final, List, Union
 
 import pandas as pd
+import pkg_resources
+
 from .rmn_interface import RmnInterface
 
 error = 0
@@ -56,9 +57,64 @@ def fstpy_log_level_catast():
 FSTPY_LOG_LEVEL = os.environ.get("FSTPY_LOG_LEVEL")
 fstpy_progress = os.environ.get("FSTPY_PROGRESS")
 FSTPY_PROGRESS = False
-if (not (fstpy_progress is None)) and (fstpy_progress == "True"):
+if (fstpy_progress is not None) and (fstpy_progress == "True"):
     FSTPY_PROGRESS = True
 
+# read the records headers directly from the XDF directory instead of calling fstprm for each record
+fstpy_xdf_headers = os.environ.get("FSTPY_XDF_HEADERS")
+FSTPY_XDF_HEADERS = True
+if (fstpy_xdf_headers is not None) and (fstpy_xdf_headers == "False"):
+    FSTPY_XDF_HEADERS = False
+
+# maximum number of files kept open to read the records data, see std_io.get_data
+fstpy_max_open_files = os.environ.get("FSTPY_MAX_OPEN_FILES")
+FSTPY_MAX_OPEN_FILES = 10
+if fstpy_max_open_files is not None:
+    FSTPY_MAX_OPEN_FILES = int(fstpy_max_open_files)
+
+# opt-in read only memory mapped views for uncompressed IEEE records (datyp 5) instead of fstluk copies
+fstpy_mmap_reads = os.environ.get("FSTPY_MMAP_READS")
+FSTPY_MMAP_READS = False
+if (fstpy_mmap_reads is not None) and (fstpy_mmap_reads == "True"):
+    FSTPY_MMAP_READS = True
+
+# opt-in in memory cache of the decoded records data, see std_cache.DataCache
+fstpy_data_cache_max_bytes = os.environ.get("FSTPY_DATA_CACHE_MAX_BYTES")
+FSTPY_DATA_CACHE_MAX_BYTES = None
+if fstpy_data_cache_max_bytes is not None:
+    FSTPY_DATA_CACHE_MAX_BYTES = int(fstpy_data_cache_max_bytes)
+
+# size of the cache of decoded records used to read windows of packed records, see std_io.get_data_window
+fstpy_window_cache_max_bytes = os.environ.get("FSTPY_WINDOW_CACHE_MAX_BYTES")
+FSTPY_WINDOW_CACHE_MAX_BYTES = 256 * 1024 * 1024
+if fstpy_window_cache_max_bytes is not None:
+    FSTPY_WINDOW_CACHE_MAX_BYTES = int(fstpy_window_cache_max_bytes)
+
+# number of threads used by the async api (to_pandas_async, compute_async)
+fstpy_async_workers = os.environ.get("FSTPY_ASYNC_WORKERS")
+FSTPY_ASYNC_WORKERS = 4
+if fstpy_async_workers is not None:
+    FSTPY_ASYNC_WORKERS = int(fstpy_async_workers)
+
+# number of decoded records waiting for the StandardFileWriter in its queue, the records are also read by chunks
+# of this size so at most twice this number of records are materialized ahead of the writer
+fstpy_write_queue_depth = os.environ.get("FSTPY_WRITE_QUEUE_DEPTH")
+FSTPY_WRITE_QUEUE_DEPTH = 32
+if fstpy_write_queue_depth is not None:
+    FSTPY_WRITE_QUEUE_DEPTH = max(1, int(fstpy_write_queue_depth))
+
+# memory used by the decoded records of a block when records are read by blocks (writer, compute)
+fstpy_block_max_bytes = os.environ.get("FSTPY_BLOCK_MAX_BYTES")
+FSTPY_BLOCK_MAX_BYTES = 512 * 1024 * 1024
+if fstpy_block_max_bytes is not None:
+    FSTPY_BLOCK_MAX_BYTES = int(fstpy_block_max_bytes)
+
+# opt-in on disk cache of the records metadata, see std_cache.MetadataCache
+FSTPY_METADATA_CACHE_DIR = os.environ.get("FSTPY_METADATA_CACHE_DIR")
+fstpy_metadata_cache_max_bytes = os.environ.get("FSTPY_METADATA_CACHE_MAX_BYTES")
+FSTPY_METADATA_CACHE_MAX_BYTES = None
+if fstpy_metadata_cache_max_bytes is not None:
+    FSTPY_METADATA_CACHE_MAX_BYTES = int(fstpy_metadata_cache_max_bytes)
 
 FSTPY_LOG_VALUES = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
 # if FSTPY_LOG_LEVEL is None:
@@ -66,7 +122,7 @@ FSTPY_LOG_VALUES = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
 # elif FSTPY_LOG_LEVEL not in FSTPY_LOG_VALUES:
 #     logging.error(
 #         f'Acceptable FSTPY_LOG_LEVEL environment variable values are {FSTPY_LOG_VALUES}')
-if not (FSTPY_LOG_LEVEL is None):
+if FSTPY_LOG_LEVEL is not None:
     if FSTPY_LOG_LEVEL == "DEBUG":
         fstpy_log_level_debug()
     elif FSTPY_LOG_LEVEL == "INFO":
@@ -303,6 +359,7 @@ from .dataframe_utils import *
 from .log import *
 from .quick_pressure import *
 from .recover_mask import *
+from .std_cache import *
 from .std_dec import *
 from .std_enc import *
 from .std_grid import *
@@ -310,5 +367,6 @@ from .std_io import *
 from .std_reader import *
 from .std_vgrid import *
 from .std_writer import *
+from .std_xdf import *
 from .unit_helpers import *
 from .utils import *
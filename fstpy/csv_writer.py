@@ -1,5 +1,6 @@
 from .utils import CsvArray
 from fstpy.std_reader import compute
+from fstpy.dataframe import from_compact_dtypes
 import os.path
 import pandas as pd
 
@@ -103,7 +104,7 @@ class CsvFileWriter:
         :raises CsvFileWriterError: The path already has a file. Overwrite default value is false.
         """
         if not os.path.isfile(self.path) or self.overwrite == True:
-            self.df = compute(self.df)
+            self.df = from_compact_dtypes(compute(self.df))
             self.convert_d_column()
             self.remove_grid_column()
             self.check_columns()
@@ -12,18 +12,23 @@ import pytz
 
 from fstpy.rmn_interface import RmnInterface
 
-from fstpy.std_enc import create_encoded_standard_etiket
+from fstpy.std_enc import (
+    create_encoded_dateos,
+    create_encoded_standard_etiket,
+    decode_new_style_stamps,
+    encode_new_style_stamps,
+    is_new_style_stamp,
+)
 from fstpy.std_dec import (
     VCREATE_DATA_TYPE_STR,
-    VCREATE_FORECAST_HOUR,
     VCREATE_GRID_IDENTIFIER,
-    VCREATE_IP_INFO,
+    get_ip_info_arrays,
     VGET_UNIT_AND_DESCRIPTION,
     VGET_UNIT,
     VGET_DESCRIPTION,
-    VPARSE_ETIKET,
+    parse_etikets,
 )
-from fstpy.std_dec import convert_rmndate_to_datetime
+from fstpy.std_dec import convert_rmndates_to_datetime64, get_forecast_hours
 from fstpy.std_vgrid import set_vertical_coordinate_type
 from fstpy.utils import vectorize, safe_concatenate
 
@@ -68,6 +73,32 @@ class InvalidTimezoneError(Exception):
     pass
 
 
+def is_copy_on_write_enabled() -> bool:
+    """Checks if pandas copy-on-write is enabled, it always is since pandas 3
+
+    :return: True if copy-on-write is enabled
+    :rtype: bool
+    """
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+    try:
+        return pd.get_option("mode.copy_on_write") is True
+    except (KeyError, pd.errors.OptionError):
+        return False
+
+
+def copy_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """Copies a dataframe before adding columns to it. With copy-on-write the copy is lazy, the data is only
+    copied when it is modified.
+
+    :param df: dataframe
+    :type df: pd.DataFrame
+    :return: copy of the dataframe
+    :rtype: pd.DataFrame
+    """
+    return df.copy(deep=not is_copy_on_write_enabled())
+
+
 def add_grid_column(df: pd.DataFrame) -> pd.DataFrame:
     """
     Adds the grid column to the dataframe. The grid column is a simple identifier composed of ip1+ip2 or ig1+ig2 depending on the type of record (>>,^^,^>) vs regular field.
@@ -89,7 +120,7 @@ def add_grid_column(df: pd.DataFrame) -> pd.DataFrame:
         if df[col].isna().any():
             raise MissingColumnError(f'A "{col}" value is missing from {col} DataFrame column, cannot add grid column!')
 
-    new_df = copy.deepcopy(df)
+    new_df = copy_dataframe(df)
     if "grid" not in new_df.columns:
         new_df["grid"] = VCREATE_GRID_IDENTIFIER(new_df.nomvar, new_df.ip1, new_df.ip2, new_df.ig1, new_df.ig2)
     else:
@@ -150,7 +181,7 @@ def add_path_and_key_columns(df: pd.DataFrame):
     if df.d.isna().any():
         raise MissingColumnError(f'A "d" value is missing from d DataFrame column, cannot add path and key column!')
 
-    new_df = copy.deepcopy(df)
+    new_df = copy_dataframe(df)
     if ("path" not in new_df.columns) or ("key" not in new_df.columns):
         new_df["path"], new_df["key"] = VPARSE_TASK_LIST(new_df.d)
     else:
@@ -278,7 +309,7 @@ def add_timezone_column(df: pd.DataFrame, source_column: str, timezone: str) ->
     new_column = "".join([source_column, "_", timezone])
     new_column = new_column.replace("/", "_")
 
-    new_df = copy.deepcopy(df)
+    new_df = copy_dataframe(df)
     if new_column not in new_df.columns:
         new_df[new_column] = VCONVERT_DATE_TO_TIMEZONE(new_df[source_column], timezone)
     else:
@@ -290,12 +321,40 @@ def add_timezone_column(df: pd.DataFrame, source_column: str, timezone: str) ->
     return new_df
 
 
-def add_flag_values(df: pd.DataFrame) -> pd.DataFrame:
+def fill_missing_values(df: pd.DataFrame, columns: List[str], masks: List[pd.Series], decode) -> pd.DataFrame:
+    """Fills the missing values of columns that are decoded together. The rows that miss at least one of the
+    values are decoded once, then each column is set on its own rows.
+
+    :param df: dataframe, modified in place
+    :type df: pd.DataFrame
+    :param columns: columns to fill
+    :type columns: List[str]
+    :param masks: rows to fill for each column
+    :type masks: List[pd.Series]
+    :param decode: function that gets the rows to decode and returns the values of every column, in order
+    :type decode: Callable
+    :return: the dataframe
+    :rtype: pd.DataFrame
+    """
+    masks = [mask.to_numpy(dtype=bool) for mask in masks]
+    rows = np.logical_or.reduce(masks)
+    if not rows.any():
+        return df
+    values = decode(df.loc[rows])
+    for col, mask, arr in zip(columns, masks, values):
+        if mask.any():
+            df.loc[mask, col] = np.asarray(arr)[mask[rows]]
+    return df
+
+
+def add_flag_values(df: pd.DataFrame, inplace: bool = False) -> pd.DataFrame:
     """Adds the correct flag values derived from parsing the typvar.
     Replaces original column(s) if present.
 
     :param df: dataframe
     :type df: pd.DataFrame
+    :param inplace: add the columns to df instead of a copy of it, defaults to False
+    :type inplace: bool, optional
     :return: flag values set according to second character of typvar if present
     :rtype: pd.DataFrame
     """
@@ -307,7 +366,7 @@ def add_flag_values(df: pd.DataFrame) -> pd.DataFrame:
     if df.typvar.isna().any():
         raise MissingColumnError(f'A "typvar" value is missing from typvar DataFrame column, cannot add flags columns!')
 
-    new_df = copy.deepcopy(df)
+    new_df = df if inplace else copy_dataframe(df)
     required_cols = [
         "masks",
         "masked",
@@ -344,47 +403,22 @@ def add_flag_values(df: pd.DataFrame) -> pd.DataFrame:
                 for col in missing_cols:
                     new_df[col] = None
 
-            if not new_df.loc[new_df.masked.isna()].empty:
-                _, _, _, _, _, _, _, _, _, masked = VPARSE_TYPVAR(new_df.loc[new_df.masked.isna()].typvar)
-                new_df.loc[new_df.multiple_modifications.isna(), "masked"] = masked
-
-            if not new_df.loc[new_df.masks.isna()].empty:
-                _, _, _, _, _, _, _, _, masks, _ = VPARSE_TYPVAR(new_df.loc[new_df.masks.isna()].typvar)
-                new_df.loc[new_df.multiple_modifications.isna(), "masks"] = masks
-
-            if not new_df.loc[new_df.multiple_modifications.isna()].empty:
-                multiple_modifications, *_ = VPARSE_TYPVAR(new_df.loc[new_df.multiple_modifications.isna()].typvar)
-                new_df.loc[new_df.multiple_modifications.isna(), "multiple_modifications"] = multiple_modifications
-
-            if not new_df.loc[new_df.zapped.isna()].empty:
-                _, zapped, *_ = VPARSE_TYPVAR(new_df.loc[new_df.zapped.isna()].typvar)
-                new_df.loc[new_df.zapped.isna(), "zapped"] = zapped
-
-            if not new_df.loc[new_df.filtered.isna()].empty:
-                _, _, filtered, *_ = VPARSE_TYPVAR(new_df.loc[new_df.filtered.isna()].typvar)
-                new_df.loc[new_df.filtered.isna(), "filtered"] = filtered
-
-            if not new_df.loc[new_df.interpolated.isna()].empty:
-                _, _, _, interpolated, *_ = VPARSE_TYPVAR(new_df.loc[new_df.interpolated.isna()].typvar)
-                new_df.loc[new_df.interpolated.isna(), "interpolated"] = interpolated
-
-            if not new_df.loc[new_df.unit_converted.isna()].empty:
-                _, _, _, _, unit_converted, *_ = VPARSE_TYPVAR(new_df.loc[new_df.unit_converted.isna()].typvar)
-                new_df.loc[new_df.unit_converted.isna(), "unit_converted"] = unit_converted
-
-            if not new_df.loc[new_df.bounded.isna()].empty:
-                _, _, _, _, _, bounded, *_ = VPARSE_TYPVAR(new_df.loc[new_df.bounded.isna()].typvar)
-                new_df.loc[new_df.bounded.isna(), "bounded"] = bounded
-
-            if not new_df.loc[new_df.missing_data.isna()].empty:
-                _, _, _, _, _, _, missing_data, *_ = VPARSE_TYPVAR(new_df.loc[new_df.missing_data.isna()].typvar)
-                new_df.loc[new_df.missing_data.isna(), "missing_data"] = missing_data
-
-            if not new_df.loc[new_df.ensemble_extra_info.isna()].empty:
-                _, _, _, _, _, _, _, ensemble_extra_info, *_ = VPARSE_TYPVAR(
-                    new_df.loc[new_df.ensemble_extra_info.isna()].typvar
-                )
-                new_df.loc[new_df.ensemble_extra_info.isna(), "ensemble_extra_info"] = ensemble_extra_info
+            # flag columns in the order returned by VPARSE_TYPVAR
+            flag_cols = [
+                "multiple_modifications",
+                "zapped",
+                "filtered",
+                "interpolated",
+                "unit_converted",
+                "bounded",
+                "missing_data",
+                "ensemble_extra_info",
+                "masks",
+                "masked",
+            ]
+            new_df = fill_missing_values(
+                new_df, flag_cols, [new_df[col].isna() for col in flag_cols], lambda df: VPARSE_TYPVAR(df.typvar)
+            )
 
     return new_df
 
@@ -504,6 +538,84 @@ def drop_duplicates(df: pd.DataFrame):
     return clean_df
 
 
+# string columns with few distinct values, stored as categoricals in the compact mode of the reader
+COMPACT_COLUMNS = [
+    "nomvar",
+    "typvar",
+    "etiket",
+    "grtyp",
+    "grid",
+    "path",
+    "unit",
+    "description",
+    "ip1_pkind",
+    "ip2_pkind",
+    "ip3_pkind",
+    "data_type_str",
+    "label",
+    "run",
+    "implementation",
+    "ensemble_member",
+    "etiket_format",
+    "vctype",
+]
+
+
+def to_compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Converts the repeated string columns (COMPACT_COLUMNS) to categoricals. Values that are not already
+    categories can't be assigned to these columns, use from_compact_dtypes before modifying them.
+
+    :param df: dataframe
+    :type df: pd.DataFrame
+    :return: dataframe with categorical string columns
+    :rtype: pd.DataFrame
+    """
+    columns = [
+        col
+        for col in COMPACT_COLUMNS
+        if (col in df.columns)
+        and (not isinstance(df[col].dtype, pd.CategoricalDtype))
+        and pd.api.types.is_string_dtype(df[col].dtype)
+    ]
+    if not len(columns):
+        return df
+    return df.astype({col: "category" for col in columns})
+
+
+def from_compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Converts the categorical columns created by to_compact_dtypes back to object strings
+
+    :param df: dataframe
+    :type df: pd.DataFrame
+    :return: dataframe with object string columns
+    :rtype: pd.DataFrame
+    """
+    columns = [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+    if not len(columns):
+        return df
+    return df.astype({col: object for col in columns})
+
+
+def concat_compact(df_list: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenates dataframes with categorical columns, the categories are merged so that the columns
+    stay categoricals instead of becoming object columns
+
+    :param df_list: list of dataframes converted with to_compact_dtypes
+    :type df_list: List[pd.DataFrame]
+    :return: concatenated dataframe
+    :rtype: pd.DataFrame
+    """
+    df_list = [df for df in df_list if not df.empty]
+    if len(df_list) < 2:
+        return pd.safe_concat(df_list) if len(df_list) else pd.DataFrame()
+    for col in df_list[0].columns:
+        if not all((col in df.columns) and isinstance(df[col].dtype, pd.CategoricalDtype) for df in df_list):
+            continue
+        categories = pd.api.types.union_categoricals([df[col] for df in df_list]).categories
+        df_list = [df.assign(**{col: df[col].cat.set_categories(categories)}) for df in df_list]
+    return pd.safe_concat(df_list)
+
+
 def add_shape_column(df: pd.DataFrame) -> pd.DataFrame:
     """Adds the shape column from the ni and nj to a dataframe.
     Replaces original column(s) if present.
@@ -531,12 +643,14 @@ def add_shape_column(df: pd.DataFrame) -> pd.DataFrame:
     return new_df
 
 
-def add_parsed_etiket_columns(df: pd.DataFrame) -> pd.DataFrame:
+def add_parsed_etiket_columns(df: pd.DataFrame, inplace: bool = False) -> pd.DataFrame:
     """Adds label,run,implementation and ensemble_member columns from the parsed etikets to a dataframe.
     Replaces original column(s) if present.
 
     :param df: dataframe
     :type df: pd.DataFrame
+    :param inplace: add the columns to df instead of a copy of it, defaults to False
+    :type inplace: bool, optional
     :return: dataframe with label,run,implementation and ensemble_member columns
              added
     :rtype: pd.DataFrame
@@ -551,11 +665,11 @@ def add_parsed_etiket_columns(df: pd.DataFrame) -> pd.DataFrame:
             f'A "etiket" value is missing from nomvar DataFrame column, cannot add parsed etiket columns!'
         )
 
-    new_df = copy.deepcopy(df)
+    new_df = df if inplace else copy_dataframe(df)
     required_cols = ["label", "run", "implementation", "ensemble_member", "etiket_format"]
     if all([(col not in new_df.columns) for col in required_cols]):
         new_df["label"], new_df["run"], new_df["implementation"], new_df["ensemble_member"], new_df["etiket_format"] = (
-            VPARSE_ETIKET(new_df.etiket)
+            parse_etikets(new_df.etiket)
         )
     else:
         if any([(col not in new_df.columns) for col in required_cols]):
@@ -563,30 +677,9 @@ def add_parsed_etiket_columns(df: pd.DataFrame) -> pd.DataFrame:
             for col in missing_cols:
                 new_df[col] = None
 
-        mask = new_df.etiket_format.isna()
-        if mask.any():
-            _, _, _, _, etiket_format = VPARSE_ETIKET(new_df.loc[mask, "etiket"])
-            new_df.loc[mask, "etiket_format"] = etiket_format
-
-        mask = new_df.label.isna()
-        if mask.any():
-            label, *_ = VPARSE_ETIKET(new_df.loc[mask, "etiket"])
-            new_df.loc[mask, "label"] = label
-
-        mask = new_df.run.isna()
-        if mask.any():
-            _, run, *_ = VPARSE_ETIKET(new_df.loc[mask, "etiket"])
-            new_df.loc[mask, "run"] = run
-
-        mask = new_df.implementation.isna()
-        if mask.any():
-            _, _, implementation, *_ = VPARSE_ETIKET(new_df.loc[mask, "etiket"])
-            new_df.loc[mask, "implementation"] = implementation
-
-        mask = new_df.ensemble_member.isna()
-        if mask.any():
-            _, _, _, ensemble_member, _ = VPARSE_ETIKET(new_df.loc[mask, "etiket"])
-            new_df.loc[mask, "ensemble_member"] = ensemble_member
+        new_df = fill_missing_values(
+            new_df, required_cols, [new_df[col].isna() for col in required_cols], lambda df: parse_etikets(df.etiket)
+        )
 
     columns_to_none_type(new_df, ["ensemble_member", "implementation", "run"])
     return new_df
@@ -598,6 +691,9 @@ def columns_to_none_type(df: pd.DataFrame, list_of_cols: list) -> pd.DataFrame:
     return df
 
 
+VCREATE_ENCODED_STANDARD_ETIKET: Final = vectorize(create_encoded_standard_etiket, otypes=["object"])
+
+
 def reduce_parsed_etiket_columns(df: pd.DataFrame) -> pd.DataFrame:
     """Removes label,run,implementation and ensemble_member columns from the dataframe.
     Updates the etiket column with the latest information
@@ -634,17 +730,8 @@ def reduce_parsed_etiket_columns(df: pd.DataFrame) -> pd.DataFrame:
     elif df[required_cols].isnull().any().any():
         df = add_parsed_etiket_columns(df)
 
-    df["etiket"] = df.apply(
-        lambda row: create_encoded_standard_etiket(
-            row["label"],
-            row["run"],
-            row["implementation"],
-            row["ensemble_member"],
-            row["etiket_format"],
-            ignore_extended=False,
-            override_pds_label=False,
-        ),
-        axis=1,
+    df["etiket"] = VCREATE_ENCODED_STANDARD_ETIKET(
+        df["label"], df["run"], df["implementation"], df["ensemble_member"], df["etiket_format"]
     )
 
     return df
@@ -671,7 +758,7 @@ def add_unit_and_description_columns(df: pd.DataFrame):
             f'A "nomvar" value is missing from nomvar DataFrame column, cannot add unit and description columns!'
         )
 
-    new_df = copy.deepcopy(df)
+    new_df = copy_dataframe(df)
 
     # Case 1: Neither column exists
     if "unit" not in new_df.columns and "description" not in new_df.columns:
@@ -708,12 +795,14 @@ def add_unit_and_description_columns(df: pd.DataFrame):
     return new_df
 
 
-def add_unit_column(df: pd.DataFrame):
+def add_unit_column(df: pd.DataFrame, inplace: bool = False):
     """Adds unit from the nomvars to a dataframe.
     Replaces original column if present.
 
     :param df: dataframe
     :type df: pd.DataFrame
+    :param inplace: add the columns to df instead of a copy of it, defaults to False
+    :type inplace: bool, optional
     :return: dataframe with unit columns added
     :rtype: pd.DataFrame
     """
@@ -725,7 +814,7 @@ def add_unit_column(df: pd.DataFrame):
     if df.nomvar.isna().any():
         raise MissingColumnError(f'A "nomvar" value is missing from nomvar DataFrame column, cannot add unit columns!')
 
-    new_df = copy.deepcopy(df)
+    new_df = df if inplace else copy_dataframe(df)
 
     if "unit" not in new_df.columns:
         new_df["unit"] = VGET_UNIT(new_df.nomvar, new_df.ip1, new_df.ip3)
@@ -739,12 +828,14 @@ def add_unit_column(df: pd.DataFrame):
     return new_df
 
 
-def add_description_column(df: pd.DataFrame):
+def add_description_column(df: pd.DataFrame, inplace: bool = False):
     """Adds description from the nomvars to a dataframe.
     Replaces original column(s) if present.
 
     :param df: dataframe
     :type df: pd.DataFrame
+    :param inplace: add the columns to df instead of a copy of it, defaults to False
+    :type inplace: bool, optional
     :return: dataframe with description columns added
     :rtype: pd.DataFrame
     """
@@ -758,7 +849,7 @@ def add_description_column(df: pd.DataFrame):
             f'A "nomvar" value is missing from nomvar DataFrame column, cannot add description columns!'
         )
 
-    new_df = copy.deepcopy(df)
+    new_df = df if inplace else copy_dataframe(df)
 
     if "description" not in new_df.columns:
         new_df["description"] = VGET_DESCRIPTION(new_df.nomvar, new_df.ip1, new_df.ip3)
@@ -772,7 +863,7 @@ def add_description_column(df: pd.DataFrame):
     return new_df
 
 
-def add_decoded_date_column(df: pd.DataFrame, attr: str = "dateo"):
+def add_decoded_date_column(df: pd.DataFrame, attr: str = "dateo", inplace: bool = False):
     """Adds the decoded dateo or datev column to the dataframe.
     Replaces original column(s) if present.
 
@@ -780,6 +871,8 @@ def add_decoded_date_column(df: pd.DataFrame, attr: str = "dateo"):
     :type df: pd.DataFrame
     :param attr: selected date to decode, defaults to 'dateo'
     :type attr: str, optional
+    :param inplace: add the columns to df instead of a copy of it, defaults to False
+    :type inplace: bool, optional
     :return: either date_of_observation or date_of_validity column added to the
              dataframe
     :rtype: pd.DataFrame
@@ -798,17 +891,15 @@ def add_decoded_date_column(df: pd.DataFrame, attr: str = "dateo"):
                 f'A "dateo" value is missing from dateo DataFrame column, cannot add date_of_observation column!'
             )
 
-        new_df = copy.deepcopy(df)
+        new_df = df if inplace else copy_dataframe(df)
 
         if "date_of_observation" not in new_df.columns:
-            new_df["date_of_observation"] = new_df.dateo.map(convert_rmndate_to_datetime)
+            new_df["date_of_observation"] = convert_rmndates_to_datetime64(new_df.dateo)
         else:
-            filtered_df = new_df.loc[(new_df.date_of_observation.isna()) & (new_df.dateo != 0)]
+            mask = (new_df.date_of_observation.isna()) & (new_df.dateo != 0)
 
-            if not filtered_df.empty:
-                new_df.loc[(new_df.date_of_observation.isna()) & (new_df.dateo != 0), "date_of_observation"] = (
-                    filtered_df.dateo.map(convert_rmndate_to_datetime)
-                )
+            if mask.any():
+                new_df.loc[mask, "date_of_observation"] = convert_rmndates_to_datetime64(new_df.loc[mask, "dateo"])
 
     else:
         if "datev" not in df.columns:
@@ -819,17 +910,15 @@ def add_decoded_date_column(df: pd.DataFrame, attr: str = "dateo"):
                 f'A "datev" value is missing from datev DataFrame column, cannot add date_of_validity column!'
             )
 
-        new_df = copy.deepcopy(df)
+        new_df = df if inplace else copy_dataframe(df)
 
         if "date_of_validity" not in new_df.columns:
-            new_df["date_of_validity"] = new_df.datev.map(convert_rmndate_to_datetime)
+            new_df["date_of_validity"] = convert_rmndates_to_datetime64(new_df.datev)
         else:
-            filtered_df = new_df.loc[(new_df.date_of_validity.isna()) & (new_df.datev != 0)]
+            mask = (new_df.date_of_validity.isna()) & (new_df.datev != 0)
 
-            if not filtered_df.empty:
-                new_df.loc[(new_df.date_of_validity.isna()) & (new_df.datev != 0), "date_of_validity"] = (
-                    filtered_df.datev.map(convert_rmndate_to_datetime)
-                )
+            if mask.any():
+                new_df.loc[mask, "date_of_validity"] = convert_rmndates_to_datetime64(new_df.loc[mask, "datev"])
 
     return new_df
 
@@ -853,26 +942,25 @@ def reduce_decoded_date_column(df: pd.DataFrame):
         raise MissingColumnError(f'"datev" is missing from DataFrame columns!')
 
     if "date_of_observation" in df.columns:
-        df["dateo"] = df.apply(
-            lambda row: (
-                RmnInterface.create_rpn_date(row["date_of_observation"]).dateo
-                if pd.notnull(row["date_of_observation"])
-                else row["dateo"]
-            ),
-            axis=1,
-        ).astype(int)
+        mask = df.date_of_observation.notna().to_numpy()
+        dateo = df.dateo.to_numpy(dtype=df.dateo.dtype, copy=True)
+        if mask.any():
+            dateo[mask] = create_encoded_dateos(df.loc[mask, "date_of_observation"])
+        df["dateo"] = dateo
 
-    df["datev"] = VUPD_DATEV_FOR_COHERENCE(df.dateo, df.deet, df.npas)
+    df["datev"] = get_datevs_for_coherence(df.dateo, df.deet, df.npas)
 
     return df
 
 
-def add_forecast_hour_column(df: pd.DataFrame):
+def add_forecast_hour_column(df: pd.DataFrame, inplace: bool = False):
     """Adds the forecast_hour column derived from the deet and npas columns.
     Replaces original column(s) if present.
 
     :param df: dataframe
     :type df: pd.DataFrame
+    :param inplace: add the columns to df instead of a copy of it, defaults to False
+    :type inplace: bool, optional
     :return: forecast_hour column added to the dataframe
     :rtype: pd.DataFrame
     """
@@ -888,14 +976,14 @@ def add_forecast_hour_column(df: pd.DataFrame):
                 f'A "{col}" value is missing from {col} DataFrame column, cannot add forecast_hour column!'
             )
 
-    new_df = copy.deepcopy(df)
+    new_df = df if inplace else copy_dataframe(df)
 
     if "forecast_hour" not in new_df.columns:
-        new_df["forecast_hour"] = VCREATE_FORECAST_HOUR(new_df.deet, new_df.npas)
+        new_df["forecast_hour"] = get_forecast_hours(new_df.deet, new_df.npas)
     else:
         mask = new_df.forecast_hour.isna()
         if mask.any():
-            forecast_hour = VCREATE_FORECAST_HOUR(new_df.loc[mask, "deet"], new_df.loc[mask, "npas"])
+            forecast_hour = get_forecast_hours(new_df.loc[mask, "deet"], new_df.loc[mask, "npas"])
             new_df.loc[mask, "forecast_hour"] = forecast_hour
 
     return new_df
@@ -1168,12 +1256,14 @@ def encode_ip3_with_interval_infos(row):
         return RmnInterface.convert_ip(RmnInterface.CONVIP_ENCODE, float(row.i_low), int(row.i_kind))
 
 
-def add_data_type_str_column(df: pd.DataFrame) -> pd.DataFrame:
+def add_data_type_str_column(df: pd.DataFrame, inplace: bool = False) -> pd.DataFrame:
     """Adds the data type decoded to string value column to the dataframe.
     Replaces original column(s) if present.
 
     :param df: dataframe
     :type df: pd.DataFrame
+    :param inplace: add the columns to df instead of a copy of it, defaults to False
+    :type inplace: bool, optional
     :return: data_type_str column added to the dataframe
     :rtype: pd.DataFrame
     """
@@ -1187,7 +1277,7 @@ def add_data_type_str_column(df: pd.DataFrame) -> pd.DataFrame:
             f'A "datyp" value is missing from datyp DataFrame column, cannot add data_type_str column!'
         )
 
-    new_df = copy.deepcopy(df)
+    new_df = df if inplace else copy_dataframe(df)
 
     if "data_type_str" not in new_df.columns:
         new_df["data_type_str"] = VCREATE_DATA_TYPE_STR(new_df.datyp)
@@ -1200,12 +1290,14 @@ def add_data_type_str_column(df: pd.DataFrame) -> pd.DataFrame:
     return new_df
 
 
-def add_ip_info_columns(df: pd.DataFrame):
+def add_ip_info_columns(df: pd.DataFrame, inplace: bool = False):
     """Adds all relevant level info from the ip1 column values.
     Replaces original column(s) if present.
 
     :param df: dataframe
     :type df: pd.DataFrame
+    :param inplace: add the columns to df instead of a copy of it, defaults to False
+    :type inplace: bool, optional
     :return: level, ip1_kind, ip1_pkind,surface and follow_topography columns
              added to the dataframe.
     :rtype: pd.DataFrame
@@ -1222,7 +1314,7 @@ def add_ip_info_columns(df: pd.DataFrame):
                 f'A "{col}" value is missing from {col} DataFrame column, cannot add ip info columns!'
             )
 
-    new_df = copy.deepcopy(df)
+    new_df = df if inplace else copy_dataframe(df)
     required_cols = [
         "level",
         "ip1_kind",
@@ -1254,7 +1346,7 @@ def add_ip_info_columns(df: pd.DataFrame):
             new_df["follow_topography"],
             new_df["ascending"],
             new_df["interval"],
-        ) = VCREATE_IP_INFO(new_df.nomvar, new_df.ip1, new_df.ip2, new_df.ip3)
+        ) = get_ip_info_arrays(new_df.nomvar, new_df.ip1, new_df.ip2, new_df.ip3)
     else:
         # Suppression d'un future warning de pandas; dans notre cas, on veut conserver le meme comportement
         # meme avec le nouveau comportement a venir. On encapsule la suppression du warning pour ce cas seulement.
@@ -1265,135 +1357,19 @@ def add_ip_info_columns(df: pd.DataFrame):
                 for col in missing_cols:
                     new_df[col] = None
 
-            mask = new_df.level.isna()
-            if mask.any():
-                level, *_ = VCREATE_IP_INFO(
-                    new_df.loc[mask, "nomvar"],
-                    new_df.loc[mask, "ip1"],
-                    new_df.loc[mask, "ip2"],
-                    new_df.loc[mask, "ip3"],
-                )
-                new_df.loc[mask, "level"] = level
-
-            mask = new_df.ip1_kind.isna()
-            if mask.any():
-                _, ip1_kind, *_ = VCREATE_IP_INFO(
-                    new_df.loc[mask, "nomvar"],
-                    new_df.loc[mask, "ip1"],
-                    new_df.loc[mask, "ip2"],
-                    new_df.loc[mask, "ip3"],
-                )
-                new_df.loc[mask, "ip1_kind"] = ip1_kind
-
-            mask = new_df.ip1_pkind.isna()
-            if mask.any():
-                _, _, ip1_pkind, *_ = VCREATE_IP_INFO(
-                    new_df.loc[mask, "nomvar"],
-                    new_df.loc[mask, "ip1"],
-                    new_df.loc[mask, "ip2"],
-                    new_df.loc[mask, "ip3"],
-                )
-                new_df.loc[mask, "ip1_pkind"] = ip1_pkind
-
-            mask = new_df.ip2_dec.isna()
-            if mask.any():
-                _, _, _, ip2_dec, *_ = VCREATE_IP_INFO(
-                    new_df.loc[mask, "nomvar"],
-                    new_df.loc[mask, "ip1"],
-                    new_df.loc[mask, "ip2"],
-                    new_df.loc[mask, "ip3"],
-                )
-                new_df.loc[mask, "ip2_dec"] = ip2_dec
-
-            mask = new_df.ip2_kind.isna()
-            if mask.any():
-                _, _, _, _, ip2_kind, *_ = VCREATE_IP_INFO(
-                    new_df.loc[mask, "nomvar"],
-                    new_df.loc[mask, "ip1"],
-                    new_df.loc[mask, "ip2"],
-                    new_df.loc[mask, "ip3"],
-                )
-                new_df.loc[mask, "ip2_kind"] = ip2_kind
-
-            mask = new_df.ip2_pkind.isna()
-            if mask.any():
-                _, _, _, _, _, ip2_pkind, *_ = VCREATE_IP_INFO(
-                    new_df.loc[mask, "nomvar"],
-                    new_df.loc[mask, "ip1"],
-                    new_df.loc[mask, "ip2"],
-                    new_df.loc[mask, "ip3"],
-                )
-                new_df.loc[mask, "ip2_pkind"] = ip2_pkind
-
-            mask = new_df.ip3_dec.isna()
-            if mask.any():
-                _, _, _, _, _, _, ip3_dec, *_ = VCREATE_IP_INFO(
-                    new_df.loc[mask, "nomvar"],
-                    new_df.loc[mask, "ip1"],
-                    new_df.loc[mask, "ip2"],
-                    new_df.loc[mask, "ip3"],
-                )
-                new_df.loc[mask, "ip3_dec"] = ip3_dec
-
-            mask = new_df.ip3_kind.isna()
-            if mask.any():
-                _, _, _, _, _, _, _, ip3_kind, *_ = VCREATE_IP_INFO(
-                    new_df.loc[mask, "nomvar"],
-                    new_df.loc[mask, "ip1"],
-                    new_df.loc[mask, "ip2"],
-                    new_df.loc[mask, "ip3"],
-                )
-                new_df.loc[mask, "ip3_kind"] = ip3_kind
-
-            mask = new_df.ip3_pkind.isna()
-            if mask.any():
-                _, _, _, _, _, _, _, _, ip3_pkind, *_ = VCREATE_IP_INFO(
-                    new_df.loc[mask, "nomvar"],
-                    new_df.loc[mask, "ip1"],
-                    new_df.loc[mask, "ip2"],
-                    new_df.loc[mask, "ip3"],
-                )
-                new_df.loc[mask, "ip3_pkind"] = ip3_pkind
-
-            mask = (new_df.surface.isna()) | (new_df.surface == False)
-            if mask.any():
-                _, _, _, _, _, _, _, _, _, surface, *_ = VCREATE_IP_INFO(
-                    new_df.loc[mask, "nomvar"],
-                    new_df.loc[mask, "ip1"],
-                    new_df.loc[mask, "ip2"],
-                    new_df.loc[mask, "ip3"],
-                )
-                new_df.loc[mask, "surface"] = surface
-
-            mask = (new_df.follow_topography.isna()) | (new_df.follow_topography == False)
-            if mask.any():
-                _, _, _, _, _, _, _, _, _, _, follow_topography, *_ = VCREATE_IP_INFO(
-                    new_df.loc[mask, "nomvar"],
-                    new_df.loc[mask, "ip1"],
-                    new_df.loc[mask, "ip2"],
-                    new_df.loc[mask, "ip3"],
-                )
-                new_df.loc[mask, "follow_topography"] = follow_topography
-
-            mask = (new_df.ascending.isna()) | (new_df.ascending == False)
-            if mask.any():
-                _, _, _, _, _, _, _, _, _, _, _, ascending, _ = VCREATE_IP_INFO(
-                    new_df.loc[mask, "nomvar"],
-                    new_df.loc[mask, "ip1"],
-                    new_df.loc[mask, "ip2"],
-                    new_df.loc[mask, "ip3"],
-                )
-                new_df.loc[mask, "ascending"] = ascending
-
-            mask = new_df.interval.isna()
-            if mask.any():
-                _, _, _, _, _, _, _, _, _, _, _, _, interval = VCREATE_IP_INFO(
-                    new_df.loc[mask, "nomvar"],
-                    new_df.loc[mask, "ip1"],
-                    new_df.loc[mask, "ip2"],
-                    new_df.loc[mask, "ip3"],
-                )
-                new_df.loc[mask, "interval"] = interval
+            # the boolean columns are also decoded again where they are False
+            masks = [
+                (new_df[col].isna() | new_df[col].eq(False))
+                if col in ["surface", "follow_topography", "ascending"]
+                else new_df[col].isna()
+                for col in required_cols
+            ]
+            new_df = fill_missing_values(
+                new_df,
+                required_cols,
+                masks,
+                lambda df: get_ip_info_arrays(df.nomvar, df.ip1, df.ip2, df.ip3),
+            )
 
     return new_df
 
@@ -1462,17 +1438,20 @@ def add_columns(
         "ip_info",
         "description",
     ],
+    inplace: bool = False,
 ):
     """If valid columns are provided, they will be added.
        These include ['flags','etiket','unit','dateo','datev','forecast_hour', 'datyp','ip_info', 'description']
        Replaces original column(s) if present.
+       The dataframe is copied once, or not at all with inplace, then every decoder adds its columns to it.
 
     :param df: dataframe to modify (meta data needs to be present in dataframe)
     :type df: pd.DataFrame
-    :param decode: if decode is True, add the specified columns
-    :type decode: bool
     :param columns: [description], defaults to  ['flags','etiket','unit','dateo','datev','forecast_hour', 'datyp','ip_info', 'description']
     :type columns: List[str], optional
+    :param inplace: add the columns to df instead of a copy of it, the returned dataframe must still be used,
+                    defaults to False
+    :type inplace: bool, optional
     """
     if df.empty:
         return df
@@ -1484,33 +1463,36 @@ def add_columns(
         if col not in cols:
             logging.warning(f"{col} not found in {cols}")
 
+    if not inplace:
+        df = copy_dataframe(df)
+
     if "etiket" in columns:
-        df = add_parsed_etiket_columns(df)
+        df = add_parsed_etiket_columns(df, inplace=True)
 
     if "unit" in columns:
-        df = add_unit_column(df)
+        df = add_unit_column(df, inplace=True)
 
     if "description" in columns:
-        df = add_description_column(df)
+        df = add_description_column(df, inplace=True)
 
     if "dateo" in columns:
-        df = add_decoded_date_column(df, "dateo")
+        df = add_decoded_date_column(df, "dateo", inplace=True)
 
     if "datev" in columns:
-        df = add_decoded_date_column(df, "datev")
+        df = add_decoded_date_column(df, "datev", inplace=True)
 
     if "forecast_hour" in columns:
-        df = add_forecast_hour_column(df)
+        df = add_forecast_hour_column(df, inplace=True)
 
     if "datyp" in columns:
-        df = add_data_type_str_column(df)
+        df = add_data_type_str_column(df, inplace=True)
 
     if "ip_info" in columns:
         # df = add_ip_info_columns(df)  (Appele dans set_vertical_coordinate_type)
-        df = set_vertical_coordinate_type(df)
+        df = set_vertical_coordinate_type(df, inplace=True)
 
     if "flags" in columns:
-        df = add_flag_values(df)
+        df = add_flag_values(df, inplace=True)
 
     return df
 
@@ -1727,3 +1709,32 @@ def update_datev_for_coherence(dateo: int, deet: int, npas: int) -> int:
 
 
 VUPD_DATEV_FOR_COHERENCE: Final = vectorize(update_datev_for_coherence)
+
+
+def get_datevs_for_coherence(dateo: pd.Series, deet: pd.Series, npas: pd.Series) -> np.ndarray:
+    """Vectorized version of update_datev_for_coherence. New style dateo stamps with a deet * npas multiple of 5
+    seconds are updated directly, the other stamps are updated by librmn.
+
+    :param dateo: dateo values
+    :type dateo: pd.Series
+    :param deet: deet values
+    :type deet: pd.Series
+    :param npas: npas values
+    :type npas: pd.Series
+    :return: datev values
+    :rtype: np.ndarray
+    """
+    dateo = np.asarray(dateo, dtype=np.int64)
+    deet = np.asarray(deet, dtype=np.int64)
+    npas = np.asarray(npas, dtype=np.int64)
+    seconds = deet * npas
+
+    datev = np.zeros(dateo.shape, dtype=np.int64)
+    direct = is_new_style_stamp(dateo) & (seconds % 5 == 0)
+    datev[direct] = encode_new_style_stamps(decode_new_style_stamps(dateo[direct]) + seconds[direct] // 5)
+    direct &= is_new_style_stamp(datev)
+
+    others = ~direct
+    if others.any():
+        datev[others] = VUPD_DATEV_FOR_COHERENCE(dateo[others], deet[others], npas[others])
+    return datev
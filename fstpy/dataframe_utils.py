@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 import datetime
 import logging
-import math
 
 import numpy as np
 import pandas as pd
@@ -9,10 +8,11 @@ import pandas as pd
 from .rmn_interface import RmnInterface
 
 from fstpy import DATYP_DICT
-from fstpy.utils import to_numpy, safe_concatenate
+from fstpy.utils import get_row_blocks, safe_concatenate
 
 from .dataframe import add_columns, add_ip_info_columns, reorder_columns
-from .std_dec import convert_rmndate_to_datetime
+from .std_dec import convert_rmndates_to_datetime64, decode_ips
+from .std_io import compute_arrays
 from .std_vgrid import set_vertical_coordinate_type
 
 
@@ -132,8 +132,8 @@ def voir(df: pd.DataFrame, style=False):
 
     to_print_df = df.copy()
     to_print_df["datyp"] = to_print_df["datyp"].map(DATYP_DICT)
-    to_print_df["datev"] = to_print_df["datev"].apply(convert_rmndate_to_datetime)
-    to_print_df["dateo"] = to_print_df["dateo"].apply(convert_rmndate_to_datetime)
+    to_print_df["datev"] = convert_rmndates_to_datetime64(to_print_df["datev"])
+    to_print_df["dateo"] = convert_rmndates_to_datetime64(to_print_df["dateo"])
     to_print_df = add_ip_info_columns(to_print_df)
 
     res_df = to_print_df.sort_values(by=["nomvar", "level"], ascending=[True, False])
@@ -291,8 +291,15 @@ def compute_stats(df: pd.DataFrame):
     df["max_pos"] = None
     # print(f"        {'nomvar':6s} {'typvar':6s} {'level':8s} {'ip1':9s} {'ip2':4s} {'ip3':4s} {'dateo':10s} {'etiket':14s} {'mean':8s} {'std':8s} {'min_pos':12s} {'min':8s} {'max_pos':12s} {'max':8s}")
     # i  = 0
-    for row in df.itertuples():
-        d = to_numpy(row.d)
+    # read the records by blocks that fit in FSTPY_BLOCK_MAX_BYTES, each block is read file by file
+    blocks = {start: end for start, end in get_row_blocks(df)}
+    arrays = []
+    block_start = 0
+    for i, row in enumerate(df.itertuples()):
+        if i in blocks:
+            arrays = compute_arrays(df.d.iloc[i : blocks[i]].to_list())
+            block_start = i
+        d = arrays[i - block_start]
         min_pos = np.unravel_index(np.argmin(d), (row.ni, row.nj))
         df.at[row.Index, "min_pos"] = (min_pos[0] + 1, min_pos[1] + 1)
         max_pos = np.unravel_index(np.argmax(d), (row.ni, row.nj))
@@ -326,12 +333,10 @@ def compute_stats(df: pd.DataFrame):
 
 
 def get_kinds_and_ip1(df: pd.DataFrame) -> dict:
-    ip1s = df.ip1.unique()
+    ip1s = df.ip1.dropna().unique()
     kinds = {}
-    for ip1 in ip1s:
-        if math.isnan(ip1):
-            continue
-        (_, kind) = RmnInterface.convert_ip(RmnInterface.CONVIP_DECODE, int(ip1))
+    # each distinct ip1 is decoded once, see decode_ips
+    for ip1, kind in zip(ip1s, decode_ips(ip1s)[1].tolist()):
         if kind not in kinds.keys():
             kinds[kind] = []
         kinds[kind].append(ip1)
@@ -100,6 +100,21 @@ class RmnInterface:
 
         return list(rmn.fstinl(file_id, **kwargs))
 
+    @staticmethod
+    def find_first_record(file_id: int) -> Optional[int]:
+        """Find the first record of a file
+
+        Args:
+            file_id: File ID from open_file
+
+        Returns:
+            Key of the first record or None if the file has no records
+        """
+        record = rmn.fstinf(file_id)
+        if record is None:
+            return None
+        return record["key"]
+
     @staticmethod
     def read_record(record_key: int) -> Dict:
         """Read data from a record
@@ -124,6 +139,15 @@ class RmnInterface:
         """
         rmn.fstecr(file_id, data, record_meta, rewrite)
 
+    @staticmethod
+    def delete_record(record_key: int) -> None:
+        """Delete a record
+
+        Args:
+            record_key: Record key from find_records, the file must be opened in write mode
+        """
+        rmn.fsteff(record_key)
+
     @staticmethod
     def update_record_metadata(
         record_key: int,
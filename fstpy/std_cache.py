@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+import pickle
+from collections import OrderedDict
+from threading import Lock
+from typing import Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from . import FSTPY_METADATA_CACHE_DIR, FSTPY_METADATA_CACHE_MAX_BYTES
+
+
+class MetadataCacheError(Exception):
+    pass
+
+
+class DataCacheError(Exception):
+    pass
+
+
+class MetadataCache:
+    """On disk cache of the records metadata of standard files. There is one cache file per input file,
+    it holds the basic columns with the grid, path and key columns. An entry is only used if the identity
+    of the input file (size, modification time and inode) is the same as when the entry was created.
+
+    :param directory: directory where the cache files are stored
+    :type directory: str
+    :param max_bytes: maximum size of the cache directory, least recently used entries are removed
+                      when it is exceeded, defaults to None (no limit)
+    :type max_bytes: int, optional
+    :param validate: file attributes that must not have changed for an entry to be valid,
+                     any of 'size', 'mtime' and 'inode', defaults to ('size', 'mtime', 'inode')
+    :type validate: Tuple[str], optional
+    :raises MetadataCacheError: the directory is not owned by the current user or is writable by others.
+                                The entries are pickled, loading an entry written by someone else could run
+                                arbitrary code, so the cache directory can't be shared.
+    """
+
+    attributes = ["size", "mtime", "inode"]
+
+    def __init__(self, directory: str, max_bytes: int = None, validate: Tuple[str] = ("size", "mtime", "inode")):
+        self.directory = os.path.abspath(str(directory))
+        self.max_bytes = max_bytes
+        self.validate = tuple(validate)
+        for attr in self.validate:
+            if attr not in self.attributes:
+                raise MetadataCacheError(f"MetadataCache - validate must contain values in {self.attributes}")
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        if not self._is_private(os.stat(self.directory)):
+            raise MetadataCacheError(
+                f"MetadataCache - {self.directory} must be owned by the current user and not be writable by "
+                "group or others, the cache entries are pickled so the cache directory must be private"
+            )
+
+    @staticmethod
+    def _is_private(stat: os.stat_result) -> bool:
+        return (stat.st_uid == os.getuid()) and not (stat.st_mode & 0o022)
+
+    def _entry_path(self, path: str) -> str:
+        name = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.pkl")
+
+    def _identity(self, path: str) -> tuple:
+        stat = os.stat(path)
+        values = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "inode": stat.st_ino}
+        return tuple(values[attr] for attr in self.validate)
+
+    def get(self, path: str) -> Union[pd.DataFrame, None]:
+        """Gets the cached metadata of a file
+
+        :param path: path of the standard file
+        :type path: str
+        :return: the cached dataframe or None if there is no valid entry
+        :rtype: Union[pd.DataFrame, None]
+        """
+        entry_path = self._entry_path(path)
+        try:
+            fd = os.open(entry_path, os.O_RDONLY | os.O_NOFOLLOW)
+        except OSError:
+            return None
+        with os.fdopen(fd, "rb") as f:
+            # the entries are pickled, never load one that could have been written by someone else
+            if not self._is_private(os.fstat(f.fileno())):
+                logging.warning(
+                    f"MetadataCache - ignoring cache entry {entry_path} that is not private to the current user"
+                )
+                return None
+            try:
+                entry = pickle.load(f)
+            except Exception as e:
+                logging.warning(f"MetadataCache - removing unreadable cache entry {entry_path}: {e}")
+                entry = None
+        if entry is None:
+            self._remove(entry_path)
+            return None
+
+        if (entry["path"] != os.path.abspath(path)) or (entry["identity"] != self._identity(path)):
+            self._remove(entry_path)
+            return None
+
+        # keep track of usage for the least recently used eviction
+        os.utime(entry_path)
+        return entry["df"]
+
+    def put(self, path: str, df: pd.DataFrame):
+        """Stores the metadata of a file in the cache
+
+        :param path: path of the standard file
+        :type path: str
+        :param df: metadata dataframe to store
+        :type df: pd.DataFrame
+        """
+        entry_path = self._entry_path(path)
+        entry = {"path": os.path.abspath(path), "identity": self._identity(path), "df": df}
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, entry_path)
+
+        if self.max_bytes is not None:
+            self.trim(self.max_bytes)
+
+    def trim(self, max_bytes: int):
+        """Removes the least recently used entries until the cache is smaller than max_bytes
+
+        :param max_bytes: maximum size of the cache directory
+        :type max_bytes: int
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pkl"):
+                continue
+            entry_path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(entry_path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total <= max_bytes:
+                break
+            self._remove(entry_path)
+            total -= size
+
+    def clear(self):
+        """Removes all the entries of the cache"""
+        self.trim(0)
+
+    def _remove(self, entry_path: str):
+        try:
+            os.unlink(entry_path)
+        except FileNotFoundError:
+            pass
+
+
+class DataCache:
+    """In memory cache of decoded records data, with a maximum size in bytes. Entries are identified by
+    the path and key of the record and the modification time of the file. When the cache is full, the
+    least recently used large arrays are evicted first so that small records that are often reused,
+    like P0, HY or !!, stay in the cache. Copies of the arrays are stored and returned.
+
+    :param max_bytes: maximum size of the cached arrays
+    :type max_bytes: int
+    :param small_bytes: arrays of this size or smaller are only evicted when there are no larger arrays
+                        left in the cache, defaults to None (max_bytes / 100)
+    :type small_bytes: int, optional
+    """
+
+    def __init__(self, max_bytes: int, small_bytes: int = None):
+        if max_bytes < 0:
+            raise DataCacheError("DataCache - max_bytes must be positive")
+        self.max_bytes = max_bytes
+        self.small_bytes = max_bytes // 100 if small_bytes is None else small_bytes
+        self.lock = Lock()
+        # least recently used first, one dictionary for each size class
+        self.large = OrderedDict()
+        self.small = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple[str, int, int]) -> Union[np.ndarray, None]:
+        """Gets a copy of a cached array
+
+        :param key: path, key and file modification time of the record
+        :type key: Tuple[str, int, int]
+        :return: the array or None if it is not in the cache
+        :rtype: Union[np.ndarray, None]
+        """
+        with self.lock:
+            for entries in (self.small, self.large):
+                if key in entries:
+                    entries.move_to_end(key)
+                    self.hits += 1
+                    return entries[key].copy(order="K")
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple[str, int, int], arr: np.ndarray):
+        """Stores a copy of an array
+
+        :param key: path, key and file modification time of the record
+        :type key: Tuple[str, int, int]
+        :param arr: decoded array
+        :type arr: np.ndarray
+        """
+        if arr.nbytes > self.max_bytes:
+            return
+        with self.lock:
+            if (key in self.small) or (key in self.large):
+                return
+            entries = self.small if arr.nbytes <= self.small_bytes else self.large
+            entries[key] = arr.copy(order="K")
+            self.nbytes += arr.nbytes
+            while self.nbytes > self.max_bytes:
+                entries = self.large if len(self.large) else self.small
+                _, evicted = entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        """Removes all the arrays from the cache and resets the statistics"""
+        with self.lock:
+            self.large.clear()
+            self.small.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> dict:
+        """Gets the cache statistics
+
+        :return: number of hits, misses, evictions and entries, and size of the cached arrays in bytes
+        :rtype: dict
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.small) + len(self.large),
+                "nbytes": self.nbytes,
+            }
+
+
+def get_default_metadata_cache() -> Union[MetadataCache, None]:
+    """Creates the metadata cache defined by the FSTPY_METADATA_CACHE_DIR and
+    FSTPY_METADATA_CACHE_MAX_BYTES environment variables
+
+    :return: a MetadataCache or None if FSTPY_METADATA_CACHE_DIR is not set
+    :rtype: Union[MetadataCache, None]
+    """
+    if FSTPY_METADATA_CACHE_DIR is None:
+        return None
+    return MetadataCache(FSTPY_METADATA_CACHE_DIR, FSTPY_METADATA_CACHE_MAX_BYTES)
@@ -1,18 +1,20 @@
 # -*- coding: utf-8 -*-
-from typing import Dict, Any
 import datetime
-from typing import Final, Dict, List, Tuple, Union, Optional
-from .std_io import decode_ip123
+import functools
+import re
+from typing import Any, Dict, Final, List, Optional, Tuple, Union
 
+import cmcdict
 import numpy as np
 import pandas as pd
 
 from fstpy import DATYP_DICT, INV_DATYP_DICT
 from fstpy.unit_helpers import CMC_TO_CF_UNITS
 from fstpy.utils import vectorize
-from .rmn_interface import RmnInterface
 
-import cmcdict
+from .rmn_interface import RmnInterface
+from .std_enc import NEW_STYLE_STAMP_EPOCH, decode_new_style_stamps, is_new_style_stamp
+from .std_io import DecodeIpError, decode_ip123
 
 
 class Interval:
@@ -104,6 +106,20 @@ def get_forecast_hour(deet: int, npas: int) -> datetime.timedelta:
 VCREATE_FORECAST_HOUR: Final = vectorize(get_forecast_hour, otypes=["timedelta64[ns]"])  # ,otypes=['timedelta64[ns]']
 
 
+def get_forecast_hours(deet: np.ndarray, npas: np.ndarray) -> np.ndarray:
+    """Vectorized version of get_forecast_hour
+
+    :param deet: lengths of the time steps, in seconds
+    :type deet: np.ndarray
+    :param npas: time step numbers
+    :type npas: np.ndarray
+    :return: time deltas of deet * npas
+    :rtype: np.ndarray
+    """
+    seconds = (np.asarray(npas) * np.asarray(deet)).astype(np.int64)
+    return seconds.astype("timedelta64[s]").astype("timedelta64[ns]")
+
+
 def get_data_type_str(datyp: int):
     """gets the data type string from the datyp int
 
@@ -193,6 +209,140 @@ VCREATE_IP_INFO: Final = vectorize(
 )
 
 
+@functools.lru_cache(maxsize=65536)
+def decode_ip(ip: int) -> Tuple[float, int]:
+    """Decodes an encoded ip value with librmn, the results are memoized
+
+    :param ip: encoded ip value
+    :type ip: int
+    :return: value and kind
+    :rtype: Tuple[float, int]
+    """
+    value, kind = RmnInterface.convert_ip(RmnInterface.CONVIP_DECODE, ip)
+    return float(value), int(kind)
+
+
+def decode_ips(ips: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Decodes an array of encoded ip values, each distinct value is decoded once by librmn
+
+    :param ips: encoded ip values
+    :type ips: np.ndarray
+    :return: values and kinds
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    unique_ips, inverse = np.unique(np.asarray(ips, dtype="int64"), return_inverse=True)
+    values = np.empty(len(unique_ips), dtype="float64")
+    kinds = np.empty(len(unique_ips), dtype="int32")
+    for i, ip in enumerate(unique_ips.tolist()):
+        values[i], kinds[i] = decode_ip(ip)
+    return values[inverse], kinds[inverse]
+
+
+def kinds_to_strings(kinds: np.ndarray) -> np.ndarray:
+    """Vectorized RmnInterface.kind_to_string, each distinct kind is converted once
+
+    :param kinds: kind values
+    :type kinds: np.ndarray
+    :return: kind strings
+    :rtype: np.ndarray
+    """
+    unique_kinds, inverse = np.unique(np.asarray(kinds, dtype="int32"), return_inverse=True)
+    strings = np.array([RmnInterface.kind_to_string(int(kind)) for kind in unique_kinds.tolist()] + [""])
+    return strings[inverse] if len(unique_kinds) else strings[:0]
+
+
+# values of the levels of kind 4 (meters above ground) that are surface levels, see is_surface
+SURFACE_METER_LEVELS = np.arange(0.0, 10.5, 0.5)
+# kinds of levels sorted in ascending order, see get_level_sort_order
+ASCENDING_KINDS = [0, 3, 4, 21, 100]
+
+
+def get_ip_info_arrays(nomvar: np.ndarray, ip1: np.ndarray, ip2: np.ndarray, ip3: np.ndarray) -> tuple:
+    """Vectorized VCREATE_IP_INFO, gives the same values with the same dtypes. The ip values are decoded
+    with decode_ips, then the rules of decode_ip123 and get_ip_info are applied on whole arrays.
+
+    :param nomvar: nomvar values
+    :type nomvar: np.ndarray
+    :param ip1: ip1 values
+    :type ip1: np.ndarray
+    :param ip2: ip2 values
+    :type ip2: np.ndarray
+    :param ip3: ip3 values
+    :type ip3: np.ndarray
+    :raises DecodeIpError: if an encoded ip2 is not of kind 10
+    :return: level, ip1_kind, ip1_pkind, ip2_dec, ip2_kind, ip2_pkind, ip3_dec, ip3_kind, ip3_pkind,
+             surface, follow_topography, ascending and interval arrays
+    :rtype: tuple
+    """
+    nomvar = np.asarray(nomvar, dtype=object)
+    ip1 = np.asarray(ip1, dtype="int64")
+    ip2 = np.asarray(ip2, dtype="int64")
+    ip3 = np.asarray(ip3, dtype="int64")
+
+    # ips of grid descriptors are associations with the ig of the fields, they are not decoded
+    grid_descriptor = np.isin(nomvar, [">>", "^^", "^>", "!!"])
+    v1, kind1 = decode_ips(np.where(grid_descriptor, 0, ip1))
+    v2, kind2 = decode_ips(np.where(grid_descriptor, 0, ip2))
+    v3, kind3 = decode_ips(np.where(grid_descriptor, 0, ip3))
+
+    # ip2 that is not encoded is a number of hours, ip3 that is not encoded is a user defined value
+    encoded_ip2 = ip2 >= 32768
+    encoded_ip3 = ip3 >= 32768
+    invalid_ip2 = ~grid_descriptor & encoded_ip2 & (kind2 != 10)
+    if np.any(invalid_ip2):
+        raise DecodeIpError(f"Invalid kind value for ip2 {kind2[invalid_ip2][0]} != 10")
+    kind2[~encoded_ip2] = 10
+    kind3[~encoded_ip3] = 100
+
+    v1[grid_descriptor] = ip1[grid_descriptor]
+    v2[grid_descriptor] = ip2[grid_descriptor]
+    v3[grid_descriptor] = ip3[grid_descriptor]
+    kind1[grid_descriptor] = 100
+    kind2[grid_descriptor] = 100
+    kind3[grid_descriptor] = 100
+
+    # intervals, ip3 holds the lower bound of a time interval (ip2) or the other bound of a level interval (ip1)
+    regular = ~np.isin(nomvar, [">>", "^^", "^>", "!!", "HY", "P0", "PT"])
+    time_interval = regular & encoded_ip3 & (kind3 == kind2)
+    level_interval = regular & encoded_ip3 & (kind3 == kind1) & ~time_interval
+    interval = np.full(len(ip1), None, dtype=object)
+    ip1_interval = (ip1 >= 32768) & level_interval
+    ip2_interval = ~((ip1 >= 32768) & (kind1 == kind3)) & encoded_ip2 & time_interval
+    for i in np.flatnonzero(ip1_interval):
+        interval[i] = Interval("ip1", float(v1[i]), float(v3[i]), int(kind1[i]))
+    for i in np.flatnonzero(ip2_interval):
+        interval[i] = Interval("ip2", float(v3[i]), float(v2[i]), int(kind2[i]))
+
+    surface = (
+        ((kind1 == 5) & (v1 == 1)) | ((kind1 == 4) & np.isin(v1, SURFACE_METER_LEVELS)) | ((kind1 == 1) & (v1 == 1))
+    )
+    follow_topography = np.isin(kind1, [1, 4, 5])
+    ascending = np.isin(kind1, ASCENDING_KINDS)
+
+    kinds1 = kinds_to_strings(kind1)
+    kinds2 = kinds_to_strings(kind2)
+    kinds3 = kinds_to_strings(kind3)
+    kinds1[grid_descriptor] = ""
+    kinds2[grid_descriptor] = ""
+    kinds3[grid_descriptor] = ""
+
+    return (
+        v1.astype("float32"),
+        kind1,
+        kinds1,
+        v2.astype("float32"),
+        kind2,
+        kinds2,
+        v3.astype("float32"),
+        kind3,
+        kinds3,
+        surface,
+        follow_topography,
+        ascending,
+        interval,
+    )
+
+
 def get_metadata_batch(nomvars, ip1s=None, ip3s=None):
     """Gets metadata for multiple variables at once using cmcdict's batch method
 
@@ -391,6 +541,9 @@ VGET_UNIT = get_unit
 VGET_DESCRIPTION = get_description
 
 
+DUMMY_DATE_STAMPS: Final = (0, 10101011, 101010101)
+
+
 # written by Micheal Neish creator of fstd2nc
 def convert_rmndate_to_datetime(date: int) -> Optional[datetime.datetime]:
     """returns a datetime object of the decoded RMNDate int
@@ -403,13 +556,36 @@ def convert_rmndate_to_datetime(date: int) -> Optional[datetime.datetime]:
     >>> convert_rmndate_to_datetime(442998800)
     datetime.datetime(2020, 7, 14, 12, 0)
     """
-    dummy_stamps = (0, 10101011, 101010101)
-    if date not in dummy_stamps:
+    if date not in DUMMY_DATE_STAMPS:
         return RmnInterface.decode_rpn_date(int(date)).replace(tzinfo=None)
     else:
         return np.datetime64("NaT")
 
 
+def convert_rmndates_to_datetime64(dates: np.ndarray) -> np.ndarray:
+    """Vectorized version of convert_rmndate_to_datetime. New style stamps are decoded directly, the old style
+    and extended range stamps are decoded by librmn.
+
+    :param dates: RMNDate int values
+    :type dates: np.ndarray
+    :return: datetime64[ns] array of the decoded dates, NaT for the dummy stamps
+    :rtype: np.ndarray
+    """
+    dates = np.asarray(dates, dtype=np.int64)
+    result = np.full(dates.shape, np.datetime64("NaT"), dtype="datetime64[ns]")
+
+    direct = is_new_style_stamp(dates)
+    seconds = decode_new_style_stamps(dates[direct]) * 5
+    result[direct] = NEW_STYLE_STAMP_EPOCH + seconds.astype("timedelta64[s]")
+
+    others = ~direct & ~np.isin(dates, DUMMY_DATE_STAMPS)
+    if others.any():
+        unique_dates, inverse = np.unique(dates[others], return_inverse=True)
+        decoded = [convert_rmndate_to_datetime(date) for date in unique_dates]
+        result[others] = np.array(decoded, dtype="datetime64[ns]")[inverse]
+    return result
+
+
 def is_surface(ip1_kind: int, level: float) -> bool:
     """Return a bool that tell us if the level is a surface level
 
@@ -489,6 +665,55 @@ def get_grid_identifier(nomvar: str, ip1: int, ip2: int, ig1: int, ig2: int) ->
 VCREATE_GRID_IDENTIFIER: Final = vectorize(get_grid_identifier, otypes=["str"])
 
 
+# etiket formats in the order they are tried: run, label, implementation and ensemble member patterns, etiket_format
+ETIKET_FORMATS: Final = [
+    ("\\w{2}", "\\S{5}", "[NPX]", None, "2,5,1,0,D"),
+    ("\\w{2}", "\\S{5}", "[NPX]", "\\d{3}", "2,5,1,3,D"),
+    ("\\w{2}", "\\S{5}", "[NPX]", "\\d{4}", "2,5,1,4,K"),
+    ("\\w{2}", "\\S{5}", "[NPX]", "[a-zA-Z]{3}", "2,5,1,3,K"),
+    ("\\w{2}", "\\S{5}", "[NPX]", "[a-zA-Z]{4}", "2,5,1,4,K"),
+    ("\\w{2}", "\\S{6}", "[NPX]", None, "2,6,1,0,D"),
+    ("\\w{2}", "\\S{6}", "[NPX]", "\\d{3}", "2,6,1,3,D"),
+    ("\\w{2}", "\\S{6}", "[NPX]", "ALL", "2,6,1,3,D"),
+    ("\\w{2}", None, None, None, "2,0,0,0,K"),
+    ("\\w{2}", "\\S{6}", "[NPX]", "\\d{2}[a-zA-Z]", "2,6,1,3,D"),
+]
+
+PARSED_ETIKETS_MAX_SIZE: Final = 65536
+
+
+def compile_etiket_regex(formats: List[tuple]) -> Tuple[re.Pattern, List[List[Optional[int]]], List[int]]:
+    """Compiles the etiket formats in a single regex, with one group for each part of each format
+
+    :param formats: run, label, implementation and ensemble member patterns of each format, None if absent
+    :type formats: List[tuple]
+    :return: the regex, the group indexes (0 based) of the parts of each format and the format of each group
+    :rtype: Tuple[re.Pattern, List[List[Optional[int]]], List[int]]
+    """
+    alternatives = []
+    format_groups = []
+    group_formats = []
+    for format_index, patterns in enumerate(formats):
+        alternative = ""
+        groups = []
+        for pattern in patterns[:4]:
+            if pattern is None:
+                groups.append(None)
+            else:
+                alternative += f"({pattern})"
+                groups.append(len(group_formats))
+                group_formats.append(format_index)
+        alternatives.append(alternative + "$")
+        format_groups.append(groups)
+    return re.compile("^(?:" + "|".join(alternatives) + ")"), format_groups, group_formats
+
+
+ETIKET_REGEX, ETIKET_FORMAT_GROUPS, ETIKET_GROUP_FORMATS = compile_etiket_regex(ETIKET_FORMATS)
+
+# etikets already parsed by parse_etikets
+PARSED_ETIKETS: Dict[str, tuple] = {}
+
+
 def get_parsed_etiket(raw_etiket: str, etiket_format: str = ""):
     """parses the etiket of a standard file to get label, run, implementation and ensemble member if available
 
@@ -500,12 +725,10 @@ def get_parsed_etiket(raw_etiket: str, etiket_format: str = ""):
     :rtype: str
 
     >>> get_parsed_etiket('')
-    ('', '', '', '')
+    ('', None, None, None, '')
     >>> get_parsed_etiket('R1_V710_N')
-    ('_V710_', 'R1', 'N', '')
+    ('_V710_', 'R1', 'N', None, '2,6,1,0,D')
     """
-    import re
-
     label = ""
     run = None
     implementation = None
@@ -524,94 +747,15 @@ def get_parsed_etiket(raw_etiket: str, etiket_format: str = ""):
         ensemble_member = raw_etiket[idx_implementation:idx_ensemble]
         return label, run, implementation, ensemble_member, etiket_format
 
-    # match_run = "[RGPEAIMWNC_][\\dRLHMEA_]"
-    match_run = "\\w{2}"
-    match_main_cmc = "\\S{5}"
-    match_main_spooki = "\\S{6}"
-    match_implementation = "[NPX]"
-    # match_ensemble_member = "\\w{3}"
-    match_ensemble_number3 = "\\d{3}"
-    match_ensemble_number4 = "\\d{4}"
-    match_ensemble_letter3 = "[a-zA-Z]{3}"
-    match_ensemble_letter4 = "[a-zA-Z]{4}"
-    match_ensemble_all = "ALL"
-    match_ensemble_iic = "\\d{2}[a-zA-Z]"
-    match_end = "$"
-
-    re_match_run_only = match_run + match_end
-    re_match_cmc_no_ensemble = match_run + match_main_cmc + match_implementation + match_end
-    re_match_cmc_ensemble_number3 = (
-        match_run + match_main_cmc + match_implementation + match_ensemble_number3 + match_end
-    )
-    re_match_cmc_ensemble_number4 = (
-        match_run + match_main_cmc + match_implementation + match_ensemble_number4 + match_end
-    )
-    re_match_cmc_ensemble_letter3 = (
-        match_run + match_main_cmc + match_implementation + match_ensemble_letter3 + match_end
-    )
-    re_match_cmc_ensemble_letter4 = (
-        match_run + match_main_cmc + match_implementation + match_ensemble_letter4 + match_end
-    )
-    re_match_spooki_no_ensemble = match_run + match_main_spooki + match_implementation + match_end
-    re_match_spooki_ensemble = match_run + match_main_spooki + match_implementation + match_ensemble_number3 + match_end
-    re_match_spooki_ensemble_all = match_run + match_main_spooki + match_implementation + match_ensemble_all + match_end
-    re_match_spooki_ensemble_iic = match_run + match_main_spooki + match_implementation + match_ensemble_iic + match_end
-
-    if re.match(re_match_cmc_no_ensemble, raw_etiket):
-        etiket_format = "2,5,1,0,D"
-        run = raw_etiket[:2]
-        label = raw_etiket[2:7]
-        implementation = raw_etiket[7]
-    elif re.match(re_match_cmc_ensemble_number3, raw_etiket):
-        etiket_format = "2,5,1,3,D"
-        run = raw_etiket[:2]
-        label = raw_etiket[2:7]
-        implementation = raw_etiket[7]
-        ensemble_member = raw_etiket[8:11]
-    elif re.match(re_match_cmc_ensemble_number4, raw_etiket):
-        etiket_format = "2,5,1,4,K"
-        run = raw_etiket[:2]
-        label = raw_etiket[2:7]
-        implementation = raw_etiket[7]
-        ensemble_member = raw_etiket[8:12]
-    elif re.match(re_match_cmc_ensemble_letter3, raw_etiket):
-        etiket_format = "2,5,1,3,K"
-        run = raw_etiket[:2]
-        label = raw_etiket[2:7]
-        implementation = raw_etiket[7]
-        ensemble_member = raw_etiket[8:11]
-    elif re.match(re_match_cmc_ensemble_letter4, raw_etiket):
-        etiket_format = "2,5,1,4,K"
-        run = raw_etiket[:2]
-        label = raw_etiket[2:7]
-        implementation = raw_etiket[7]
-        ensemble_member = raw_etiket[8:12]
-    elif re.match(re_match_spooki_no_ensemble, raw_etiket):
-        etiket_format = "2,6,1,0,D"
-        run = raw_etiket[:2]
-        label = raw_etiket[2:8]
-        implementation = raw_etiket[8]
-    elif re.match(re_match_spooki_ensemble, raw_etiket):
-        etiket_format = "2,6,1,3,D"
-        run = raw_etiket[:2]
-        label = raw_etiket[2:8]
-        implementation = raw_etiket[8]
-        ensemble_member = raw_etiket[9:12]
-    elif re.match(re_match_spooki_ensemble_all, raw_etiket):
-        etiket_format = "2,6,1,3,D"
-        run = raw_etiket[:2]
-        label = raw_etiket[2:8]
-        implementation = raw_etiket[8]
-        ensemble_member = raw_etiket[9:12]
-    elif re.match(re_match_run_only, raw_etiket):
-        etiket_format = "2,0,0,0,K"
-        run = raw_etiket[:2]
-    elif re.match(re_match_spooki_ensemble_iic, raw_etiket):
-        etiket_format = "2,6,1,3,D"
-        run = raw_etiket[:2]
-        label = raw_etiket[2:8]
-        implementation = raw_etiket[8]
-        ensemble_member = raw_etiket[9:12]
+    match = ETIKET_REGEX.match(raw_etiket)
+    if match is not None:
+        format_index = ETIKET_GROUP_FORMATS[match.lastindex - 1]
+        run, label, implementation, ensemble_member = (
+            None if group is None else match.group(group + 1) for group in ETIKET_FORMAT_GROUPS[format_index]
+        )
+        if label is None:
+            label = ""
+        etiket_format = ETIKET_FORMATS[format_index][4]
     else:
         if len(raw_etiket) >= 2:
             label_len = len(raw_etiket) - 2
@@ -623,4 +767,68 @@ def get_parsed_etiket(raw_etiket: str, etiket_format: str = ""):
     return label, run, implementation, ensemble_member, etiket_format
 
 
+def extract_etiket_parts(etikets: pd.Series) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Parses many etikets at once, with the etiket regex applied by Series.str.extract
+
+    :param etikets: raw etikets
+    :type etikets: pd.Series
+    :return: label, run, implementation, ensemble member and etiket_format arrays, None where absent
+    :rtype: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+    """
+    etikets = etikets.reset_index(drop=True)
+    extracted = etikets.str.extract(ETIKET_REGEX, expand=True)
+    values = extracted.to_numpy(dtype=object)
+    matched = extracted.notna().to_numpy()
+
+    num_etikets = len(etikets.index)
+    label = np.full(num_etikets, "", dtype=object)
+    run = np.full(num_etikets, None, dtype=object)
+    implementation = np.full(num_etikets, None, dtype=object)
+    ensemble_member = np.full(num_etikets, None, dtype=object)
+    etiket_format = np.full(num_etikets, "", dtype=object)
+
+    unmatched = np.ones(num_etikets, dtype=bool)
+    for patterns, groups in zip(ETIKET_FORMATS, ETIKET_FORMAT_GROUPS):
+        # the run is part of every format
+        rows = matched[:, groups[0]] & unmatched
+        if not rows.any():
+            continue
+        unmatched &= ~rows
+        for part, group in zip([run, label, implementation, ensemble_member], groups):
+            if group is not None:
+                part[rows] = values[rows, group]
+        etiket_format[rows] = patterns[4]
+
+    lengths = etikets.str.len().to_numpy()
+    rows = unmatched & (lengths >= 2)
+    if rows.any():
+        run[rows] = etikets[rows].str[:2].to_numpy()
+        label[rows] = etikets[rows].str[2:].to_numpy()
+        etiket_format[rows] = [f"2,{length - 2},0,0,D" for length in lengths[rows]]
+    rows = unmatched & (lengths < 2)
+    label[rows] = etikets[rows].to_numpy()
+    return label, run, implementation, ensemble_member, etiket_format
+
+
+def parse_etikets(etikets) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Vectorized version of get_parsed_etiket, gives the same results as VPARSE_ETIKET. Every distinct etiket is
+    parsed once and kept for later calls.
+
+    :param etikets: raw etikets
+    :type etikets: pd.Series or np.ndarray
+    :return: label, run, implementation, ensemble member and etiket_format arrays, 'None' where absent
+    :rtype: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+    """
+    codes, unique_etikets = pd.factorize(np.asarray(etikets, dtype=object))
+    new_etikets = [etiket for etiket in unique_etikets if etiket not in PARSED_ETIKETS]
+    if len(new_etikets):
+        if len(PARSED_ETIKETS) + len(new_etikets) > PARSED_ETIKETS_MAX_SIZE:
+            PARSED_ETIKETS.clear()
+        parts = extract_etiket_parts(pd.Series(new_etikets, dtype=object))
+        PARSED_ETIKETS.update(zip(new_etikets, zip(*parts)))
+
+    parsed = np.array([PARSED_ETIKETS[etiket] for etiket in unique_etikets], dtype=object).reshape(-1, 5)
+    return tuple(parsed[:, i].astype(str)[codes] for i in range(5))
+
+
 VPARSE_ETIKET: Final = vectorize(get_parsed_etiket, otypes=["str", "str", "str", "str", "str"])
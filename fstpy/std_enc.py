@@ -1,9 +1,19 @@
 # -*- coding: utf-8 -*-
 import datetime
+from typing import Final
 
-from fstpy.rmn_interface import RmnInterface
+import numpy as np
+import pandas as pd
 
 from fstpy import DATYP_DICT
+from fstpy.rmn_interface import RmnInterface
+
+# new style RMNDate ints count the 5 second steps since 1980-01-01, 8 steps for every 10 values of the int
+NEW_STYLE_STAMP_OFFSET: Final[int] = 123200000
+NEW_STYLE_STAMP_EPOCH: Final = np.datetime64("1980-01-01T00:00:00", "s")
+NEW_STYLE_STAMP_MAX: Final[int] = np.iinfo(np.int32).max
+# librmn only uses new style stamps from 2000-01-01 00:00:00, it encodes the earlier dates as old style stamps
+NEW_STYLE_STAMP_MIN: Final[int] = 280988000
 
 
 def create_encoded_standard_etiket(
@@ -118,6 +128,104 @@ def create_encoded_dateo(date_of_observation: datetime.datetime) -> int:
     return RmnInterface.create_rpn_date(date_of_observation, dt=0, nstep=0).dateo
 
 
+def is_new_style_stamp(stamps: np.ndarray) -> np.ndarray:
+    """Checks which RMNDate ints are new style stamps, that can be converted without librmn. Only the stamps
+    since 2000-01-01 are new style stamps for librmn.
+
+    :param stamps: RMNDate int values
+    :type stamps: np.ndarray
+    :return: boolean array, True for the new style stamps
+    :rtype: np.ndarray
+    """
+    return (stamps >= NEW_STYLE_STAMP_MIN) & (stamps <= NEW_STYLE_STAMP_MAX) & (stamps % 10 < 8)
+
+
+def encode_new_style_stamps(steps: np.ndarray) -> np.ndarray:
+    """Encodes numbers of 5 second steps since 1980-01-01 as new style RMNDate ints
+
+    :param steps: numbers of 5 second steps since 1980-01-01
+    :type steps: np.ndarray
+    :return: RMNDate int values
+    :rtype: np.ndarray
+    """
+    return (steps // 8) * 10 + steps % 8 + NEW_STYLE_STAMP_OFFSET
+
+
+def decode_new_style_stamps(stamps: np.ndarray) -> np.ndarray:
+    """Decodes new style RMNDate ints to numbers of 5 second steps since 1980-01-01
+
+    :param stamps: new style RMNDate int values
+    :type stamps: np.ndarray
+    :return: numbers of 5 second steps since 1980-01-01
+    :rtype: np.ndarray
+    """
+    stamps = stamps - NEW_STYLE_STAMP_OFFSET
+    return (stamps // 10) * 8 + stamps % 10
+
+
+def get_dateos_from_datevs(datev, deet, npas) -> np.ndarray:
+    """Computes dateo from datev, deet and npas, the inverse of dataframe.get_datevs_for_coherence. New style datev
+    stamps with a deet * npas multiple of 5 seconds are updated directly, the other stamps are updated by librmn.
+
+    :param datev: datev values
+    :type datev: np.ndarray
+    :param deet: deet values
+    :type deet: np.ndarray
+    :param npas: npas values
+    :type npas: np.ndarray
+    :return: dateo values
+    :rtype: np.ndarray
+    """
+    datev = np.asarray(datev, dtype=np.int64)
+    deet = np.asarray(deet, dtype=np.int64)
+    npas = np.asarray(npas, dtype=np.int64)
+    seconds = deet * npas
+
+    dateo = datev.copy()
+    direct = is_new_style_stamp(datev) & (seconds % 5 == 0)
+    dateo[direct] = encode_new_style_stamps(decode_new_style_stamps(datev[direct]) - seconds[direct] // 5)
+    direct &= is_new_style_stamp(dateo)
+
+    others = ~direct & (seconds != 0)
+    if others.any():
+        dateo[others] = [
+            RmnInterface.create_rpn_date(int(v), dt=-int(d), nstep=int(n)).datev
+            for v, d, n in zip(datev[others], deet[others], npas[others])
+        ]
+    return dateo
+
+
+def create_encoded_dateos(dates) -> np.ndarray:
+    """Vectorized version of create_encoded_dateo. Dates since 2000 that fall on a 5 second step are encoded
+    directly, the other dates are encoded by librmn. Missing dates are encoded as 0.
+
+    :param dates: dates of observation
+    :type dates: pd.Series or np.ndarray of datetime64 or datetime.datetime
+    :return: dateo values as RMNDate ints
+    :rtype: np.ndarray
+    """
+    dates = pd.to_datetime(pd.Series(dates).reset_index(drop=True))
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    values = dates.to_numpy(dtype="datetime64[ns]")
+    valid = ~np.isnat(values)
+
+    step = 5 * 10**9
+    nanoseconds = (values - NEW_STYLE_STAMP_EPOCH).astype(np.int64)
+    stamps = np.zeros(values.shape, dtype=np.int64)
+    direct = valid & (nanoseconds >= 0) & (nanoseconds % step == 0)
+    stamps[direct] = encode_new_style_stamps(nanoseconds[direct] // step)
+    direct &= is_new_style_stamp(stamps)
+
+    others = valid & ~direct
+    if others.any():
+        unique_values, inverse = np.unique(values[others], return_inverse=True)
+        encoded = [create_encoded_dateo(pd.Timestamp(value).to_pydatetime()) for value in unique_values]
+        stamps[others] = np.array(encoded, dtype=np.int64)[inverse]
+    stamps[~valid] = 0
+    return stamps
+
+
 def create_encoded_npas_and_ip2(forecast_hour: datetime.timedelta, deet: int) -> tuple:
     """Creates npas and ip2 from the forecast_hour and deet attributes
 
@@ -1,34 +1,69 @@
 # -*- coding: utf-8 -*-
+import ast
+import asyncio
+import atexit
 import copy
 import datetime
+import functools
 import logging
+import math
+import mmap
 import multiprocessing as mp
 import os.path
 import pathlib
-
-
-from typing import Dict, List, Tuple, Union, Type
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import product, repeat
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple, Type, Union
 
 import numpy as np
 import pandas as pd
 from dask import array as da
 
-from . import _LOCK
+from . import (
+    _LOCK,
+    FSTPY_ASYNC_WORKERS,
+    FSTPY_DATA_CACHE_MAX_BYTES,
+    FSTPY_MAX_OPEN_FILES,
+    FSTPY_MMAP_READS,
+    FSTPY_WINDOW_CACHE_MAX_BYTES,
+    FSTPY_XDF_HEADERS,
+)
 from .rmn_interface import RmnInterface
+from .std_cache import DataCache, MetadataCache
+from .std_xdf import XdfError, get_xdf_records, map_ieee_record
+from .utils import to_numpy
 
 
-def get_dataframe_from_file(path: str, query: str = None):
+def get_dataframe_from_file(
+    path: str, query: str = None, metadata_cache: MetadataCache = None, window: Tuple[int, int, int, int] = None
+):
     from .dataframe import add_grid_column
 
-    df = get_basic_dataframe(path)
+    df = None
+    criteria = None
+    if metadata_cache is not None:
+        df = metadata_cache.get(path)
+    elif query is not None:
+        # without a cache, only the records that can match the query are scanned,
+        # the whole file is scanned otherwise so that it can be cached
+        criteria = get_query_criteria(query)
+
+    if df is None:
+        df = get_basic_dataframe(path, criteria)
+
+        df = add_grid_column(df)
 
-    df = add_grid_column(df)
+        if criteria is None and metadata_cache is not None:
+            metadata_cache.put(path, df)
 
     hy_df = df.loc[df.nomvar == "HY"]
 
     df = df.loc[df.nomvar != "HY"]
 
-    if not (query is None):
+    if query is not None:
         query_result_df = df.query(query)
 
         # get metadata
@@ -37,14 +72,146 @@ def get_dataframe_from_file(path: str, query: str = None):
     # check HY count
     df = process_hy(hy_df, df)
 
-    df = add_dask_column(df)
+    df = add_dask_column(df, window)
 
     df = df.drop(["key", "path", "shape", "swa", "lng"], axis=1, errors="ignore")
 
     return df
 
 
+def parallel_get_dataframe_from_file(
+    paths: List[str],
+    query: str = None,
+    num_workers: int = None,
+    metadata_cache: MetadataCache = None,
+    window: Tuple[int, int, int, int] = None,
+) -> List[pd.DataFrame]:
+    """Scans the headers of many files in worker processes. Each worker runs
+    get_dataframe_from_file, so HY handling and query selection are identical
+    to the serial scan, and the dataframes are returned in the order of paths.
+
+    :param paths: list of paths to files
+    :type paths: List[str]
+    :param query: parameter to pass to dataframe.query method, defaults to None
+    :type query: str, optional
+    :param num_workers: number of worker processes, defaults to None (number of cpus)
+    :type num_workers: int, optional
+    :param metadata_cache: cache of the records metadata, defaults to None
+    :type metadata_cache: MetadataCache, optional
+    :param window: (i0, i1, j0, j1) sub-domain of the fields to read, defaults to None
+    :type window: Tuple[int, int, int, int], optional
+    :return: one dataframe per file, in the same order as paths
+    :rtype: List[pd.DataFrame]
+    """
+    if num_workers is None:
+        num_workers = mp.cpu_count()
+    num_workers = max(1, num_workers)
+    chunksize = max(1, len(paths) // (num_workers * 4))
+    executor = get_process_executor(num_workers)
+    try:
+        df_list = list(
+            executor.map(
+                get_dataframe_from_file,
+                paths,
+                repeat(query),
+                repeat(metadata_cache),
+                repeat(window),
+                chunksize=chunksize,
+            )
+        )
+    except BrokenProcessPool as e:
+        raise get_broken_process_pool_error(num_workers, executor) from e
+    return df_list
+
+
+_ASYNC_EXECUTOR = None
+
+
+def get_async_executor() -> ThreadPoolExecutor:
+    """Gets the executor of the async api, its number of threads (FSTPY_ASYNC_WORKERS) bounds the number of
+    reads running at the same time, the other reads wait without blocking the event loop.
+
+    :return: the executor shared by to_pandas_async and compute_async
+    :rtype: ThreadPoolExecutor
+    """
+    global _ASYNC_EXECUTOR
+    with _LOCK:
+        if _ASYNC_EXECUTOR is None:
+            _ASYNC_EXECUTOR = ThreadPoolExecutor(max_workers=FSTPY_ASYNC_WORKERS, thread_name_prefix="fstpy")
+            atexit.register(_ASYNC_EXECUTOR.shutdown, wait=False)
+        return _ASYNC_EXECUTOR
+
+
+_PROCESS_EXECUTORS = {}
+
+
+def get_process_executor(num_workers: int) -> ProcessPoolExecutor:
+    """Gets the pool of spawned worker processes for a number of workers. A pool is created on first use and kept
+    until exit, so the workers, their librmn state and their open files are reused by the next calls.
+
+    :param num_workers: number of worker processes
+    :type num_workers: int
+    :return: the pool shared by the calls with the same number of workers
+    :rtype: ProcessPoolExecutor
+    """
+    with _LOCK:
+        executor = _PROCESS_EXECUTORS.get(num_workers)
+        if executor is None:
+            # librmn keeps global state, spawned workers start from a clean library
+            executor = ProcessPoolExecutor(max_workers=num_workers, mp_context=mp.get_context("spawn"))
+            _PROCESS_EXECUTORS[num_workers] = executor
+            atexit.register(executor.shutdown, wait=False)
+        return executor
+
+
+def release_process_executor(num_workers: int, executor: ProcessPoolExecutor):
+    """Forgets a pool whose workers died, the next call creates a new one
+
+    :param num_workers: number of worker processes
+    :type num_workers: int
+    :param executor: the broken pool
+    :type executor: ProcessPoolExecutor
+    """
+    with _LOCK:
+        if _PROCESS_EXECUTORS.get(num_workers) is executor:
+            del _PROCESS_EXECUTORS[num_workers]
+    executor.shutdown(wait=False)
+
+
+def get_broken_process_pool_error(num_workers: int, executor: ProcessPoolExecutor) -> BrokenProcessPool:
+    """Forgets a pool whose workers died and gets the error to raise. The workers are spawned, they import the
+    main module of the program again, a script that creates them outside of an if __name__ == "__main__": block
+    makes every worker fail on startup.
+
+    :param num_workers: number of worker processes
+    :type num_workers: int
+    :param executor: the broken pool
+    :type executor: ProcessPoolExecutor
+    :return: an error that explains the usual causes
+    :rtype: BrokenProcessPool
+    """
+    release_process_executor(num_workers, executor)
+    return BrokenProcessPool(
+        "the worker processes terminated abruptly. They are started with the spawn method, which imports the main "
+        'module again: a script that uses num_workers must put its code under if __name__ == "__main__":. '
+        "A worker that runs out of memory or crashes in librmn also breaks the pool."
+    )
+
+
+async def run_async(func, *args):
+    """Runs a blocking function in the executor of the async api
+
+    :param func: function to run
+    :type func: Callable
+    :return: the result of func(*args)
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_async_executor(), functools.partial(func, *args))
+
+
 def open_fst(path: str, mode: str, caller_class: str, error_class: Type):
+    if mode == RmnInterface.FST_RW:
+        release_file(path)
     file_id = RmnInterface.open_file(path, mode)
     logging.info(f"{caller_class} - opening file {path}")
     return file_id
@@ -75,6 +242,128 @@ def add_metadata_to_query_results(df, query_result_df, hy_df) -> pd.DataFrame:
     return df
 
 
+# fields that fstinl can select on, with the type of their values
+QUERY_PUSHDOWN_FIELDS = {"nomvar": str, "ip1": int, "ip2": int, "datev": int}
+# records that are needed by the query results but don't match the query
+QUERY_METADATA_NOMVARS = ["^>", ">>", "^^", "!!", "!!SF", "HY", "P0", "PT", "E1"]
+# maximum number of fstinl calls used to select the records of a query
+MAX_FSTINL_CALLS = 64
+
+
+def _get_query_conjuncts(node: ast.AST) -> List[ast.AST]:
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+        return [conjunct for value in node.values for conjunct in _get_query_conjuncts(value)]
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitAnd):
+        return _get_query_conjuncts(node.left) + _get_query_conjuncts(node.right)
+    return [node]
+
+
+def _get_predicate_values(node: ast.AST) -> Union[Tuple[str, list], None]:
+    if not (isinstance(node, ast.Compare) and len(node.ops) == 1 and isinstance(node.left, ast.Name)):
+        return None
+    field = node.left.id
+    if field not in QUERY_PUSHDOWN_FIELDS:
+        return None
+    op = node.ops[0]
+    right = node.comparators[0]
+    if isinstance(op, ast.Eq) and isinstance(right, ast.Constant):
+        values = [right.value]
+    elif isinstance(op, (ast.In, ast.Eq)) and isinstance(right, (ast.List, ast.Tuple, ast.Set)):
+        # like dataframe.query, == with a list is the same as in
+        if not all(isinstance(elt, ast.Constant) for elt in right.elts):
+            return None
+        values = [elt.value for elt in right.elts]
+    else:
+        return None
+    value_type = QUERY_PUSHDOWN_FIELDS[field]
+    if not all(isinstance(v, value_type) and not isinstance(v, bool) for v in values):
+        return None
+    if value_type is str:
+        values = [v.strip() for v in values]
+    return field, list(dict.fromkeys(values))
+
+
+def get_query_criteria(query: str) -> Union[Dict[str, list], None]:
+    """Finds the simple predicates of a query that can be used to select records with fstinl.
+    Only equality and in predicates on nomvar, ip1, ip2 and datev that are combined with and are used,
+    the complete query still has to be applied to the selected records.
+
+    >>> get_query_criteria('nomvar in ["UU","VV"] and ip1==12000')
+    {'nomvar': ['UU', 'VV'], 'ip1': [12000]}
+
+    :param query: query as passed to dataframe.query
+    :type query: str
+    :return: dictionary of field and list of values or None if no predicate can be used
+    :rtype: Union[Dict[str, list], None]
+    """
+    try:
+        tree = ast.parse(query.strip(), mode="eval")
+    except SyntaxError:
+        return None
+
+    criteria = {}
+    for conjunct in _get_query_conjuncts(tree.body):
+        predicate = _get_predicate_values(conjunct)
+        if predicate is None:
+            continue
+        field, values = predicate
+        if field in criteria:
+            # field is used twice, keep the values that satisfy both predicates
+            values = [v for v in criteria[field] if v in values]
+        criteria[field] = values
+
+    # each combination of values is a fstinl call, drop the least selective fields if there are too many
+    while len(criteria) and np.prod([len(v) for v in criteria.values()]) > MAX_FSTINL_CALLS:
+        del criteria[max(criteria, key=lambda field: len(criteria[field]))]
+
+    if not len(criteria):
+        return None
+    return criteria
+
+
+def find_query_records(file_id: int, criteria: Dict[str, list]) -> List[int]:
+    """Gets the keys of the records selected by the criteria and of all the metadata records
+
+    :param file_id: file id of the opened file
+    :type file_id: int
+    :param criteria: dictionary of field and list of values, see get_query_criteria
+    :type criteria: Dict[str, list]
+    :return: sorted list of keys
+    :rtype: List[int]
+    """
+    keys = set()
+    fields = list(criteria.keys())
+    for values in product(*[criteria[field] for field in fields]):
+        keys.update(RmnInterface.find_records(file_id, **dict(zip(fields, values))))
+    if not ("nomvar" in criteria and set(criteria["nomvar"]).issubset(QUERY_METADATA_NOMVARS)):
+        for nomvar in QUERY_METADATA_NOMVARS:
+            keys.update(RmnInterface.find_records(file_id, nomvar=nomvar))
+    return sorted(keys)
+
+
+def select_query_records(df: pd.DataFrame, criteria: Dict[str, list]) -> pd.DataFrame:
+    """Selects the records of a dataframe that match the criteria and all the metadata records
+
+    :param df: dataframe of records
+    :type df: pd.DataFrame
+    :param criteria: dictionary of field and list of values, see get_query_criteria
+    :type criteria: Dict[str, list]
+    :return: selected records
+    :rtype: pd.DataFrame
+    """
+    nomvar = df.nomvar.str.strip()
+    mask = np.ones(len(df.index), dtype=bool)
+    for field, values in criteria.items():
+        column = nomvar if field == "nomvar" else df[field]
+        mask &= column.isin(values).to_numpy()
+    mask |= nomvar.isin(QUERY_METADATA_NOMVARS).to_numpy()
+    return df.loc[mask].reset_index(drop=True)
+
+
+# ig1 of the !! records of hybrid vertical coordinates, a grid with one of these doesn't need HY
+HYBRID_TOCTOC_IG1 = [5001, 5002, 5003, 5004, 5005, 5100, 5999, 21001, 21002]
+
+
 def process_hy(hy_df: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
     """Assign HY to every grid with hybrid coordinates except if toctoc is present for the grid;
        add HY to the dataframe and set its grid.
@@ -89,43 +378,28 @@ def process_hy(hy_df: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
     if hy_df.empty or df.empty:
         return df
 
-    # On prend le 1er HY car de toute facon on ne peut pas determiner a quelle grille
-    # les HY sont associes
-    hy_df = pd.DataFrame([hy_df.iloc[0].to_dict()])
-
-    # Group by 'grid' and apply a function to each group
-    df = df.groupby("grid", group_keys=True).apply(lambda group: assign_hy(group, hy_df)).reset_index(drop=True)
-
-    return df
-
-
-def assign_hy(grid_df: pd.DataFrame, hy_df: pd.DataFrame) -> pd.DataFrame:
-    """Assign HY to a group of data when appropriate."""
-
-    from .dataframe_utils import get_hybrid_ips
-
-    hybrid_ips = get_hybrid_ips(grid_df)
+    # same grouping as a groupby on grid, records without grid are left out
+    df = df.loc[df.grid.notna()]
 
-    if len(hybrid_ips):
-        df_with_hyb_levels = grid_df.loc[grid_df.ip1.isin(hybrid_ips)]
+    # each distinct ip1 is decoded once for the whole file
+    ip1s = pd.unique(df.ip1.dropna())
+    hybrid_ip1s = [ip1 for ip1 in ip1s if RmnInterface.convert_ip(RmnInterface.CONVIP_DECODE, int(ip1))[1] == 5]
 
-        hyb_levels_grid = df_with_hyb_levels.grid.unique()
+    hybrid_grids = pd.unique(df.loc[df.ip1.isin(hybrid_ip1s), "grid"])
+    toctoc_grids = set(df.loc[(df.nomvar == "!!") & df.ig1.isin(HYBRID_TOCTOC_IG1), "grid"])
+    hy_grids = [grid for grid in hybrid_grids if grid not in toctoc_grids]
 
-        toctoc_df = grid_df.loc[grid_df.nomvar == "!!"]
+    if len(hy_grids):
+        # On prend le 1er HY car de toute facon on ne peut pas determiner a quelle grille
+        # les HY sont associes
+        new_hy_df = hy_df.iloc[[0] * len(hy_grids)].copy()
+        new_hy_df["grid"] = hy_grids
+        df = pd.safe_concat([df, new_hy_df])
 
-        # Est-ce que le toctoc est associe aux niveaux hybrid?
-        for grid in hyb_levels_grid:
-            hyb_toctoc_df = toctoc_df.loc[
-                (toctoc_df.grid == grid)
-                & (toctoc_df.ig1.isin([5001, 5002, 5003, 5004, 5005, 5100, 5999, 21001, 21002]))
-            ]
+    # records sorted by grid, the HY of a grid after its records
+    df = df.sort_values("grid", kind="stable").reset_index(drop=True)
 
-            # Pas de toctoc pour la grille, on ajoute un HY
-            if hyb_toctoc_df.empty:
-                hy_df["grid"] = grid
-                grid_df = pd.safe_concat([grid_df, hy_df])
-
-    return grid_df
+    return df
 
 
 # written by Micheal Neish creator of fstd2nc
@@ -156,33 +430,562 @@ def maybeFST(filename: Union[str, pathlib.Path]) -> bool:
         return buf[12:] == b"STDR"
 
 
-def get_data(path, key, dtype, shape, cache={}):
+class OpenFilePool:
+    """Bounded pool of files opened in read only mode, used to read the records data without opening
+    and closing the file for every record. The least recently used file is closed when the pool is full.
+    A file is reopened if its size or modification time changed since it was opened.
+
+    Record keys contain the index of the file in librmn's table of opened files, which depends on the files
+    that were open when the keys were obtained. The keys are rebased on the index of the pooled file.
+
+    :param max_open_files: maximum number of files kept open
+    :type max_open_files: int
+    """
+
+    def __init__(self, max_open_files: int):
+        self.max_open_files = max(1, max_open_files)
+        # path -> (file_id, file_index, size, mtime)
+        self.files = OrderedDict()
+
+    def get_file_index(self, path: str) -> int:
+        """Opens the file if it is not already open and returns its index in librmn's table of opened files
+
+        :param path: path to file
+        :type path: str
+        :return: index of the file, to rebase the record keys with rebase_key
+        :rtype: int
+        """
+        path = os.path.abspath(str(path))
+        with _LOCK:
+            stat = os.stat(path)
+            entry = self.files.get(path)
+            if (entry is not None) and (entry[2:] != (stat.st_size, stat.st_mtime_ns)):
+                self.release(path)
+                entry = None
+
+            if entry is None:
+                while len(self.files) >= self.max_open_files:
+                    self.release(next(iter(self.files)))
+                file_id = RmnInterface.open_file(path)
+                first_key = RmnInterface.find_first_record(file_id)
+                file_index = 0 if first_key is None else first_key & 0x3FF
+                entry = (file_id, file_index, stat.st_size, stat.st_mtime_ns)
+                self.files[path] = entry
+            else:
+                self.files.move_to_end(path)
+
+            return entry[1]
+
+    @staticmethod
+    def rebase_key(key: int, file_index: int) -> int:
+        """Replaces the file index of a record key
+
+        :param key: key of the record obtained from a previous opening of the file
+        :type key: int
+        :param file_index: index of the opened file
+        :type file_index: int
+        :return: key valid for the opened file
+        :rtype: int
+        """
+        return (int(key) & ~0x3FF) | file_index
+
+    def release(self, path: str):
+        """Closes a file if it is in the pool, must be called before the file is modified
+
+        :param path: path to file
+        :type path: str
+        """
+        with _LOCK:
+            entry = self.files.pop(os.path.abspath(str(path)), None)
+            if entry is not None:
+                RmnInterface.close_file(entry[0])
+
+    def clear(self):
+        """Closes all the files of the pool"""
+        with _LOCK:
+            for path in list(self.files.keys()):
+                self.release(path)
+
+
+_FILE_POOL = OpenFilePool(FSTPY_MAX_OPEN_FILES)
+atexit.register(_FILE_POOL.clear)
+
+
+def release_file(path: str):
+    """Closes a file kept open to read the records data and drops its memory map.
+    Writers call it before modifying a file.
+
+    :param path: path to file
+    :type path: str
+    """
+    _FILE_POOL.release(path)
+    _FILE_MAPS.release(path)
+
+
+def get_record_cache_key(path: str, key: int, stat: os.stat_result = None) -> tuple:
+    """Gets the key of the decoded data of a record in the data caches. The file index part of the record key
+    depends on the files that were open when the key was obtained, it is not part of the cache key.
+
+    :param path: path to file
+    :type path: str
+    :param key: key of the record
+    :type key: int
+    :param stat: stat of the file, defaults to None (os.stat of path)
+    :type stat: os.stat_result, optional
+    :return: (absolute path, key with a file index of 0, modification time, size)
+    :rtype: tuple
+    """
+    path = os.path.abspath(str(path))
+    if stat is None:
+        stat = os.stat(path)
+    return (path, OpenFilePool.rebase_key(key, 0), stat.st_mtime_ns, stat.st_size)
+
+
+_DATA_CACHE = None if FSTPY_DATA_CACHE_MAX_BYTES is None else DataCache(FSTPY_DATA_CACHE_MAX_BYTES)
+
+
+def set_data_cache(max_bytes: int = None, small_bytes: int = None) -> Union[DataCache, None]:
+    """Enables the in memory cache of decoded records data used when computing dask arrays
+
+    :param max_bytes: maximum size of the cached arrays, defaults to None (disables the cache)
+    :type max_bytes: int, optional
+    :param small_bytes: arrays of this size or smaller are evicted last, defaults to None (max_bytes / 100)
+    :type small_bytes: int, optional
+    :return: the new cache, use its stats method to get the hits and misses
+    :rtype: Union[DataCache, None]
+    """
+    global _DATA_CACHE
+    with _LOCK:
+        _DATA_CACHE = None if max_bytes is None else DataCache(max_bytes, small_bytes)
+    return _DATA_CACHE
+
+
+def get_data_cache() -> Union[DataCache, None]:
+    """Gets the in memory cache of decoded records data
+
+    :return: the cache or None if it is not enabled
+    :rtype: Union[DataCache, None]
+    """
+    return _DATA_CACHE
+
+
+class _FileMaps:
+    """Read only memory maps of the files, reused while the files don't change"""
+
+    def __init__(self, max_files: int):
+        self.max_files = max(1, max_files)
+        # absolute path -> (size, mtime, mmap)
+        self.maps = OrderedDict()
+
+    def get(self, path: str) -> mmap.mmap:
+        path = os.path.abspath(str(path))
+        stat = os.stat(path)
+        entry = self.maps.get(path)
+        if (entry is None) or (entry[:2] != (stat.st_size, stat.st_mtime_ns)):
+            self.release(path)
+            with open(path, "rb") as f:
+                entry = (stat.st_size, stat.st_mtime_ns, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            self.maps[path] = entry
+            while len(self.maps) > self.max_files:
+                self.release(next(iter(self.maps)))
+        self.maps.move_to_end(path)
+        return entry[2]
+
+    def release(self, path: str):
+        """Drops the map of a file, it is unmapped when the views on it are released. The map is not
+        closed, numpy views don't prevent it and would then point to unmapped memory.
+
+        :param path: path to file
+        :type path: str
+        """
+        with _LOCK:
+            self.maps.pop(os.path.abspath(str(path)), None)
+
+
+_FILE_MAPS = _FileMaps(FSTPY_MAX_OPEN_FILES)
+
+
+def get_data(path, key, dtype, shape, datyp=None, nbits=None, swa=None, lng=None):
+    return read_records(path, [key], [(datyp, nbits, swa, lng, shape)])[0]
+
+
+def map_records(path: str, layouts: List[tuple]) -> List[Union[np.ndarray, None]]:
+    """Gets read only memory mapped views of the uncompressed IEEE records (datyp 5, 32 or 64 bits),
+    no data is copied. The views are big endian and in Fortran order.
+
+    :param path: path to file
+    :type path: str
+    :param layouts: (datyp, nbits, swa, lng, shape) of the records, as in the dask graph of the records
+    :type layouts: List[tuple]
+    :return: a view for every record that can be mapped, None for the others
+    :rtype: List[Union[np.ndarray, None]]
+    """
+    arrays = [None] * len(layouts)
+    if not any((layout is not None) and (layout[0] == 5) and (layout[2] is not None) for layout in layouts):
+        return arrays
+    with _LOCK:
+        buf = _FILE_MAPS.get(path)
+        for i, layout in enumerate(layouts):
+            if (layout is None) or (layout[0] != 5) or (layout[2] is None):
+                continue
+            _, nbits, swa, lng, shape = layout
+            arrays[i] = map_ieee_record(buf, swa, lng, shape, nbits)
+    return arrays
+
+
+def read_records(path: str, keys: List[int], layouts: List[tuple] = None) -> List[np.ndarray]:
+    """Reads the data of many records of a file. The file is opened once and the records are read in
+    the order in which they are stored in the file.
+
+    :param path: path to file
+    :type path: str
+    :param keys: keys of the records
+    :type keys: List[int]
+    :param layouts: (datyp, nbits, swa, lng, shape) of the records, used to map the uncompressed IEEE records
+                    when FSTPY_MMAP_READS is set, defaults to None
+    :type layouts: List[tuple], optional
+    :return: arrays in the same order as keys
+    :rtype: List[np.ndarray]
+    """
+    arrays = [None] * len(keys)
+    if FSTPY_MMAP_READS and (layouts is not None):
+        arrays = map_records(path, layouts)
+    # keys are made of the page and record numbers in the directory, sorting them gives the file order
+    order = np.argsort(np.asarray(keys, dtype="int64"), kind="stable")
+    order = [i for i in order if arrays[i] is None]
+    with _LOCK:
+        cache = _DATA_CACHE
+        if cache is not None:
+            stat = os.stat(path)
+            for i in order:
+                arrays[i] = cache.get(get_record_cache_key(path, keys[i], stat))
+            order = [i for i in order if arrays[i] is None]
+        if len(order):
+            file_index = _FILE_POOL.get_file_index(path)
+        for i in order:
+            arrays[i] = RmnInterface.read_record(OpenFilePool.rebase_key(keys[i], file_index))["d"]
+            if cache is not None:
+                cache.put(get_record_cache_key(path, keys[i], stat), arrays[i])
+    return arrays
+
+
+def _read_records_to_shared_memory(path: str, keys: List[int]) -> Tuple[str, List[Tuple[int, str, tuple, bool]]]:
+    """Reads records in a worker process and copies their data to a shared memory block
+
+    :return: name of the shared memory block and (offset, dtype, shape, fortran order) of every array
+    :rtype: Tuple[str, List[Tuple[int, str, tuple, bool]]]
+    """
+    arrays = read_records(path, keys)
+    layout = []
+    offset = 0
+    for arr in arrays:
+        fortran = arr.flags.f_contiguous and not arr.flags.c_contiguous
+        layout.append((offset, arr.dtype.str, arr.shape, fortran))
+        # keep the blocks aligned on 64 bytes
+        offset += -(-arr.nbytes // 64) * 64
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, offset))
+    try:
+        for arr, (start, dtype, shape, fortran) in zip(arrays, layout):
+            view = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start, order="F" if fortran else "C")
+            view[...] = arr
+            del view
+        name = shm.name
+    finally:
+        shm.close()
+    return name, layout
+
+
+def parallel_read_records(records: Dict[str, List[int]], num_workers: int = None) -> Dict[str, List[np.ndarray]]:
+    """Reads the data of records in worker processes, each worker has its own librmn state so records are
+    decoded in parallel. The arrays are returned through shared memory blocks that are copied once, then released.
+
+    :param records: keys of the records to read, by path
+    :type records: Dict[str, List[int]]
+    :param num_workers: number of worker processes, defaults to None (number of cpus)
+    :type num_workers: int, optional
+    :return: arrays in the same order as the keys, by path
+    :rtype: Dict[str, List[np.ndarray]]
+    """
+    if num_workers is None:
+        num_workers = mp.cpu_count()
+    num_workers = max(1, num_workers)
+    total = sum(len(keys) for keys in records.values())
+    results = {path: [None] * len(keys) for path, keys in records.items()}
+    if total == 0:
+        return results
+
+    # a few tasks per worker to balance the load, each task reads records of a single file
+    chunk_size = max(1, math.ceil(total / (num_workers * 4)))
+    tasks = []
+    for path, keys in records.items():
+        for start in range(0, len(keys), chunk_size):
+            tasks.append((path, start, keys[start : start + chunk_size]))
+
+    executor = get_process_executor(num_workers)
+    futures = [
+        (path, start, executor.submit(_read_records_to_shared_memory, path, keys)) for path, start, keys in tasks
+    ]
+    copied = 0
+    try:
+        for path, start, future in futures:
+            name, layout = future.result()
+            copied += 1
+            shm = shared_memory.SharedMemory(name=name)
+            try:
+                for i, (offset, dtype, shape, fortran) in enumerate(layout):
+                    view = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset, order="F" if fortran else "C")
+                    results[path][start + i] = view.copy(order="K")
+                    del view
+            finally:
+                shm.close()
+                shm.unlink()
+    except BrokenProcessPool as e:
+        raise get_broken_process_pool_error(num_workers, executor) from e
+    finally:
+        # the pool outlives this call, the blocks of the tasks that were not copied after an error are released
+        for _, _, future in futures[copied:]:
+            if future.cancel():
+                continue
+            try:
+                name, _ = future.result()
+                shm = shared_memory.SharedMemory(name=name)
+                shm.close()
+                shm.unlink()
+            except Exception:
+                pass
+    return results
+
+
+def get_lazy_record(arr) -> Union[Tuple[str, int, tuple], None]:
+    """Gets the path and key of a dask array created by add_dask_column that was not modified since
+
+    :param arr: array to check
+    :type arr: Union[np.ndarray, da.core.Array]
+    :return: path, key and layout (datyp, nbits, swa, lng, shape) of the record or None if arr is not an
+             unmodified record
+    :rtype: Union[Tuple[str, int, tuple], None]
+    """
+    if not isinstance(arr, da.core.Array):
+        return None
+    graph = arr.__dask_graph__()
+    if len(graph) != 1:
+        return None
+    task = graph.get((arr.name, 0, 0))
+    if not (isinstance(task, tuple) and len(task) >= 5 and task[0] is get_data):
+        return None
+    return task[1], task[2], (tuple(task[5:9]) + (task[4],)) if len(task) == 9 else None
+
+
+def compute_arrays(arrays: List[Union[np.ndarray, "da.core.Array"]], num_workers: int = None) -> List[np.ndarray]:
+    """Converts a list of arrays to numpy arrays. The unmodified records are read with one read_records
+    call per file, the other dask arrays are computed one by one.
+
+    :param arrays: list of numpy or dask arrays
+    :type arrays: List[Union[np.ndarray, da.core.Array]]
+    :param num_workers: if greater than 1, the unmodified records are decoded by this number of worker
+                        processes with parallel_read_records, defaults to None (decoded in this process)
+    :type num_workers: int, optional
+    :return: list of numpy arrays, in the same order
+    :rtype: List[np.ndarray]
+    """
+    results = [None] * len(arrays)
+    records = {}
+    for i, arr in enumerate(arrays):
+        record = get_lazy_record(arr)
+        if record is None:
+            results[i] = to_numpy(arr)
+        else:
+            records.setdefault(record[0], []).append((i, record[1], record[2]))
+
+    if (num_workers is not None) and (num_workers > 1):
+        keys = {path: [key for _, key, _ in records_info] for path, records_info in records.items()}
+        data = parallel_read_records(keys, num_workers)
+    else:
+        data = {
+            path: read_records(path, [key for _, key, _ in records_info], [layout for _, _, layout in records_info])
+            for path, records_info in records.items()
+        }
+
+    for path, records_info in records.items():
+        for (i, _, _), arr in zip(records_info, data[path]):
+            results[i] = arr
+    return results
+
+
+# columns of the record header written by fstecr
+HEADER_COLUMNS = [
+    "nomvar",
+    "typvar",
+    "etiket",
+    "ni",
+    "nj",
+    "nk",
+    "dateo",
+    "ip1",
+    "ip2",
+    "ip3",
+    "deet",
+    "npas",
+    "datyp",
+    "nbits",
+    "grtyp",
+    "ig1",
+    "ig2",
+    "ig3",
+    "ig4",
+]
+
+# data types packed without compression, their packed length only depends on the shape and nbits
+RAW_COPY_DATYPS = [1, 2, 4, 5]
+
+
+def get_unmodified_records(df: pd.DataFrame, exclude_path: str = None) -> List[Union[Tuple[str, int, int], None]]:
+    """Finds the rows of a dataframe that are records of a file that were not modified, their 'd' is still
+    the lazy array created by add_dask_column and their header columns are the same as in the file.
+    The packed data of these records can be copied as is, see std_xdf.copy_records_data.
+
+    :param df: dataframe to write
+    :type df: pd.DataFrame
+    :param exclude_path: records of this file are not considered, defaults to None
+    :type exclude_path: str, optional
+    :return: (path, swa, lng) of the source record of every row, None if the row is not an unmodified record
+    :rtype: List[Union[Tuple[str, int, int], None]]
+    """
+    sources = [None] * len(df.index)
+    records = {}
+    for i, arr in enumerate(df.d.to_list()):
+        record = get_lazy_record(arr)
+        if (record is None) or (record[2] is None) or (record[0] == exclude_path):
+            continue
+        datyp, _, swa, lng, _ = record[2]
+        if (datyp not in RAW_COPY_DATYPS) or (swa is None) or (lng is None):
+            continue
+        records.setdefault(record[0], []).append((i, record[1], swa, lng))
+
+    for path, records_info in records.items():
+        try:
+            source_df = get_basic_dataframe(path)
+        except Exception as e:
+            logging.info(f"get_unmodified_records - can't read the records of {path}: {e}")
+            continue
+        positions = [i for i, _, _, _ in records_info]
+        rows_df = df.iloc[positions][HEADER_COLUMNS].reset_index(drop=True)
+        # the file index part of the keys depends on the files that were open when they were obtained
+        rows_df["record_key"] = [OpenFilePool.rebase_key(key, 0) for _, key, _, _ in records_info]
+        source_df = source_df[HEADER_COLUMNS + ["swa", "lng"]].assign(
+            record_key=[OpenFilePool.rebase_key(key, 0) for key in source_df.key.tolist()]
+        )
+        merged_df = rows_df.merge(source_df, on="record_key", how="left", suffixes=("", "_source"))
+
+        unmodified = merged_df.swa.to_numpy() == np.array([swa for _, _, swa, _ in records_info])
+        unmodified &= merged_df.lng.to_numpy() == np.array([lng for _, _, _, lng in records_info])
+        for col in HEADER_COLUMNS:
+            unmodified &= merged_df[col].to_numpy() == merged_df[f"{col}_source"].to_numpy()
+
+        for (i, _, swa, lng), same in zip(records_info, unmodified):
+            if same:
+                sources[i] = (path, int(swa), int(lng))
+    return sources
+
+
+# records that are not part of the horizontal domain, they are never windowed
+WINDOW_EXCLUDED_NOMVARS = ["!!", "HY", "!!SF", "^>"]
+
+# grid types whose georeference is held by the >> and ^^ records or that have none, their descriptors stay valid
+# when >> and ^^ are windowed with the fields. The ig1-4 of the other grid types describe the whole grid,
+# their records are never windowed
+WINDOW_GRID_TYPES = ["X", "Y", "Z"]
+
+
+def get_window_slices(
+    nomvar: str, grtyp: str, ni: int, nj: int, window: Tuple[int, int, int, int]
+) -> Union[tuple, None]:
+    """Gets the slices of a record to read for a window. The >> axis of a Z grid is sliced along i, the ^^ axis
+    along j and the fields along i and j. Records that are smaller than the window or that are not on a X, Y or
+    Z grid are not sliced.
+
+    :param nomvar: nomvar of the record
+    :type nomvar: str
+    :param grtyp: grid type of the record, for >> and ^^ the grid type of the fields that use them
+    :type grtyp: str
+    :param ni: ni of the record
+    :type ni: int
+    :param nj: nj of the record
+    :type nj: int
+    :param window: (i0, i1, j0, j1), 0 based and the end is excluded like python slices
+    :type window: Tuple[int, int, int, int]
+    :return: tuple of the i and j slices or None if the whole record is read
+    :rtype: Union[tuple, None]
+    """
+    i0, i1, j0, j1 = window
+    if (nomvar in WINDOW_EXCLUDED_NOMVARS) or (grtyp not in WINDOW_GRID_TYPES):
+        return None
+    if (nomvar == ">>") and (nj == 1):
+        return (slice(i0, i1), slice(None)) if ni >= i1 else None
+    if (nomvar == "^^") and (ni == 1):
+        return (slice(None), slice(j0, j1)) if nj >= j1 else None
+    if (ni >= i1) and (nj >= j1):
+        return (slice(i0, i1), slice(j0, j1))
+    return None
+
+
+def get_positional_grid_types(df: pd.DataFrame) -> dict:
+    """Gets the grid type of the fields that use each >> and ^^ record. The grid is None when the fields that
+    use the record don't all have the same grid type.
+
+    :param df: dataframe with nomvar, grtyp, ip1, ip2, ig1 and ig2 columns
+    :type df: pd.DataFrame
+    :return: (ip1, ip2) of the >> and ^^ records -> grid type of the fields
+    :rtype: dict
+    """
+    fields_df = df.loc[~df.nomvar.isin([">>", "^^"] + WINDOW_EXCLUDED_NOMVARS)]
+    grid_types = {}
+    for grid, grtyp in zip(zip(fields_df.ig1, fields_df.ig2), fields_df.grtyp):
+        grid_types[grid] = grtyp if grid_types.get(grid, grtyp) == grtyp else None
+    return grid_types
+
+
+_WINDOW_CACHE = DataCache(FSTPY_WINDOW_CACHE_MAX_BYTES)
+
+
+def get_data_window(path, key, dtype, shape, datyp, nbits, swa, lng, slices):
+    """Reads a window of a record. When FSTPY_MMAP_READS is set, uncompressed IEEE records are memory mapped so
+    only the pages of the window are read, the other records are decoded once and kept in a cache so that other windows of the same
+    record don't decode it again."""
+    full_shape = tuple(shape)
     with _LOCK:
-        # Check if file needs to be opened.
-        # if path not in cache:
-        # Allow for a small number of files to remain open for speedier access.
-        # if len(cache) > 10:
-        # for _, unit in cache.items():
-        # RmnInterface.close_file(unit)
-        # cache.clear()
-        iun = RmnInterface.open_file(path)
-        # iun = cache[path]
-        data = RmnInterface.read_record(key)["d"]
-        RmnInterface.close_file(iun)
-        return data
-
-
-def add_dask_column(df: pd.DataFrame) -> pd.DataFrame:
+        arr = None
+        if FSTPY_MMAP_READS and (datyp == 5) and (swa is not None):
+            arr = map_ieee_record(_FILE_MAPS.get(path), swa, lng, full_shape, nbits)
+        if arr is not None:
+            window = arr[slices]
+            return window.astype(window.dtype.newbyteorder("="), order="F")
+
+        cache_key = get_record_cache_key(path, key)
+        arr = _WINDOW_CACHE.get(cache_key)
+        if arr is None:
+            arr = read_records(path, [key])[0]
+            _WINDOW_CACHE.put(cache_key, arr)
+        return np.asfortranarray(arr[slices])
+
+
+def add_dask_column(df: pd.DataFrame, window: Tuple[int, int, int, int] = None) -> pd.DataFrame:
     """Adds the 'd' column as dask arrays to a basic dataframe of meta data only, path and key columns have to be present in the DataFrame
 
     :param df: input dataframe
     :type df: pd.DataFrame
+    :param window: (i0, i1, j0, j1) sub-domain of the fields of X, Y and Z grids to read, ni, nj and shape of
+                   the windowed records are changed, see get_window_slices, defaults to None
+    :type window: Tuple[int, int, int, int], optional
     :return: modified Dataframe with added 'd' column
     :rtype: pd.DataFrame
     """
     if df.empty:
         return df
     arrays = []
+    windowed = []
+    grid_types = {} if window is None else get_positional_grid_types(df)
     for row in df.itertuples():
         path = row.path
         key = row.key
@@ -191,13 +994,30 @@ def add_dask_column(df: pd.DataFrame) -> pd.DataFrame:
         name = "".join([path, ":", str(key)])
         shape = row.shape
         dtype = RmnInterface.get_numpy_dtype(datyp, nbits, row.ni, row.nk)
-        dsk = {(name, 0, 0): (get_data, path, key, dtype, shape)}
+        # swa and lng locate uncompressed IEEE records in the file, see map_records
+        swa = getattr(row, "swa", None)
+        lng = getattr(row, "lng", None)
+        slices = None
+        if window is not None:
+            grtyp = grid_types.get((row.ip1, row.ip2)) if row.nomvar in [">>", "^^"] else row.grtyp
+            slices = get_window_slices(row.nomvar, grtyp, row.ni, row.nj, window)
+        if slices is None:
+            dsk = {(name, 0, 0): (get_data, path, key, dtype, shape, datyp, nbits, swa, lng)}
+        else:
+            shape = tuple(len(range(*s.indices(n))) for s, n in zip(slices, shape[:2])) + tuple(shape[2:])
+            windowed.append((row.Index, shape))
+            name = "".join([name, ":window:", ":".join([str(w) for w in window])])
+            dsk = {(name, 0, 0): (get_data_window, path, key, dtype, row.shape, datyp, nbits, swa, lng, slices)}
         chunks = [(s,) for s in shape]
         arrays.append(da.Array(dsk, name, chunks, dtype))
     d = np.zeros(len(arrays), dtype=object)
     for i in range(len(d)):
         d[i] = arrays[i]
     df["d"] = d
+    for index, shape in windowed:
+        df.at[index, "ni"] = shape[0]
+        df.at[index, "nj"] = shape[1]
+        df.at[index, "shape"] = shape
     return df
 
 
@@ -205,14 +1025,72 @@ class GetBasicDataFrameError(Exception):
     pass
 
 
-def get_basic_dataframe(path: str) -> pd.DataFrame:
+BASIC_COLUMNS = [
+    "nomvar",
+    "typvar",
+    "etiket",
+    "ni",
+    "nj",
+    "nk",
+    "dateo",
+    "ip1",
+    "ip2",
+    "ip3",
+    "deet",
+    "npas",
+    "datyp",
+    "nbits",
+    "grtyp",
+    "ig1",
+    "ig2",
+    "ig3",
+    "ig4",
+    "datev",
+    "lng",
+    "swa",
+    "key",
+    "path",
+    "shape",
+]
+
+
+def get_records_metadata(path: str, criteria: Dict[str, list] = None) -> pd.DataFrame:
+    """Gets the metadata of every record in a file, one fstprm call per record
+
+    :param path: path to file
+    :type path: str
+    :param criteria: only get the records selected by these criteria, see get_query_criteria, defaults to None
+    :type criteria: Dict[str, list], optional
+    :return: dataframe of the fstprm records
+    :rtype: pd.DataFrame
+    """
     file_id = RmnInterface.open_file(path)
-    keys = RmnInterface.find_records(file_id)
+    if criteria is None:
+        keys = RmnInterface.find_records(file_id)
+    else:
+        keys = find_query_records(file_id, criteria)
     records = [RmnInterface.get_record_metadata(key) for key in keys]
-    df = pd.DataFrame(records)
+    RmnInterface.close_file(file_id)
+    return pd.DataFrame(records)
+
+
+def get_basic_dataframe(path: str, criteria: Dict[str, list] = None) -> pd.DataFrame:
+    # the file is opened to get the keys, don't keep a second handle open on it
+    release_file(path)
+    df = None
+    if FSTPY_XDF_HEADERS:
+        try:
+            df = get_xdf_records(path)
+            if criteria is not None:
+                df = select_query_records(df, criteria)
+        except XdfError as e:
+            logging.info(f"get_basic_dataframe - can't decode XDF directory of {path}, using fstprm: {e}")
+    if df is None:
+        df = get_records_metadata(path, criteria)
+    if df.empty:
+        df = pd.DataFrame(columns=BASIC_COLUMNS + ["dltf", "ubc"])
     df["d"] = None
     df["path"] = path
-    RmnInterface.close_file(file_id)
 
     df = df.loc[df.dltf == 0]
     df = df.drop(labels=["dltf", "ubc"], axis=1)
@@ -223,35 +1101,7 @@ def get_basic_dataframe(path: str) -> pd.DataFrame:
     df["typvar"] = df["typvar"].str.strip()
     df["grtyp"] = df["grtyp"].str.strip()
 
-    df = df[
-        [
-            "nomvar",
-            "typvar",
-            "etiket",
-            "ni",
-            "nj",
-            "nk",
-            "dateo",
-            "ip1",
-            "ip2",
-            "ip3",
-            "deet",
-            "npas",
-            "datyp",
-            "nbits",
-            "grtyp",
-            "ig1",
-            "ig2",
-            "ig3",
-            "ig4",
-            "datev",
-            "lng",
-            "swa",
-            "key",
-            "path",
-            "shape",
-        ]
-    ]
+    df = df[BASIC_COLUMNS]
 
     # Convert int64 columns to int32
     int_columns = [
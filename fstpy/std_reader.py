@@ -2,7 +2,7 @@
 import copy
 import os
 from pathlib import Path
-from typing import Union, List
+from typing import Iterator, List, Union
 
 from . import FSTPY_PROGRESS
 
@@ -11,9 +11,11 @@ try:
 except ModuleNotFoundError as e:
     FSTPY_PROGRESS = False
 
+import numpy as np
 import pandas as pd
 
-from .utils import initializer, to_numpy
+from .std_cache import MetadataCache, get_default_metadata_cache
+from .utils import get_row_blocks, initializer
 
 
 class StandardFileReaderError(Exception):
@@ -54,13 +56,56 @@ class StandardFileReader:
     :type decode_metadata: bool, optional
     :param query: parameter to pass to dataframe.query method, to select specific records
     :type query: str, optional
+    :param num_workers: number of worker processes used to scan the headers of a list of files,
+                        defaults to None (files are scanned one after the other). The workers are spawned and
+                        import the main module again, a script must read the files under an
+                        if __name__ == "__main__": block
+    :type num_workers: int, optional
+    :param metadata_cache: cache of the records metadata, or the directory of the cache. When the files have not changed
+                           since they were cached, their headers are not scanned again. Defaults to None (uses the
+                           FSTPY_METADATA_CACHE_DIR and FSTPY_METADATA_CACHE_MAX_BYTES environment variables if set)
+    :type metadata_cache: Union[MetadataCache, str, pathlib.Path], optional
+    :param window: (i0, i1, j0, j1) sub-domain of the fields to read, 0 based with the end excluded like python
+                   slices. The fields of X, Y and Z grids and their >> (along i) and ^^ (along j) records are
+                   read lazily for that window only and their ni and nj are changed. The fields of the other grid
+                   types, whose ig1-4 describe the whole grid, !!, HY, !!SF, ^> and records smaller than the window
+                   are read whole, defaults to None
+    :type window: Tuple[int, int, int, int], optional
+    :param compact: store the repeated string columns (nomvar, typvar, etiket, grtyp, grid and the decoded string
+                    columns) as categoricals to reduce memory and speed up groupby and isin, see
+                    dataframe.to_compact_dtypes, defaults to False
+    :type compact: bool, optional
     """
 
     meta_data = ["^>", ">>", "^^", "!!", "!!SF", "HY", "P0", "PT", "E1"]
 
     @initializer
-    def __init__(self, filenames, decode_metadata=False, query=None):
+    def __init__(
+        self,
+        filenames,
+        decode_metadata=False,
+        query=None,
+        num_workers=None,
+        metadata_cache=None,
+        window=None,
+        compact=False,
+    ):
         """init instance"""
+        if self.window is not None:
+            if len(self.window) != 4:
+                raise StandardFileReaderError("window must be a tuple of (i0, i1, j0, j1)\n")
+            i0, i1, j0, j1 = self.window
+            if (i0 < 0) or (j0 < 0) or (i1 <= i0) or (j1 <= j0):
+                raise StandardFileReaderError("window must satisfy 0 <= i0 < i1 and 0 <= j0 < j1\n")
+            self.window = tuple(int(w) for w in self.window)
+
+        if self.metadata_cache is None:
+            self.metadata_cache = get_default_metadata_cache()
+        elif isinstance(self.metadata_cache, (str, Path)):
+            self.metadata_cache = MetadataCache(self.metadata_cache)
+        elif not isinstance(self.metadata_cache, MetadataCache):
+            raise StandardFileReaderError("metadata_cache must be a MetadataCache, str or Path\n")
+
         if isinstance(self.filenames, Path):
             self.filenames = str(self.filenames.absolute())
         elif isinstance(self.filenames, str):
@@ -71,8 +116,8 @@ class StandardFileReader:
             raise StandardFileReaderError("Filenames must be str or list\n")
 
     def to_pandas(self) -> pd.DataFrame:
-        from .dataframe import add_columns, drop_duplicates
-        from .std_io import get_dataframe_from_file
+        from .dataframe import add_columns, concat_compact, drop_duplicates, to_compact_dtypes
+        from .std_io import get_dataframe_from_file, parallel_get_dataframe_from_file
 
         """creates the dataframe from the provided file metadata
 
@@ -81,76 +126,176 @@ class StandardFileReader:
         """
 
         if isinstance(self.filenames, list):
-            # if len(self.filenames) < 100:
-            df_list = []
-            for f in tqdm(self.filenames, desc="Reading files") if FSTPY_PROGRESS else self.filenames:
-                df = get_dataframe_from_file(f, self.query)
-                df_list.append(df)
-            df = pd.safe_concat(df_list)
-            # else:
-            #     # convert to list of tuple (path,query)
-            #     self.filenames = list(zip(self.filenames, itertools.repeat(self.query)))
-
-            #     df = parallel_get_dataframe_from_file(
-            #         self.filenames,  get_dataframe_from_file, n_cores=min(mp.cpu_count(), len(self.filenames)))
+            # the decoding functions expect object columns, frames are only made compact when not decoding
+            compact = self.compact and not self.decode_metadata
+            if (self.num_workers is not None) and (self.num_workers > 1) and (len(self.filenames) > 1):
+                df_list = parallel_get_dataframe_from_file(
+                    self.filenames, self.query, self.num_workers, self.metadata_cache, self.window
+                )
+                if compact:
+                    df_list = [to_compact_dtypes(df) for df in df_list]
+            else:
+                df_list = []
+                for f in tqdm(self.filenames, desc="Reading files") if FSTPY_PROGRESS else self.filenames:
+                    df = get_dataframe_from_file(f, self.query, self.metadata_cache, self.window)
+                    if compact:
+                        df = to_compact_dtypes(df)
+                    df_list.append(df)
+            if compact:
+                df = concat_compact(df_list)
+            else:
+                df = pd.safe_concat(df_list)
 
         else:
-            df = get_dataframe_from_file(self.filenames, self.query)
+            df = get_dataframe_from_file(self.filenames, self.query, self.metadata_cache, self.window)
 
         if self.decode_metadata:
-            df = add_columns(df)
+            df = add_columns(df, inplace=True)
 
         df = drop_duplicates(df)
 
+        if self.compact:
+            df = to_compact_dtypes(df)
+
         return df
 
+    async def to_pandas_async(self) -> pd.DataFrame:
+        """Same as to_pandas, for asyncio applications. The files are read in the executor of the async api
+        (see std_io.get_async_executor), so the event loop is not blocked.
+
+        >>> df = await StandardFileReader(path, query='nomvar=="TT"').to_pandas_async()
+
+        :return: df
+        :rtype: pd.Dataframe
+        """
+        from .std_io import run_async
+
+        return await run_async(self.to_pandas)
+
+    def iter_pandas(self, chunk: Union[str, int] = "file") -> Iterator[pd.DataFrame]:
+        """Creates the dataframe chunk by chunk, to process many files without holding all their records in memory.
+        Each chunk goes through the same processing as to_pandas.
+
+        >>> for df in StandardFileReader(files, query='nomvar=="TT"').iter_pandas(chunk=1000):
+        ...     StandardFileWriter(output_file, df, mode="append", overwrite=True).to_fst()
+
+        :param chunk: 'file' to get one dataframe per file or a number of records. A chunk never spans
+                      more than one file, and the metadata records (^^, >>, !!, HY, P0, ...) of the grids
+                      of a chunk are added to it, so they can be part of more than one chunk, defaults to 'file'
+        :type chunk: Union[str, int], optional
+        :raises StandardFileReaderError: if chunk is not 'file' or a positive number
+        :return: dataframes
+        :rtype: Iterator[pd.DataFrame]
+        """
+        from .dataframe import add_columns, drop_duplicates, to_compact_dtypes
+        from .std_io import get_dataframe_from_file
+
+        if not ((chunk == "file") or (isinstance(chunk, int) and chunk > 0)):
+            raise StandardFileReaderError("chunk must be 'file' or a positive number of records\n")
+
+        filenames = self.filenames if isinstance(self.filenames, list) else [self.filenames]
+        for f in tqdm(filenames, desc="Reading files") if FSTPY_PROGRESS else filenames:
+            file_df = get_dataframe_from_file(f, self.query, self.metadata_cache, self.window)
+            if file_df.empty:
+                continue
+
+            if chunk == "file":
+                df_list = [file_df]
+            else:
+                df_list = split_records(file_df, chunk, self.meta_data)
+
+            for df in df_list:
+                if self.decode_metadata:
+                    df = add_columns(df)
+
+                df = drop_duplicates(df)
+
+                if self.compact:
+                    df = to_compact_dtypes(df)
+
+                yield df
+
+
+def split_records(df: pd.DataFrame, num_records: int, meta_data: List[str]) -> List[pd.DataFrame]:
+    """Splits the records of a dataframe in chunks, the metadata records of the grids of each chunk are added to the chunk
 
-def compute(df: pd.DataFrame, remove_path_and_key: bool = True) -> pd.DataFrame:
+    :param df: dataframe of records, with the grid column
+    :type df: pd.DataFrame
+    :param num_records: maximum number of records, other than metadata records, of a chunk
+    :type num_records: int
+    :param meta_data: nomvars of the metadata records
+    :type meta_data: List[str]
+    :return: list of dataframes
+    :rtype: List[pd.DataFrame]
+    """
+    is_meta = df.nomvar.isin(meta_data)
+    meta_df = df.loc[is_meta]
+    data_df = df.loc[~is_meta]
+    if data_df.empty:
+        return [df]
+
+    df_list = []
+    for start in range(0, len(data_df.index), num_records):
+        chunk_df = data_df.iloc[start : start + num_records]
+        chunk_meta_df = meta_df.loc[meta_df.grid.isin(chunk_df.grid.unique())]
+        if not chunk_meta_df.empty:
+            chunk_df = pd.safe_concat([chunk_df, chunk_meta_df])
+        df_list.append(chunk_df)
+    return df_list
+
+
+def compute(df: pd.DataFrame, remove_path_and_key: bool = True, num_workers: int = None) -> pd.DataFrame:
     """Converts all dask arrays contained in the 'd' column, by numpy arrays
 
     :param df: input DataFrame
     :type df: pd.DataFrame
     :param remove_path_and_key: remove path and key column after conversion, defaults to True
     :type remove_path_and_key: bool, optional
+    :param num_workers: number of worker processes used to decode the records, each with its own librmn,
+                        defaults to None (records are decoded in this process). The workers are spawned and
+                        import the main module again, a script must call compute under an
+                        if __name__ == "__main__": block
+    :type num_workers: int, optional
     :return: modified dataframe with numpy arrays instead of dask arrays
     :rtype: pd.DataFrame
     """
-    import dask as da
-
     from .dataframe import add_path_and_key_columns
+    from .std_io import compute_arrays
 
     new_df = copy.deepcopy(df).reset_index(drop=True)
 
     new_df = add_path_and_key_columns(new_df)
 
-    no_path_df = new_df.loc[new_df.path.isna()]
-
-    groups = new_df.groupby("path")
-
-    df_list = []
+    # records of the same file are read together, in the order they are stored, by blocks that fit in
+    # FSTPY_BLOCK_MAX_BYTES so that the temporary buffers of the worker processes are bounded
+    arrays = new_df.d.to_list()
+    d = np.empty(len(arrays), dtype=object)
+    for start, end in get_row_blocks(new_df):
+        for i, arr in enumerate(compute_arrays(arrays[start:end], num_workers), start):
+            d[i] = arr
+    new_df["d"] = d
 
-    if not no_path_df.empty:
-        for row in no_path_df.itertuples():
-            no_path_df.at[row.Index, "d"] = to_numpy(row.d)
-        # d = da.compute(*list(no_path_df['d'].values))
-        # for i,row in enumerate(no_path_df.itertuples()):
-        #      no_path_df.at[row.Index, 'd'] = d[i]
-        df_list.append(no_path_df)
+    if remove_path_and_key:
+        new_df = new_df.drop(["path", "key"], axis=1, errors="ignore")
 
-    for _, current_df in groups:
-        current_df = current_df.sort_values("key")
+    return new_df
 
-        for row in current_df.itertuples():
-            current_df.at[row.Index, "d"] = to_numpy(row.d)
-        # d = da.compute(*list(current_df['d'].values))
-        # for i,row in enumerate(current_df.itertuples()):
-        #      current_df.at[row.Index, 'd'] = d[i]
 
-        df_list.append(current_df)
+async def compute_async(df: pd.DataFrame, remove_path_and_key: bool = True, num_workers: int = None) -> pd.DataFrame:
+    """Same as compute, for asyncio applications. The records are decoded in the executor of the async api
+    (see std_io.get_async_executor), so the event loop is not blocked.
 
-    new_df = pd.safe_concat(df_list, ignore_index=False).sort_index()
+    >>> df = await compute_async(df)
 
-    if remove_path_and_key:
-        new_df = new_df.drop(["path", "key"], axis=1, errors="ignore")
+    :param df: input DataFrame
+    :type df: pd.DataFrame
+    :param remove_path_and_key: remove path and key column after conversion, defaults to True
+    :type remove_path_and_key: bool, optional
+    :param num_workers: number of worker processes used to decode the records, see compute, defaults to None
+    :type num_workers: int, optional
+    :return: modified dataframe with numpy arrays instead of dask arrays
+    :rtype: pd.DataFrame
+    """
+    from .std_io import run_async
 
-    return new_df
+    return await run_async(compute, df, remove_path_and_key, num_workers)
@@ -673,11 +673,13 @@ def get_vertical_coordinate_type(
     return result
 
 
-def set_vertical_coordinate_type(df: pd.DataFrame) -> pd.DataFrame:
+def set_vertical_coordinate_type(df: pd.DataFrame, inplace: bool = False) -> pd.DataFrame:
     """Function that tries to determine the vertical coordinate of the fields
 
     :param df: input dataframe
     :type df: pd.DataFrame
+    :param inplace: add the ip info columns to df instead of a copy of it, defaults to False
+    :type inplace: bool, optional
     :return: output dataframe
     :rtype: pd.DataFrame
     """
@@ -686,7 +688,7 @@ def set_vertical_coordinate_type(df: pd.DataFrame) -> pd.DataFrame:
     from . import VCTYPES
 
     if "vctype" not in df.columns:
-        df = add_ip_info_columns(df)
+        df = add_ip_info_columns(df, inplace=inplace)
 
         meta_df = df.loc[df.nomvar.isin(["^^", ">>", "^>", "!!", "!!SF", "HY", "P0", "PT"])].reset_index(drop=True)
 
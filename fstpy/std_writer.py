@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
-import copy
 import logging
 import math
+import multiprocessing as mp
 import os
+import queue
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from fstpy import FSTPY_PROGRESS
-from typing import Union
+from typing import Callable, List, Tuple, Union
+
+from fstpy import _LOCK, FSTPY_PROGRESS, FSTPY_WRITE_QUEUE_DEPTH
 
 try:
     from tqdm import tqdm
@@ -15,15 +22,28 @@ except ModuleNotFoundError as e:
 import numpy as np
 import pandas as pd
 
-from fstpy.dataframe import add_path_and_key_columns
-from fstpy.std_reader import compute
+from fstpy.dataframe import add_grid_column, add_path_and_key_columns, from_compact_dtypes
 
 from .dataframe_utils import metadata_cleanup
-
-from .utils import get_num_rows_for_reading, initializer, to_numpy
 from .rmn_interface import RmnInterface
-
-from typing import Union
+from .std_io import (
+    HEADER_COLUMNS,
+    RAW_COPY_DATYPS,
+    OpenFilePool,
+    compute_arrays,
+    get_broken_process_pool_error,
+    get_process_executor,
+    get_unmodified_records,
+    release_file,
+)
+from .std_xdf import (
+    XdfError,
+    copy_records_data,
+    decode_directory_entries,
+    get_xdf_records,
+    read_directory_entries,
+)
+from .utils import get_row_blocks, initializer, safe_concatenate
 
 
 class StandardFileWriterError(Exception):
@@ -51,6 +71,18 @@ class StandardFileWriter:
     :type overwrite: bool, optional
     :param rewrite: overrides default rewrite value for fstecr, default None
     :type rewrite: bool, optional
+    :param num_workers: if greater than 1, the records are read, decoded and packed by this number of worker
+                        processes. The records whose packed length only depends on their shape and nbits (datyp
+                        1, 2, 4 and 5) are packed with fstecr in temporary files and a single writer copies their
+                        packed data in the order of the dataframe, the compressed records are packed by the single
+                        writer. The file is identical to the one written without workers. The workers are
+                        spawned and import the main module again, a script must call to_fst under an
+                        if __name__ == "__main__": block. Defaults to None (everything is done in this process,
+                        the librmn reads and writes don't overlap)
+    :type num_workers: int, optional
+    :param copy_unmodified: records read from a file that were not modified, data and header, are copied as is
+                            from their file instead of being decoded and encoded again, defaults to True
+    :type copy_unmodified: bool, optional
     """
 
     modes = ["write", "update", "dump", "append", "appendoverwrite"]
@@ -65,6 +97,8 @@ class StandardFileWriter:
         overwrite=False,
         rewrite=None,
         meta_only=False,
+        num_workers=None,
+        copy_unmodified=True,
     ):
         self.validate_input()
 
@@ -87,6 +121,9 @@ class StandardFileWriter:
         """In write mode, gets the metadata fields if not already present and adds them to the dataframe.
         If not in update only mode, loads the actual data, opens the file writes the dataframe and closes.
         """
+        # categoricals of the compact mode would refuse the values set while preparing the records
+        self.df = from_compact_dtypes(self.df)
+
         # remove meta
         if self.no_meta:
             self.df = self.df.loc[~self.df.nomvar.isin(["^>", ">>", "^^", "!!", "!!SF", "HY", "P0", "PT", "E1"])]
@@ -105,14 +142,17 @@ class StandardFileWriter:
             self._write()
 
     def _dump(self):
-        if not (self.rewrite is None):
+        if self.rewrite is not None:
             rewrite = self.rewrite
         else:
             rewrite = True
+        headers = RecordHeaders(self.df)
+        release_file(self.filename)
         file_id = RmnInterface.open_file(self.filename, RmnInterface.FST_RW)
-        for row in self.df.itertuples():
+        arrays = compute_arrays(self.df.d.to_list(), self.num_workers)
+        for i, data in enumerate(arrays):
             RmnInterface.write_record(
-                file_id, np.asfortranarray(to_numpy(row.d)), self.df.loc[row.Index].to_dict(), rewrite=rewrite
+                file_id, np.asfortranarray(native_byte_order(data)), headers.get(i), rewrite=rewrite
             )
         RmnInterface.close_file(file_id)
 
@@ -121,9 +161,9 @@ class StandardFileWriter:
         if not self.file_exists:
             raise StandardFileWriterError("StandardFileWriter - file does not exist, cant update records")
 
-        new_df = copy.deepcopy(self.df)
-
-        new_df = add_path_and_key_columns(new_df)
+        # only the columns that are needed are copied by add_path_and_key_columns
+        columns = [col for col in UPDATE_COLUMNS + ["d", "path", "key"] if col in self.df.columns]
+        new_df = add_path_and_key_columns(self.df[columns])
 
         path = new_df.path.unique()
 
@@ -135,33 +175,20 @@ class StandardFileWriter:
                 "StandardFileWriter - path in dataframe is different from destination file path, cant update records"
             )
 
+        headers = RecordHeaders(new_df, UPDATE_COLUMNS)
+        keys = new_df.key.to_numpy().astype("int64")
+
+        release_file(self.filename)
         file_id = RmnInterface.open_file(self.filename, RmnInterface.FST_RW)
-        for row in new_df.itertuples():
-            RmnInterface.update_record_metadata(
-                file_id,
-                int(row.key),
-                {
-                    "dateo": int(row.dateo),
-                    "deet": int(row.deet),
-                    "npas": int(row.npas),
-                    "ni": int(row.ni),
-                    "nj": int(row.nj),
-                    "nk": int(row.nk),
-                    "datyp": int(row.datyp),
-                    "ip1": int(row.ip1),
-                    "ip2": int(row.ip2),
-                    "ip3": int(row.ip3),
-                    "typvar": row.typvar,
-                    "nomvar": row.nomvar,
-                    "etiket": row.etiket,
-                    "grtyp": row.grtyp,
-                    "ig1": int(row.ig1),
-                    "ig2": int(row.ig2),
-                    "ig3": int(row.ig3),
-                    "ig4": int(row.ig4),
-                },
-            )
-        RmnInterface.close_file(file_id)
+        try:
+            # the keys were obtained from a previous opening of the file
+            first_key = RmnInterface.find_first_record(file_id)
+            file_index = 0 if first_key is None else first_key & 0x3FF
+            keys = ((keys & ~0x3FF) | file_index).tolist()
+            for i, key in enumerate(keys):
+                RmnInterface.update_record_metadata(key, **headers.get(i))
+        finally:
+            RmnInterface.close_file(file_id)
 
     def _write(self):
         from fstpy.dataframe import add_path_and_key_columns
@@ -185,24 +212,466 @@ class StandardFileWriter:
         else:
             rewrite = self.rewrite
 
-        num_rows = get_num_rows_for_reading(self.df)
+        df = self.df.reset_index(drop=True)
+
+        # records read from the output file are materialized before it is opened in write mode,
+        # memory mapped views are copied since the map of the file is dropped before it is modified
+        if "path" in df.columns:
+            own_records = np.flatnonzero(df.path.to_numpy() == self.filename)
+            if len(own_records):
+                d = df.d.to_numpy(copy=True)
+                for i, arr in zip(own_records, compute_arrays(d[own_records].tolist(), self.num_workers)):
+                    d[i] = arr if arr.flags.owndata else np.array(arr, order="F")
+                df["d"] = d
+
+        # unmodified records are written as placeholders, their packed data is copied from their file afterwards,
+        # the records packed by the workers are copied from their temporary files the same way.
+        # The copy finds the placeholders by their order after the end of the file, fstecr must append every
+        # record in the order of the dataframe without erasing any: no duplicate headers and no rewrite, unless
+        # the file is new since rewrite then never finds a record to replace
+        sources = [None] * len(df.index)
+        directory = None
+        if (
+            ((not rewrite) or (not os.path.exists(self.filename)))
+            and is_xdf_or_new_file(self.filename)
+            and (not has_duplicate_headers(df))
+        ):
+            if self.copy_unmodified:
+                sources = get_unmodified_records(df, self.filename)
+            if (self.num_workers is not None) and (self.num_workers > 1):
+                directory = tempfile.mkdtemp(prefix="fstpy_")
+        try:
+            if directory is not None:
+                try:
+                    encoded = self._encode_records(df, sources, directory)
+                except (XdfError, StandardFileWriterError) as e:
+                    # the temporary files are not XDF files, the records are packed by the writer
+                    logging.warning(f"StandardFileWriter - can't pack the records in worker processes: {e}")
+                    encoded = [None] * len(df.index)
+                sources = [encoded[i] if source is None else source for i, source in enumerate(sources)]
+            self._write_with_placeholders(df, rewrite, sources)
+        finally:
+            if directory is not None:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def _write_with_placeholders(self, df: pd.DataFrame, rewrite: bool, sources: list):
+        """Writes the records, the rows with a source are written as placeholders and their packed data is copied
+        afterwards. The placeholders are never left in the file."""
+        use_placeholders = any([source is not None for source in sources])
+        offset = os.path.getsize(self.filename) if os.path.exists(self.filename) else 0
 
-        df_list = np.array_split(self.df, math.ceil(len(self.df.index) / num_rows))  # of records per block
+        try:
+            self._write_records(df, rewrite, sources)
+        except BaseException:
+            if use_placeholders:
+                self._delete_records_after(offset)
+            raise
+
+        if not use_placeholders:
+            return
+        try:
+            self._copy_unmodified_records(df, rewrite, offset, sources)
+        except Exception as e:
+            # every record is decoded and written again
+            logging.warning(f"StandardFileWriter - {e}, the records are decoded and written again")
+            try:
+                self._delete_records_after(offset)
+                self._write_records(df, rewrite, [None] * len(df.index))
+            except Exception as rewrite_error:
+                raise StandardFileWriterError(
+                    f"StandardFileWriter - can't write the records again: {rewrite_error}"
+                ) from rewrite_error
 
-        for df in df_list:
-            df = compute(df, False)
+    def _encode_records(self, df: pd.DataFrame, sources: list, directory: str) -> list:
+        """Packs the records without a source whose packed length only depends on their shape and nbits in worker
+        processes, each task writes its records in a temporary file of directory, see encode_records
 
-            file_id = RmnInterface.open_file(self.filename, RmnInterface.FST_RW)
+        :return: (path, swa, lng) of the packed record of every row, None if the row was not packed
+        :rtype: list
+        """
+        encoded = [None] * len(df.index)
+        positions = [
+            i
+            for i, (source, datyp) in enumerate(zip(sources, df.datyp.tolist()))
+            if (source is None) and (datyp in RAW_COPY_DATYPS)
+        ]
+        if len(positions) == 0:
+            return encoded
+
+        columns = [col for col in HEADER_COLUMNS if col in df.columns] + ["d"]
+        # a few tasks per worker to balance the load, the records of a task are consecutive in the file
+        chunk_size = max(1, math.ceil(len(positions) / (self.num_workers * 4)))
+        executor = get_process_executor(self.num_workers)
+        futures = []
+        for start in range(0, len(positions), chunk_size):
+            task_positions = positions[start : start + chunk_size]
+            task_df = df.iloc[task_positions][columns].reset_index(drop=True)
+            path = os.path.join(directory, f"{start}.std")
+            futures.append((task_positions, executor.submit(encode_records, task_df, path)))
+        try:
+            for task_positions, future in futures:
+                for i, source in zip(task_positions, future.result()):
+                    encoded[i] = source
+        except BrokenProcessPool as e:
+            raise get_broken_process_pool_error(self.num_workers, executor) from e
+        finally:
+            for _, future in futures:
+                future.cancel()
+        return encoded
+
+    def _write_records(self, df: pd.DataFrame, rewrite: bool, sources: list):
+        """Writes the records of the dataframe in its order, the rows with a source are written as placeholders"""
+        # the records are materialized by a thread by chunks of FSTPY_WRITE_QUEUE_DEPTH records, at most
+        # FSTPY_WRITE_QUEUE_DEPTH of them are waiting in the queue. The writer only overlaps with the decoding
+        # when it is done by worker processes, see produce_records
+        blocks = get_row_blocks(df)
+        records = queue.Queue(maxsize=FSTPY_WRITE_QUEUE_DEPTH)
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=produce_records, args=(df, blocks, self.num_workers, records, stop, sources), daemon=True
+        )
+        producer.start()
 
-            for row in tqdm(df.itertuples(), desc="Writing rows") if FSTPY_PROGRESS else df.itertuples():
+        file_id = None
+        try:
+            release_file(self.filename)
+            with _LOCK:
+                file_id = RmnInterface.open_file(self.filename, RmnInterface.FST_RW)
+            headers = RecordHeaders(df)
+            rows = enumerate(df.itertuples())
+            for i, row in tqdm(rows, desc="Writing rows", total=len(df.index)) if FSTPY_PROGRESS else rows:
+                data = records.get()
+                if isinstance(data, BaseException):
+                    raise data
                 record_path = row.path
                 if identical_destination_and_record_path(record_path, self.filename):
                     logging.warning(
                         "StandardFileWriter - record path and output file are identical, adding  new records"
                     )
-                write_dataframe_record_to_file(file_id, df, row, rewrite)
+                with _LOCK:
+                    write_dataframe_record_to_file(file_id, df, row, rewrite, data, headers.get(i))
+        finally:
+            stop.set()
+            if file_id is not None:
+                with _LOCK:
+                    RmnInterface.close_file(file_id)
+            producer.join()
+
+    def _copy_unmodified_records(self, df: pd.DataFrame, rewrite: bool, offset: int, sources: list):
+        """Replaces the placeholders written for the unmodified records and the records packed by the workers by
+        the packed data of their source record.
+        A placeholder that doesn't have the same length as its source is deleted and the record is decoded and
+        written again."""
+        release_file(self.filename)
+        try:
+            not_copied = copy_records_data(self.filename, offset, sources)
+        except XdfError as e:
+            raise StandardFileWriterError(f"StandardFileWriter - can't copy the unmodified records: {e}") from e
+        if len(not_copied) == 0:
+            return
+
+        logging.warning(
+            f"StandardFileWriter - {len(not_copied)} records don't have the same length as in their file, "
+            "they are decoded and written again"
+        )
+        with _LOCK:
+            records_df = get_xdf_records(self.filename)
+        keys = dict(zip(records_df.swa.tolist(), records_df.key.tolist()))
+        headers = RecordHeaders(df)
+        arrays = compute_arrays([df.d.iat[i] for i, _ in not_copied], self.num_workers)
+        release_file(self.filename)
+        with _LOCK:
+            file_id = RmnInterface.open_file(self.filename, RmnInterface.FST_RW)
+            try:
+                file_index = RmnInterface.find_first_record(file_id) & 0x3FF
+                for (i, swa), data in zip(not_copied, arrays):
+                    RmnInterface.delete_record(OpenFilePool.rebase_key(keys[swa], file_index))
+                    row = next(df.iloc[[i]].itertuples())
+                    write_dataframe_record_to_file(file_id, df, row, rewrite, data, headers.get(i))
+            finally:
+                RmnInterface.close_file(file_id)
+
+    def _delete_records_after(self, offset: int):
+        """Deletes the records written after offset, the size of the file before they were written"""
+        if (not os.path.exists(self.filename)) or (os.path.getsize(self.filename) <= offset):
+            return
+        release_file(self.filename)
+        with _LOCK:
+            records_df = decode_directory_entries(read_directory_entries(self.filename))
+            if not ((records_df.dltf == 0) & ((records_df.swa - 1) * 8 >= offset)).any():
+                return
+            records_df = get_xdf_records(self.filename)
+            keys = records_df.loc[(records_df.swa - 1) * 8 >= offset].key.tolist()
+            file_id = RmnInterface.open_file(self.filename, RmnInterface.FST_RW)
+            try:
+                file_index = RmnInterface.find_first_record(file_id) & 0x3FF
+                for key in keys:
+                    RmnInterface.delete_record(OpenFilePool.rebase_key(key, file_index))
+            finally:
+                RmnInterface.close_file(file_id)
+
+
+def encode_records(df: pd.DataFrame, path: str) -> List[Tuple[str, int, int]]:
+    """Packs records with fstecr in a new file, in a worker process of StandardFileWriter. The writer then copies
+    their packed data in the output file, see std_xdf.copy_records_data.
+
+    :param df: header columns and 'd' of the records
+    :type df: pd.DataFrame
+    :param path: path of the new file
+    :type path: str
+    :raises StandardFileWriterError: if the file doesn't have a record for every row
+    :return: (path, swa, lng) of the packed records, in the order of the dataframe
+    :rtype: List[Tuple[str, int, int]]
+    """
+    headers = RecordHeaders(df)
+    with _LOCK:
+        file_id = RmnInterface.open_file(path, RmnInterface.FST_RW)
+    try:
+        for start, end in get_row_blocks(df):
+            arrays = compute_arrays(df.d.iloc[start:end].to_list())
+            for i, row, data in zip(range(start, end), df.iloc[start:end].itertuples(), arrays):
+                with _LOCK:
+                    write_dataframe_record_to_file(file_id, df, row, False, data, headers.get(i))
+    finally:
+        with _LOCK:
             RmnInterface.close_file(file_id)
 
+    records_df = decode_directory_entries(read_directory_entries(path))
+    records_df = records_df.loc[records_df.dltf == 0].sort_values("swa")
+    if len(records_df.index) != len(df.index):
+        raise StandardFileWriterError(
+            f"StandardFileWriter - found {len(records_df.index)} records in {path}, expected {len(df.index)}"
+        )
+    return [(path, int(swa), int(lng)) for swa, lng in zip(records_df.swa.tolist(), records_df.lng.tolist())]
+
+
+def produce_records(
+    df: pd.DataFrame,
+    blocks: List[Tuple[int, int]],
+    num_workers: int,
+    records: queue.Queue,
+    stop: threading.Event,
+    sources: list = None,
+):
+    """Materializes the records of a dataframe and puts their arrays in a bounded queue, in the order of the
+    dataframe. The records are read by chunks of at most the size of the queue, so no more than twice that
+    number of decoded records wait for the writer. An exception raised while reading is put in the queue for
+    the writer.
+
+    The librmn calls of this process hold _LOCK, the reads of this thread and the fstecr calls of the writer
+    alternate. The writing only overlaps with the decoding done by worker processes (num_workers) and with
+    the computation of the modified arrays.
+
+    :param df: dataframe to write
+    :type df: pd.DataFrame
+    :param blocks: (start, end) positions of the records that fit in the memory budget of a read, see
+                   get_row_blocks, they are split in chunks of at most the size of the queue
+    :type blocks: List[Tuple[int, int]]
+    :param num_workers: number of worker processes used to decode the records, see compute_arrays
+    :type num_workers: int
+    :param records: queue read by the writer
+    :type records: queue.Queue
+    :param stop: set by the writer when it stops, before all the records are written if it failed
+    :type stop: threading.Event
+    :param sources: rows with a source record are not read, an array of zeros of the same shape and dtype is
+                    put instead as a placeholder, see get_unmodified_records, defaults to None
+    :type sources: list, optional
+    """
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                records.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    chunk_size = records.maxsize if records.maxsize > 0 else None
+    try:
+        arrays = df.d.to_list()
+        for start, end in blocks:
+            step = end - start if chunk_size is None else chunk_size
+            for chunk_start in range(start, end, step):
+                chunk = range(chunk_start, min(end, chunk_start + step))
+                if sources is not None:
+                    for i in chunk:
+                        if sources[i] is not None:
+                            arrays[i] = np.zeros(arrays[i].shape, dtype=arrays[i].dtype, order="F")
+                for arr in compute_arrays([arrays[i] for i in chunk], num_workers):
+                    if not put(arr):
+                        return
+    except BaseException as e:
+        put(e)
+
+
+# metadata records that don't depend on the forecast time, every shard gets them
+SHARED_METADATA_NOMVARS = [">>", "^^", "^>", "!!", "!!SF", "HY", "E1"]
+# metadata records that are fields, a shard gets those with the same partition key when there are some
+PARTITIONED_METADATA_NOMVARS = ["P0", "PT"]
+
+
+class ShardedStandardFileWriter:
+    """Writes the records of a dataframe to one file per partition, the files are written in parallel by
+    worker processes with a StandardFileWriter each. Every shard gets the metadata records (>>, ^^, !!, HY, ...)
+    and the P0/PT that have the same partition key as the shard, or all the P0/PT if none has it. The unneeded
+    metadata is then removed by metadata_cleanup, like for a single file.
+
+    >>> ShardedStandardFileWriter("/tmp/out_{key}.std", df, partition="ip2").to_fst()
+
+    :param filename: path of the files to write, a string with a {key} field, like 'out_{key}.std', or
+                     a function that gets the partition key and returns the path
+    :type filename: Union[str, Callable]
+    :param df: dataframe to write
+    :type df: pd.DataFrame
+    :param partition: column used to partition the records, like 'datev', 'ip2' or 'grid', or a function that
+                      gets the dataframe and returns the partition key of every row, defaults to 'datev'
+    :type partition: Union[str, Callable], optional
+    :param num_workers: number of worker processes, defaults to None (number of cpus). The workers are spawned
+                        and import the main module again, a script must call to_fst under an
+                        if __name__ == "__main__": block
+    :type num_workers: int, optional
+    :param mode: mode of the StandardFileWriter of each shard, 'write', 'append' or 'appendoverwrite',
+                 defaults to 'write'
+    :type mode: str, optional
+    :param no_meta: see StandardFileWriter, defaults to False
+    :type no_meta: bool, optional
+    :param overwrite: see StandardFileWriter, defaults to False
+    :type overwrite: bool, optional
+    :param rewrite: see StandardFileWriter, defaults to None
+    :type rewrite: bool, optional
+    :param meta_only: see StandardFileWriter, defaults to False
+    :type meta_only: bool, optional
+    """
+
+    modes = ["write", "append", "appendoverwrite"]
+
+    @initializer
+    def __init__(
+        self,
+        filename: Union[str, Callable],
+        df: pd.DataFrame,
+        partition: Union[str, Callable] = "datev",
+        num_workers=None,
+        mode="write",
+        no_meta=False,
+        overwrite=False,
+        rewrite=None,
+        meta_only=False,
+    ):
+        self.validate_input()
+
+    def validate_input(self):
+        if self.df.empty:
+            raise StandardFileWriterError("ShardedStandardFileWriter - no records to process")
+
+        if self.mode not in self.modes:
+            raise StandardFileWriterError(
+                f"ShardedStandardFileWriter - mode must have one of these values {self.modes}, you entered {self.mode}"
+            )
+
+        if isinstance(self.filename, Path):
+            self.filename = str(self.filename)
+        if isinstance(self.filename, str) and ("{key}" not in self.filename):
+            raise StandardFileWriterError("ShardedStandardFileWriter - filename must contain a {key} field")
+
+        if isinstance(self.partition, str) and (self.partition != "grid") and (self.partition not in self.df.columns):
+            raise StandardFileWriterError(f"ShardedStandardFileWriter - partition column {self.partition} not found")
+
+    def get_shards(self) -> dict:
+        """Partitions the records, the metadata records are added to every shard
+
+        :return: dataframe of each shard, by partition key
+        :rtype: dict
+        """
+        df = self.df.reset_index(drop=True)
+        if callable(self.partition):
+            keys = pd.Series(np.asarray(self.partition(df)), index=df.index)
+        else:
+            if (self.partition == "grid") and ("grid" not in df.columns):
+                df = add_grid_column(df)
+            keys = df[self.partition]
+
+        shared_mask = df.nomvar.isin(SHARED_METADATA_NOMVARS)
+        partitioned_meta_mask = df.nomvar.isin(PARTITIONED_METADATA_NOMVARS)
+        if self.meta_only:
+            data_mask = ~shared_mask
+            partitioned_meta_mask = np.zeros(len(df.index), dtype=bool)
+        else:
+            data_mask = ~(shared_mask | partitioned_meta_mask)
+        shared_df = df.loc[shared_mask]
+        partitioned_meta_df = df.loc[partitioned_meta_mask]
+        partitioned_meta_keys = keys.loc[partitioned_meta_mask]
+
+        missing_keys = keys.loc[data_mask].isna()
+        if missing_keys.any():
+            raise StandardFileWriterError(
+                f"ShardedStandardFileWriter - {int(missing_keys.sum())} records have no partition key, "
+                f"nomvars: {sorted(df.loc[data_mask].loc[missing_keys].nomvar.unique().tolist())}"
+            )
+
+        shards = {}
+        for key, shard_df in df.loc[data_mask].groupby(keys.loc[data_mask], sort=True, dropna=False):
+            meta_df = partitioned_meta_df.loc[partitioned_meta_keys == key]
+            if meta_df.empty:
+                meta_df = partitioned_meta_df
+            shards[key] = safe_concatenate([shard_df, shared_df, meta_df])
+        return shards
+
+    def get_shard_filename(self, key) -> str:
+        """Gets the path of the file of a shard"""
+        if callable(self.filename):
+            return os.path.abspath(str(self.filename(key)))
+        return os.path.abspath(self.filename.format(key=key))
+
+    def to_fst(self) -> dict:
+        """Writes every shard to its file
+
+        :return: path of the file of each shard, by partition key
+        :rtype: dict
+        """
+        shards = self.get_shards()
+        if len(shards) == 0:
+            raise StandardFileWriterError("ShardedStandardFileWriter - no records to partition")
+
+        # the writers are created here so that the files are validated before anything is written
+        writers = {}
+        for key, shard_df in shards.items():
+            writers[key] = StandardFileWriter(
+                self.get_shard_filename(key),
+                shard_df,
+                mode=self.mode,
+                no_meta=self.no_meta,
+                overwrite=self.overwrite,
+                rewrite=self.rewrite,
+                meta_only=self.meta_only,
+            )
+        filenames = [writer.filename for writer in writers.values()]
+        if len(set(filenames)) != len(filenames):
+            raise StandardFileWriterError("ShardedStandardFileWriter - many shards have the same file name")
+
+        num_workers = mp.cpu_count() if self.num_workers is None else self.num_workers
+        num_workers = max(1, min(num_workers, len(writers)))
+        if num_workers == 1:
+            for writer in writers.values():
+                writer.to_fst()
+        else:
+            with ProcessPoolExecutor(max_workers=num_workers, mp_context=mp.get_context("spawn")) as executor:
+                futures = [executor.submit(write_shard, writer) for writer in writers.values()]
+                try:
+                    for future in futures:
+                        future.result()
+                except BrokenProcessPool as e:
+                    raise get_broken_process_pool_error(num_workers, executor) from e
+
+        return {key: writer.filename for key, writer in writers.items()}
+
+
+def write_shard(writer: StandardFileWriter) -> str:
+    """Writes a shard in a worker process of ShardedStandardFileWriter"""
+    writer.to_fst()
+    return writer.filename
+
 
 def set_rewrite(df):
     original_df_length = len(df.index)
@@ -216,21 +685,93 @@ def set_rewrite(df):
     return rewrite
 
 
-def write_dataframe_record_to_file(file_id, df, row, rewrite):
-    data = row.d
+def write_dataframe_record_to_file(file_id, df, row, rewrite, data=None, meta=None):
+    data = native_byte_order(row.d if data is None else data)
+    if meta is None:
+        meta = df.loc[row.Index].to_dict()
     field_dtype = RmnInterface.get_numpy_dtype(row.datyp, row.nbits, row.ni, row.nk)
 
     if str(data.dtype) != field_dtype:
         logging.warning(
-            f"For record at index {row.Index}, nomvar:{row.nomvar} datyp:{row.datyp} nbits:{row.nbits} array.dtype:{row.d.dtype}"
+            f"For record at index {row.Index}, nomvar:{row.nomvar} datyp:{row.datyp} nbits:{row.nbits} array.dtype:{data.dtype}"
         )
         logging.warning(f"Difference in field dtype detected! Converting array from {str(data.dtype)} to {field_dtype}")
         converted_array = data.astype(field_dtype)
-        RmnInterface.write_record(
-            file_id, np.asfortranarray(converted_array), df.loc[row.Index].to_dict(), rewrite=rewrite
-        )
+        RmnInterface.write_record(file_id, np.asfortranarray(converted_array), meta, rewrite=rewrite)
     else:
-        RmnInterface.write_record(file_id, np.asfortranarray(data), df.loc[row.Index].to_dict(), rewrite=rewrite)
+        RmnInterface.write_record(file_id, np.asfortranarray(data), meta, rewrite=rewrite)
+
+
+# columns passed to fst_edit_dir in update mode, nbits can't be changed without rewriting the data
+UPDATE_COLUMNS = [col for col in HEADER_COLUMNS if col != "nbits"]
+
+STRING_HEADER_COLUMNS = ["nomvar", "typvar", "etiket", "grtyp"]
+
+
+class RecordHeaders:
+    """Record header columns of a dataframe converted once to lists of python values. The header of a record is
+    returned in a single dictionary that is reused for every record, instead of building one per row.
+
+    :param df: dataframe of the records
+    :type df: pd.DataFrame
+    :param columns: header columns to get, missing columns are left to the librmn defaults,
+                    defaults to HEADER_COLUMNS
+    :type columns: List[str], optional
+    :raises StandardFileWriterError: if a header column has missing values or values that are not numbers
+    """
+
+    def __init__(self, df: pd.DataFrame, columns: list = HEADER_COLUMNS):
+        self.columns = [col for col in columns if col in df.columns]
+        self.values = []
+        for col in self.columns:
+            missing = df[col].isna().to_numpy()
+            if missing.any():
+                raise StandardFileWriterError(
+                    f"StandardFileWriter - column {col} has missing values, at rows {df.index[missing].tolist()[:10]}"
+                )
+            if col in STRING_HEADER_COLUMNS:
+                self.values.append(df[col].astype(str).tolist())
+                continue
+            try:
+                self.values.append(df[col].to_numpy().astype("int64").tolist())
+            except (TypeError, ValueError) as e:
+                raise StandardFileWriterError(f"StandardFileWriter - can't convert column {col} to int: {e}") from e
+        self.meta = dict.fromkeys(self.columns)
+
+    def get(self, i: int) -> dict:
+        """Fills the header dictionary with the values of the i-th record
+
+        :param i: position of the record in the dataframe
+        :type i: int
+        :return: the header dictionary, its values change on the next call
+        :rtype: dict
+        """
+        for col, values in zip(self.columns, self.values):
+            self.meta[col] = values[i]
+        return self.meta
+
+
+def native_byte_order(data: np.ndarray) -> np.ndarray:
+    """Converts arrays that are not in the native byte order, like memory mapped IEEE records, before they are written"""
+    if data.dtype.isnative:
+        return data
+    return data.astype(data.dtype.newbyteorder("="))
+
+
+def has_duplicate_headers(df: pd.DataFrame) -> bool:
+    """Checks if some rows of a dataframe could be the same record for fstecr, same columns as set_rewrite"""
+    return bool(df.duplicated(subset=["nomvar", "typvar", "etiket", "ip1", "ip2", "ip3"]).any())
+
+
+def is_xdf_or_new_file(filename: str) -> bool:
+    """Checks that records can be copied in a file, it must not exist yet or be an XDF file"""
+    if not os.path.exists(filename):
+        return True
+    try:
+        read_directory_entries(filename)
+    except XdfError:
+        return False
+    return True
 
 
 def identical_destination_and_record_path(record_path, filename):
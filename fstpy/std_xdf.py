@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+from typing import List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .rmn_interface import RmnInterface
+from .std_enc import get_dateos_from_datevs
+
+# Layout of the XDF (fstd98) directory, see misc/voir.py for the record by record version.
+# All words are big endian 32 bits words.
+FILE_HEADER_BYTES = 208
+PAGE_HEADER_BYTES = 32
+PAGE_HEADER_WORDS = 2308
+ENTRY_BYTES = 72
+ENTRY_WORDS = 18
+# a record starts with a copy of its directory entry followed by two zero words, then the data
+RECORD_DATA_OFFSET = ENTRY_BYTES + 8
+
+
+class XdfError(Exception):
+    pass
+
+
+def _read_file_header(buf: bytes) -> int:
+    """Validates the XDF file header and returns the number of directory pages
+
+    :param buf: first FILE_HEADER_BYTES bytes of the file
+    :type buf: bytes
+    :raises XdfError: if the header is not a valid fstd98 header
+    :return: number of directory pages
+    :rtype: int
+    """
+    if len(buf) < FILE_HEADER_BYTES:
+        raise XdfError("file is too small to be an XDF file")
+    words = np.frombuffer(buf, dtype=">u4", count=16)
+    halves = np.frombuffer(buf, dtype=">u2", count=24, offset=40)
+    if (words[0] & 0xFFFFFF) != 26 or words[1] != 0:
+        raise XdfError("invalid XDF file header")
+    if buf[8:12] != b"XDF0" or buf[12:16] != b"STDR":
+        raise XdfError("not an fstd98 XDF file")
+    # number of primary keys, their length, number of auxiliary keys and their length
+    if tuple(halves[:4]) != (16, 9, 2, 1):
+        raise XdfError("unexpected XDF key definitions")
+    return int(words[7])
+
+
+def read_directory_entries(path: str) -> np.ndarray:
+    """Reads all the directory pages of an XDF file, page by page
+
+    :param path: path to file
+    :type path: str
+    :raises XdfError: if the directory structure is not valid
+    :return: an array of (number of entries, 18) words, in directory order
+    :rtype: np.ndarray
+    """
+    pages = read_directory_pages(path)
+    if len(pages) == 0:
+        return np.zeros((0, ENTRY_WORDS), dtype=np.uint32)
+    return np.concatenate(pages).astype(np.uint32)
+
+
+def read_directory_pages(path: str) -> List[np.ndarray]:
+    """Reads the directory pages of an XDF file
+
+    :param path: path to file
+    :type path: str
+    :raises XdfError: if the directory structure is not valid
+    :return: an array of (number of entries, 18) words per page, in directory order
+    :rtype: List[np.ndarray]
+    """
+    pages = []
+    with open(path, "rb") as f:
+        nchunks = _read_file_header(f.read(FILE_HEADER_BYTES))
+        offset = FILE_HEADER_BYTES
+        for _ in range(nchunks):
+            f.seek(offset)
+            header = f.read(PAGE_HEADER_BYTES)
+            if len(header) != PAGE_HEADER_BYTES:
+                raise XdfError("truncated directory page")
+            words = np.frombuffer(header, dtype=">u4")
+            if (words[0] >> 24) != 0 or (words[0] & 0xFFFFFF) != PAGE_HEADER_WORDS:
+                raise XdfError("invalid directory page header")
+            next_chunk_words = int(words[4])
+            nrecs = int(words[5])
+            buf = f.read(nrecs * ENTRY_BYTES)
+            if len(buf) != nrecs * ENTRY_BYTES:
+                raise XdfError("truncated directory page")
+            pages.append(np.frombuffer(buf, dtype=">u4").reshape(nrecs, ENTRY_WORDS))
+            if next_chunk_words == 0:
+                break
+            offset = next_chunk_words * 8 - 8
+    return pages
+
+
+def get_record_handles(pages: List[np.ndarray]) -> np.ndarray:
+    """Builds the keys of the records from their page and entry index in the directory, like the
+    MAKE_RND_HANDLE macro of librmn. The file index part of the keys is 0, see OpenFilePool.rebase_key.
+
+    :param pages: directory pages, see read_directory_pages
+    :type pages: List[np.ndarray]
+    :return: keys of the records, in directory order
+    :rtype: np.ndarray
+    """
+    handles = [(np.arange(len(page), dtype=np.int64) << 10) | (pageno << 19) for pageno, page in enumerate(pages)]
+    if len(handles) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(handles)
+
+
+def _decode_chars(field: np.ndarray, nchars: int) -> np.ndarray:
+    """Decodes characters packed as 6 bits values (offset by 32)
+
+    :param field: unsigned integer field containing the packed characters
+    :type field: np.ndarray
+    :param nchars: number of packed characters
+    :type nchars: int
+    :return: array of strings
+    :rtype: np.ndarray
+    """
+    shifts = np.arange(nchars - 1, -1, -1, dtype=np.uint32) * 6
+    chars = (((field[:, None] >> shifts) & 0x3F) + 32).astype(np.uint8)
+    return np.char.decode(np.ascontiguousarray(chars).view(f"S{nchars}").ravel(), "ascii")
+
+
+def decode_directory_entries(entries: np.ndarray) -> pd.DataFrame:
+    """Decodes the directory entries of an XDF file into the same columns as fstprm
+
+    :param entries: array of (number of entries, 18) words
+    :type entries: np.ndarray
+    :return: dataframe of record headers, deleted records are kept
+    :rtype: pd.DataFrame
+    """
+    w = entries
+    # the directory holds the valid date, dateo is computed like fstprm does
+    date_stamp = w[:, 17].astype(np.int64)
+    datev = (date_stamp >> 3) * 10 + (date_stamp & 0x7)
+    etiket = np.char.add(
+        np.char.add(_decode_chars(w[:, 10] >> 2, 5), _decode_chars(w[:, 11] >> 2, 5)), _decode_chars(w[:, 12] >> 20, 2)
+    )
+    df = pd.DataFrame(
+        {
+            "nomvar": _decode_chars(w[:, 13] >> 8, 4),
+            "typvar": _decode_chars((w[:, 12] >> 8) & 0xFFF, 2),
+            "etiket": etiket,
+            "ni": w[:, 3] >> 8,
+            "nj": w[:, 4] >> 8,
+            "nk": w[:, 5] >> 12,
+            "dateo": get_dateos_from_datevs(datev, w[:, 2] >> 8, w[:, 6] >> 6),
+            "datev": datev,
+            "ip1": w[:, 14] >> 4,
+            "ip2": w[:, 15] >> 4,
+            "ip3": w[:, 16] >> 4,
+            "deet": w[:, 2] >> 8,
+            "npas": w[:, 6] >> 6,
+            "datyp": w[:, 4] & 0xFF,
+            "nbits": w[:, 2] & 0xFF,
+            "grtyp": np.char.decode((w[:, 3] & 0xFF).astype(np.uint8).view("S1"), "ascii"),
+            "ig1": w[:, 8] >> 8,
+            "ig2": ((w[:, 7] & 0xFF) << 16) | ((w[:, 8] & 0xFF) << 8) | (w[:, 9] & 0xFF),
+            "ig3": w[:, 9] >> 8,
+            "ig4": w[:, 7] >> 8,
+            # same units as fstprm, swa in 64 bits words (1 based) and lng in 32 bits words
+            "swa": w[:, 1],
+            "lng": (w[:, 0] & 0xFFFFFF) * 2,
+            "dltf": w[:, 0] >> 31,
+            "ubc": w[:, 5] & 0xFFF,
+        }
+    )
+    for col in df.columns:
+        if df[col].dtype == np.uint32:
+            df[col] = df[col].astype("int64")
+    return df
+
+
+# columns checked against fstprm to make sure the directory was correctly decoded
+_VALIDATED_COLUMNS = [
+    "nomvar",
+    "typvar",
+    "etiket",
+    "ni",
+    "nj",
+    "nk",
+    "dateo",
+    "datev",
+    "ip1",
+    "ip2",
+    "ip3",
+    "deet",
+    "npas",
+    "datyp",
+    "nbits",
+    "grtyp",
+    "ig1",
+    "ig2",
+    "ig3",
+    "ig4",
+    "swa",
+    "lng",
+]
+
+
+def get_xdf_records(path: str) -> pd.DataFrame:
+    """Builds the records metadata of a file from its XDF directory, without calling fstprm for every record.
+    The keys are built from the position of the records in the directory and checked against a single fstinl
+    call. One record per distinct (dateo, deet, npas) is checked against fstprm to validate the decoding.
+
+    :param path: path to file
+    :type path: str
+    :raises XdfError: if the file can't be decoded or if the decoded values differ from librmn's
+    :return: dataframe with the same columns as the fstprm records
+    :rtype: pd.DataFrame
+    """
+    pages = read_directory_pages(path)
+    if len(pages) == 0:
+        raise XdfError(f"no records found in {path}")
+    df = decode_directory_entries(np.concatenate(pages).astype(np.uint32))
+    df["key"] = get_record_handles(pages)
+    df = df.loc[df.dltf == 0].reset_index(drop=True)
+    if df.empty:
+        raise XdfError(f"no records found in {path}")
+
+    file_id = RmnInterface.open_file(path)
+    try:
+        keys = np.asarray(RmnInterface.find_records(file_id), dtype=np.int64)
+        if len(keys) != len(df.index):
+            raise XdfError(f"found {len(df.index)} records in directory but fstinl returned {len(keys)}")
+        # every key must be the handle of a record of the directory
+        file_index = keys & 0x3FF
+        if (file_index != file_index[0]).any() or not np.array_equal(np.sort(keys & ~0x3FF), np.sort(df.key)):
+            raise XdfError("the keys returned by fstinl don't match the positions of the records in the directory")
+        df["key"] = df.key | int(file_index[0])
+
+        for row in df.drop_duplicates(subset=["dateo", "deet", "npas"]).itertuples():
+            prm = RmnInterface.get_record_metadata(int(row.key))
+            expected = df.loc[row.Index]
+            for col in _VALIDATED_COLUMNS:
+                value = prm[col].strip() if isinstance(prm[col], str) else prm[col]
+                other = expected[col].strip() if isinstance(expected[col], str) else expected[col]
+                if value != other:
+                    raise XdfError(f"decoded {col}={other} differs from fstprm {col}={value}")
+    finally:
+        RmnInterface.close_file(file_id)
+
+    df["shape"] = list(zip(df.ni.tolist(), df.nj.tolist(), df.nk.tolist()))
+    return df
+
+
+def map_ieee_record(buf, swa: int, lng: int, shape: tuple, nbits: int) -> Union[np.ndarray, None]:
+    """Creates an array that is a view of the data of an uncompressed IEEE record (datyp 5) in a buffer
+    holding the whole file, usually a read only mmap. The data is stored in big endian.
+
+    :param buf: buffer of the file content
+    :type buf: Union[mmap.mmap, bytes]
+    :param swa: address of the record in 64 bits words, 1 based
+    :type swa: int
+    :param lng: length of the record in 32 bits words
+    :type lng: int
+    :param shape: shape of the array
+    :type shape: tuple
+    :param nbits: 32 or 64
+    :type nbits: int
+    :return: a big endian Fortran ordered view or None if the record does not have the expected layout
+    :rtype: Union[np.ndarray, None]
+    """
+    if nbits not in [32, 64]:
+        return None
+    offset = (int(swa) - 1) * 8
+    nbytes = int(np.prod(shape)) * (nbits // 8)
+    end = offset + RECORD_DATA_OFFSET + nbytes
+    if (offset < FILE_HEADER_BYTES) or (end > len(buf)) or (end > offset + int(lng) * 4):
+        return None
+    header = np.frombuffer(buf, dtype=">u4", count=ENTRY_WORDS + 2, offset=offset)
+    # same checks as the record header validation in misc/voir.py
+    if (header[1] != swa) or ((header[0] & 0xFFFFFF) * 2 != lng) or (header[4] & 0xFF) != 5:
+        return None
+    if (header[2] & 0xFF) != nbits or header[ENTRY_WORDS] != 0 or header[ENTRY_WORDS + 1] != 0:
+        return None
+    return np.ndarray(shape, dtype=f">f{nbits // 8}", buffer=buf, offset=offset + RECORD_DATA_OFFSET, order="F")
+
+
+def copy_records_data(
+    path: str, offset: int, sources: List[Union[Tuple[str, int, int], None]]
+) -> List[Tuple[int, int]]:
+    """Copies the packed data of source records over the data of the records appended to an XDF file,
+    without decoding them. The records written after offset must be in the same order as sources and must
+    have the same packed length as their source, they are usually placeholders written with fstecr.
+    The file must be closed.
+
+    :param path: path to the XDF file that was written
+    :type path: str
+    :param offset: size of the file before the records were appended, in bytes
+    :type offset: int
+    :param sources: (path, swa, lng) of the source record of every appended record, None if it has no source
+    :type sources: List[Union[Tuple[str, int, int], None]]
+    :raises XdfError: if the appended records don't match sources
+    :return: position in sources and swa of the appended records that couldn't be copied because their length
+             differs from their source
+    :rtype: List[Tuple[int, int]]
+    """
+    df = decode_directory_entries(read_directory_entries(path))
+    df = df.loc[(df.dltf == 0) & ((df.swa - 1) * 8 >= offset)].sort_values("swa")
+    if len(df.index) != len(sources):
+        raise XdfError(f"found {len(df.index)} new records in {path}, expected {len(sources)}")
+
+    not_copied = []
+    source_files = {}
+    try:
+        with open(path, "r+b") as f:
+            for i, (swa, lng, source) in enumerate(zip(df.swa.tolist(), df.lng.tolist(), sources)):
+                if source is None:
+                    continue
+                source_path, source_swa, source_lng = source
+                if source_lng != lng:
+                    not_copied.append((i, swa))
+                    continue
+                if source_path not in source_files:
+                    source_files[source_path] = open(source_path, "rb")
+                source_file = source_files[source_path]
+                source_file.seek((source_swa - 1) * 8)
+                buf = source_file.read(lng * 4)
+                header = np.frombuffer(buf, dtype=">u4", count=ENTRY_WORDS + 2) if len(buf) == lng * 4 else None
+                # same checks as the record header validation in misc/voir.py
+                if (header is None) or (header[1] != source_swa) or ((header[0] & 0xFFFFFF) * 2 != source_lng):
+                    raise XdfError(f"invalid record header at address {source_swa} in {source_path}")
+                f.seek((swa - 1) * 8 + RECORD_DATA_OFFSET)
+                f.write(buf[RECORD_DATA_OFFSET:])
+    finally:
+        for source_file in source_files.values():
+            source_file.close()
+    return not_copied
@@ -363,7 +363,7 @@ def unit_convert(df: pd.DataFrame, to_unit_name="1", standard_unit=False) -> pd.
 
     if not standard_unit:
         if "level" not in res_df.columns:
-            res_df = add_columns(res_df, columns=["ip_info"])
+            res_df = add_columns(res_df, columns=["ip_info"], inplace=True)
 
         res_df = res_df.sort_values(by="level", ascending=res_df.ascending.unique()[0]).reset_index(drop=True)
 
@@ -3,12 +3,13 @@ import inspect
 import logging
 import os
 from functools import wraps
-from typing import List, Optional, Union
+from typing import List, Optional, Tuple, Union
 
 import dask.array as da
 import numpy as np
 import pandas as pd
 
+from . import FSTPY_BLOCK_MAX_BYTES
 from .rmn_interface import RmnInterface
 
 
@@ -132,6 +133,64 @@ def get_num_rows_for_reading(df):
     return num_rows
 
 
+def get_records_nbytes(df: pd.DataFrame) -> np.ndarray:
+    """Estimates the size of the decoded records from ni, nj, nk and the numpy dtype of their datyp and nbits
+
+    :param df: dataframe of the records
+    :type df: pd.DataFrame
+    :return: size in bytes of every record
+    :rtype: np.ndarray
+    """
+    if df.empty:
+        return np.zeros(0, dtype="int64")
+    if not set(["ni", "nj", "nk", "datyp", "nbits"]).issubset(df.columns):
+        return np.array([0 if arr is None else arr.nbytes for arr in df.d.to_list()], dtype="int64")
+
+    ni = df.ni.to_numpy().astype("int64")
+    nj = df.nj.to_numpy().astype("int64")
+    nk = df.nk.to_numpy().astype("int64")
+    datyp = df.datyp.to_numpy().astype("int64")
+    nbits = df.nbits.to_numpy().astype("int64")
+    # get_numpy_dtype only depends on ni and nk for strings, one call per distinct combination
+    itemsizes = {}
+    itemsize = np.empty(len(ni), dtype="int64")
+    for i, combination in enumerate(zip(datyp.tolist(), nbits.tolist(), ni.tolist(), nk.tolist())):
+        if combination not in itemsizes:
+            itemsizes[combination] = np.dtype(RmnInterface.get_numpy_dtype(*combination)).itemsize
+        itemsize[i] = itemsizes[combination]
+    return ni * nj * nk * itemsize
+
+
+def get_row_blocks(df: pd.DataFrame, max_bytes: int = None) -> List[Tuple[int, int]]:
+    """Splits the rows of a dataframe in consecutive blocks whose decoded records fit in a memory budget.
+    A record larger than the budget is alone in its block. If the FSTPY_NUM_ROWS environment variable is set,
+    it is also the maximum number of rows of a block.
+
+    :param df: dataframe of the records
+    :type df: pd.DataFrame
+    :param max_bytes: memory budget of a block, defaults to None (FSTPY_BLOCK_MAX_BYTES)
+    :type max_bytes: int, optional
+    :return: (start, end) positions of every block, end excluded
+    :rtype: List[Tuple[int, int]]
+    """
+    if max_bytes is None:
+        max_bytes = FSTPY_BLOCK_MAX_BYTES
+    max_rows = os.getenv("FSTPY_NUM_ROWS")
+    max_rows = None if max_rows is None else max(1, int(max_rows))
+
+    cumulative_nbytes = np.cumsum(get_records_nbytes(df))
+    blocks = []
+    start = 0
+    while start < len(cumulative_nbytes):
+        used = cumulative_nbytes[start - 1] if start > 0 else 0
+        end = max(start + 1, int(np.searchsorted(cumulative_nbytes, used + max_bytes, side="right")))
+        if max_rows is not None:
+            end = min(end, start + max_rows)
+        blocks.append((start, end))
+        start = end
+    return blocks
+
+
 class ConversionError(Exception):
     pass
 
@@ -867,3 +867,143 @@ def test_30(simple_df):
     assert simple_df.npas[0] == 96  # Npas non modifie car deet == 0
 
     assert len(simple_df.columns) == 22
+
+
+def test_31(input_file):
+    """Test the vectorized ip decoding gives the same values as VCREATE_IP_INFO"""
+    from fstpy.std_dec import VCREATE_IP_INFO, get_ip_info_arrays
+
+    df = fstpy.StandardFileReader(input_file).to_pandas()
+    expected = VCREATE_IP_INFO(df.nomvar, df.ip1, df.ip2, df.ip3)
+    result = get_ip_info_arrays(df.nomvar, df.ip1, df.ip2, df.ip3)
+    for arr, expected_arr in zip(result, expected):
+        assert arr.dtype.kind == expected_arr.dtype.kind
+        assert arr.tolist() == expected_arr.tolist()
+
+
+def test_32(input_file):
+    """Test filling some missing ip info and flag values gives the same values as a full decode"""
+    df = fstpy.StandardFileReader(input_file).to_pandas()
+    expected_df = fstpy.add_flag_values(fstpy.add_ip_info_columns(df))
+
+    partial_df = expected_df.drop(columns=["ip2_dec", "masked", "zapped"])
+    partial_df.loc[partial_df.index[::2], "level"] = None
+    partial_df.loc[partial_df.index[1::3], "surface"] = None
+    partial_df.loc[partial_df.index[::3], "masks"] = None
+    result_df = fstpy.add_flag_values(fstpy.add_ip_info_columns(partial_df))
+
+    for col in ["level", "ip2_dec", "surface", "masked", "masks", "zapped"]:
+        assert result_df[col].tolist() == expected_df[col].tolist()
+
+
+def test_33(input_file):
+    """Test the vectorized date conversions give the same values as librmn"""
+    from fstpy.std_dec import convert_rmndate_to_datetime, convert_rmndates_to_datetime64
+    from fstpy.std_enc import create_encoded_dateo, create_encoded_dateos
+
+    df = fstpy.StandardFileReader(input_file).to_pandas()
+    stamps = np.concatenate([df.dateo.unique(), df.datev.unique(), [0, 10101011, 442998800, 442998807]])
+    result = convert_rmndates_to_datetime64(stamps)
+    expected = np.array([convert_rmndate_to_datetime(stamp) for stamp in stamps], dtype="datetime64[ns]")
+    assert result.dtype == np.dtype("datetime64[ns]")
+    assert np.array_equal(result, expected, equal_nan=True)
+
+    dates = pd.Series(result[~np.isnat(result)])
+    assert create_encoded_dateos(dates).tolist() == [create_encoded_dateo(date) for date in dates]
+    # librmn encodes the dates before 2000 as old style stamps
+    dates = pd.Series(
+        pd.to_datetime(["1980-01-01", "1985-07-14 06:00", "1999-12-31 23:59:55", "2000-01-01", "2000-01-01 00:00:05"])
+    )
+    assert create_encoded_dateos(dates).tolist() == [create_encoded_dateo(date) for date in dates]
+
+    df = fstpy.add_columns(df, ["dateo", "datev", "forecast_hour"])
+    assert df.date_of_observation.dtype == np.dtype("datetime64[ns]")
+    assert df.forecast_hour.dtype == np.dtype("timedelta64[ns]")
+    expected_datev = df.datev.tolist()
+    df = fstpy.reduce_decoded_date_column(df)
+    assert df.datev.tolist() == expected_datev
+
+    # a dateo before 2000 is unchanged by a round trip
+    df = df.iloc[:1].copy()
+    df["dateo"] = np.array([create_encoded_dateo(pd.Timestamp("1995-06-15 12:00"))], dtype=df.dateo.dtype)
+    dtype = df.dateo.dtype
+    expected_dateo = df.dateo.tolist()
+    df = fstpy.reduce_decoded_date_column(fstpy.add_columns(df, ["dateo", "datev"]))
+    assert df.dateo.tolist() == expected_dateo
+    assert df.dateo.dtype == dtype
+
+
+def test_34(input_file):
+    """Test the vectorized etiket parser gives the same values as VPARSE_ETIKET"""
+    from fstpy.std_dec import VPARSE_ETIKET, parse_etikets
+
+    df = fstpy.StandardFileReader(input_file).to_pandas()
+    etikets = pd.Series(
+        df.etiket.tolist()
+        + ["", "R", "R1", "R1_V710_N", "G1PRESSUREN001", "R1LABELX1234", "R1LABELPabcd", "R1_V710_NALL"]
+        + [f"E1_ENS_N{member:03d}" for member in range(1000)]
+        + [f"E1_ENS_N{member:02d}a" for member in range(100)]
+    )
+    for _ in range(2):
+        for arr, expected_arr in zip(parse_etikets(etikets), VPARSE_ETIKET(etikets)):
+            assert arr.tolist() == expected_arr.tolist()
+
+    etiket_df = pd.DataFrame({"etiket": etikets})
+    result_df = fstpy.add_parsed_etiket_columns(etiket_df)
+    partial_df = result_df.copy()
+    partial_df.loc[partial_df.index[::2], "label"] = None
+    partial_df = fstpy.add_parsed_etiket_columns(partial_df.drop(columns=["etiket_format"]))
+    for col in ["label", "run", "implementation", "ensemble_member", "etiket_format"]:
+        assert partial_df[col].tolist() == result_df[col].tolist()
+
+
+def test_35(input_file):
+    """Test add_columns gives the same columns with inplace and leaves the dataframe untouched without it"""
+    df = fstpy.StandardFileReader(input_file).to_pandas()
+    columns = df.columns.tolist()
+    expected_df = fstpy.add_columns(df)
+    assert df.columns.tolist() == columns
+
+    result_df = fstpy.add_columns(df.copy(), inplace=True)
+    assert result_df.columns.tolist() == expected_df.columns.tolist()
+    cols = [col for col in expected_df.columns if col != "d"]
+    assert result_df[cols].equals(expected_df[cols])
+
+
+@pytest.mark.benchmark
+def test_36(input_file):
+    """Benchmark of add_columns on a 100k rows dataframe, against the chained helpers that each copy the dataframe"""
+    import time
+    import tracemalloc
+
+    df = fstpy.StandardFileReader(input_file).to_pandas()
+    df = pd.concat([df] * (100_000 // len(df.index) + 1), ignore_index=True)
+
+    def chained(df):
+        df = fstpy.add_parsed_etiket_columns(df)
+        df = fstpy.add_unit_column(df)
+        df = fstpy.add_description_column(df)
+        df = fstpy.add_decoded_date_column(df, "dateo")
+        df = fstpy.add_decoded_date_column(df, "datev")
+        df = fstpy.add_forecast_hour_column(df)
+        df = fstpy.add_data_type_str_column(df)
+        df = fstpy.set_vertical_coordinate_type(df)
+        return fstpy.add_flag_values(df)
+
+    results = {}
+    for name, function in [
+        ("chained", chained),
+        ("add_columns", fstpy.add_columns),
+        ("add_columns inplace", lambda df: fstpy.add_columns(df, inplace=True)),
+    ]:
+        source_df = df.copy()
+        tracemalloc.start()
+        start = time.perf_counter()
+        function(source_df)
+        results[name] = (time.perf_counter() - start, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    print(f"\nadd_columns on {len(df.index)} rows:")
+    for name, (elapsed, peak) in results.items():
+        print(f"  {name}: {elapsed:.3f}s, peak {peak / 2**20:.0f} MiB")
+    assert results["add_columns inplace"][1] <= results["chained"][1]
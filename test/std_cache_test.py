@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fstpy.std_cache import DataCache, MetadataCache, MetadataCacheError
+from fstpy.std_io import set_data_cache
+from fstpy.std_reader import StandardFileReader, compute
+from test import TEST_PATH
+
+pytestmark = [pytest.mark.std_reader, pytest.mark.unit_tests]
+
+
+@pytest.fixture
+def input_file(tmp_path):
+    path = tmp_path / "source_data_5005.std"
+    shutil.copy(TEST_PATH + "/ReaderStd/testsFiles/source_data_5005.std", path)
+    return str(path)
+
+
+def test_1(input_file, tmp_path):
+    """Test a cached read gives the same dataframe as an uncached read"""
+    cache = MetadataCache(tmp_path / "cache")
+    df = StandardFileReader(input_file).to_pandas()
+    first_df = StandardFileReader(input_file, metadata_cache=cache).to_pandas()
+    assert cache.get(input_file) is not None
+    cached_df = StandardFileReader(input_file, metadata_cache=cache).to_pandas()
+    assert len(cached_df.index) == 1874
+    pd.testing.assert_frame_equal(df.drop(columns="d"), first_df.drop(columns="d"))
+    pd.testing.assert_frame_equal(df.drop(columns="d"), cached_df.drop(columns="d"))
+    assert [d.name for d in df.d] == [d.name for d in cached_df.d]
+
+
+def test_2(input_file, tmp_path):
+    """Test an entry is invalidated when the file changes"""
+    cache = MetadataCache(tmp_path / "cache")
+    StandardFileReader(input_file, metadata_cache=cache).to_pandas()
+    stat = os.stat(input_file)
+    os.utime(input_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    assert cache.get(input_file) is None
+
+
+def test_3(input_file, tmp_path):
+    """Test the cache is trimmed to max_bytes"""
+    cache = MetadataCache(tmp_path / "cache", max_bytes=1)
+    StandardFileReader(input_file, metadata_cache=cache).to_pandas()
+    assert os.listdir(cache.directory) == []
+
+
+def test_4(tmp_path):
+    """Test invalid validate attributes raise MetadataCacheError"""
+    with pytest.raises(MetadataCacheError):
+        MetadataCache(tmp_path / "cache", validate=("size", "checksum"))
+
+
+def test_5():
+    """Test large arrays are evicted before small ones"""
+    cache = DataCache(1000, small_bytes=100)
+    cache.put(("a", 1, 0), np.zeros(10, dtype="float32"))
+    cache.put(("b", 1, 0), np.zeros(200, dtype="float32"))
+    cache.put(("c", 1, 0), np.zeros(100, dtype="float32"))
+    assert cache.get(("a", 1, 0)) is not None
+    assert cache.get(("b", 1, 0)) is None
+    assert cache.get(("c", 1, 0)) is not None
+    assert cache.stats() == {"hits": 2, "misses": 1, "evictions": 1, "entries": 2, "nbytes": 440}
+
+
+def test_6(input_file):
+    """Test computing the same records twice reads them from the data cache"""
+    cache = set_data_cache(100 * 1024 * 1024)
+    try:
+        df = StandardFileReader(input_file, query='nomvar=="P0"').to_pandas()
+        first_df = compute(df)
+        second_df = compute(df)
+        stats = cache.stats()
+        assert stats["hits"] == len(df.index)
+        assert stats["misses"] == len(df.index)
+        for arr, expected_arr in zip(second_df.d, first_df.d):
+            np.testing.assert_array_equal(arr, expected_arr)
+    finally:
+        set_data_cache(None)
+
+
+def test_7(input_file):
+    """Test the data cache finds a record whose key was obtained with another file index"""
+    from fstpy.std_io import OpenFilePool, read_records
+
+    cache = set_data_cache(100 * 1024 * 1024)
+    try:
+        df = StandardFileReader(input_file, query='nomvar=="P0"').to_pandas()
+        key = int(df.key.iloc[0])
+        other_key = OpenFilePool.rebase_key(key, (key & 0x3FF) ^ 1)
+        first = read_records(input_file, [key])[0]
+        second = read_records(os.path.relpath(input_file), [other_key])[0]
+        assert cache.stats()["hits"] == 1
+        np.testing.assert_array_equal(first, second)
+    finally:
+        set_data_cache(None)
+
+
+def test_8(input_file, tmp_path):
+    """Test a directory or an entry writable by others is not used"""
+    directory = tmp_path / "cache"
+    cache = MetadataCache(directory)
+    StandardFileReader(input_file, metadata_cache=cache).to_pandas()
+    entry_path = cache._entry_path(input_file)
+    os.chmod(entry_path, 0o666)
+    assert cache.get(input_file) is None
+    os.chmod(directory, 0o777)
+    with pytest.raises(MetadataCacheError):
+        MetadataCache(directory)
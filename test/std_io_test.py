@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fstpy.dataframe import add_grid_column
+from fstpy.dataframe_utils import get_hybrid_ips
+from fstpy.rmn_interface import RmnInterface
+from fstpy.std_io import get_basic_dataframe, get_dataframe_from_file, process_hy
+
+pytestmark = [pytest.mark.std_reader, pytest.mark.unit_tests]
+
+NUM_GRIDS = 400
+NUM_LEVELS = 10
+
+
+def write_record(file_id, nomvar, ip1, ig1, ig2=0, ni=4, nj=4):
+    meta = {
+        "nomvar": nomvar,
+        "typvar": "P",
+        "etiket": "BENCH",
+        "ni": ni,
+        "nj": nj,
+        "nk": 1,
+        "dateo": 0,
+        "ip1": ip1,
+        "ip2": 0,
+        "ip3": 0,
+        "deet": 0,
+        "npas": 0,
+        "datyp": 1,
+        "nbits": 16,
+        "grtyp": "X",
+        "ig1": ig1,
+        "ig2": ig2,
+        "ig3": 0,
+        "ig4": 0,
+    }
+    RmnInterface.write_record(file_id, np.zeros((ni, nj), dtype=np.float32, order="F"), meta, rewrite=False)
+
+
+@pytest.fixture(scope="module")
+def many_grids_file(tmp_path_factory):
+    """File with NUM_GRIDS grids of hybrid levels, half of them have a hybrid !!"""
+    path = str(tmp_path_factory.mktemp("many_grids") / "many_grids.std")
+    hybrid_ip1s = [
+        RmnInterface.convert_ip(RmnInterface.CONVIP_ENCODE, level, 5)
+        for level in np.linspace(0.1, 1.0, NUM_LEVELS).tolist()
+    ]
+    file_id = RmnInterface.open_file(path, RmnInterface.FST_RW)
+    write_record(file_id, "HY", RmnInterface.convert_ip(RmnInterface.CONVIP_ENCODE, 10.0, 2), 0)
+    for grid in range(1, NUM_GRIDS + 1):
+        for ip1 in hybrid_ip1s:
+            write_record(file_id, "TT", ip1, grid)
+        if grid % 2 == 0:
+            write_record(file_id, "!!", grid, 5002, grid, ni=3, nj=1)
+    RmnInterface.close_file(file_id)
+    return path
+
+
+def process_hy_groupby(hy_df: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
+    """Previous implementation of process_hy, used as reference"""
+
+    def assign_hy(grid_df, hy_df):
+        hybrid_ips = get_hybrid_ips(grid_df)
+        if len(hybrid_ips):
+            hyb_levels_grid = grid_df.loc[grid_df.ip1.isin(hybrid_ips)].grid.unique()
+            toctoc_df = grid_df.loc[grid_df.nomvar == "!!"]
+            for grid in hyb_levels_grid:
+                hyb_toctoc_df = toctoc_df.loc[
+                    (toctoc_df.grid == grid)
+                    & (toctoc_df.ig1.isin([5001, 5002, 5003, 5004, 5005, 5100, 5999, 21001, 21002]))
+                ]
+                if hyb_toctoc_df.empty:
+                    hy_df["grid"] = grid
+                    grid_df = pd.safe_concat([grid_df, hy_df])
+        return grid_df
+
+    hy_df = pd.DataFrame([hy_df.iloc[0].to_dict()])
+    return df.groupby("grid", group_keys=True).apply(lambda group: assign_hy(group, hy_df)).reset_index(drop=True)
+
+
+def get_hy_and_df(path):
+    df = add_grid_column(get_basic_dataframe(path))
+    return df.loc[df.nomvar == "HY"], df.loc[df.nomvar != "HY"]
+
+
+def test_1(many_grids_file):
+    """Test process_hy adds one HY to every hybrid grid without a hybrid !!, like the groupby version"""
+    hy_df, df = get_hy_and_df(many_grids_file)
+    result_df = process_hy(hy_df, df)
+    expected_df = process_hy_groupby(hy_df, df)
+
+    result_hy_df = result_df.loc[result_df.nomvar == "HY"]
+    assert len(result_hy_df.index) == NUM_GRIDS // 2
+    assert result_df.nomvar.tolist() == expected_df.nomvar.tolist()
+    assert result_df.grid.tolist() == expected_df.grid.tolist()
+    assert result_df.key.tolist() == expected_df.key.tolist()
+
+
+@pytest.mark.benchmark
+def test_2(many_grids_file):
+    """Benchmark of process_hy and get_dataframe_from_file on a file with many grids"""
+    hy_df, df = get_hy_and_df(many_grids_file)
+
+    start = time.perf_counter()
+    process_hy_groupby(hy_df, df)
+    groupby_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    process_hy(hy_df, df)
+    vectorized_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    get_dataframe_from_file(many_grids_file)
+    read_time = time.perf_counter() - start
+
+    print(
+        f"\nprocess_hy on {NUM_GRIDS} grids: groupby {groupby_time:.3f}s, vectorized {vectorized_time:.3f}s, "
+        f"get_dataframe_from_file {read_time:.3f}s"
+    )
+
+
+def test_3(tmp_path):
+    """Test the memory maps are keyed on the absolute path and dropped when the file is released"""
+    import os
+
+    from fstpy.std_io import _FILE_MAPS, release_file
+
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"\x00" * 64)
+    first = _FILE_MAPS.get(str(path))
+    assert _FILE_MAPS.get(os.path.relpath(path)) is first
+    release_file(str(path))
+    assert os.path.abspath(path) not in _FILE_MAPS.maps
+    assert first[:4] == b"\x00" * 4
+    second = _FILE_MAPS.get(str(path))
+    with open(path, "ab") as f:
+        f.write(b"\x01" * 64)
+    third = _FILE_MAPS.get(str(path))
+    assert third is not second
+    assert len(third) == 128
+    release_file(str(path))
+
+
+def test_4():
+    """Test only the records of X, Y and Z grids are windowed"""
+    from fstpy.std_io import get_positional_grid_types, get_window_slices
+
+    df = pd.DataFrame(
+        {
+            "nomvar": ["TT", ">>", "^^", "UU", ">>", "^^", "GZ"],
+            "grtyp": ["Z", "E", "E", "Z", "E", "E", "L"],
+            "ip1": [0, 1, 1, 0, 2, 2, 0],
+            "ip2": [0, 2, 2, 0, 3, 3, 0],
+            "ig1": [1, 0, 0, 2, 0, 0, 100],
+            "ig2": [2, 0, 0, 3, 0, 0, 200],
+        }
+    )
+    grid_types = get_positional_grid_types(df)
+    assert grid_types[(1, 2)] == "Z"
+    assert grid_types[(2, 3)] == "Z"
+    window = (10, 30, 5, 25)
+    assert get_window_slices("TT", "Z", 100, 50, window) == (slice(10, 30), slice(5, 25))
+    assert get_window_slices(">>", grid_types[(1, 2)], 100, 1, window) == (slice(10, 30), slice(None))
+    assert get_window_slices("^^", grid_types[(1, 2)], 1, 50, window) == (slice(None), slice(5, 25))
+    assert get_window_slices("GZ", "L", 100, 50, window) is None
+    assert get_window_slices(">>", grid_types.get((5, 6)), 100, 1, window) is None
+
+
+def test_5():
+    """Test the worker processes pool is created once per number of workers"""
+    from fstpy.std_io import get_process_executor
+
+    executor = get_process_executor(2)
+    assert get_process_executor(2) is executor
+    assert get_process_executor(3) is not executor
+    assert executor.submit(abs, -1).result() == 1
+
+
+def test_6(tmp_path, monkeypatch):
+    """Test windows of IEEE records are only memory mapped when FSTPY_MMAP_READS is set"""
+    import fstpy.std_io as std_io
+
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"\x00" * 64)
+    data = np.arange(16, dtype="float32").reshape((4, 4), order="F")
+
+    def fail_map_ieee_record(*args):
+        raise AssertionError("the record should not be memory mapped")
+
+    monkeypatch.setattr(std_io, "FSTPY_MMAP_READS", False)
+    monkeypatch.setattr(std_io, "map_ieee_record", fail_map_ieee_record)
+    monkeypatch.setattr(std_io, "read_records", lambda path, keys: [data])
+    slices = (slice(1, 3), slice(0, 2))
+    window = std_io.get_data_window(str(path), 1, "float32", (4, 4), 5, 32, 0, 16, slices)
+    np.testing.assert_array_equal(window, data[slices])
+
+
+def test_7():
+    """Test a broken worker processes pool is replaced and the error tells how to protect the main module"""
+    import os
+    from concurrent.futures.process import BrokenProcessPool
+
+    from fstpy.std_io import get_broken_process_pool_error, get_process_executor
+
+    executor = get_process_executor(1)
+    with pytest.raises(BrokenProcessPool):
+        executor.submit(os._exit, 1).result()
+    error = get_broken_process_pool_error(1, executor)
+    assert '__name__ == "__main__"' in str(error)
+    assert get_process_executor(1) is not executor
@@ -1,7 +1,13 @@
 # -*- coding: utf-8 -*-
+import os
+from pathlib import Path
+
 import numpy as np
+import pandas as pd
 import pytest
-from fstpy.std_reader import *
+
+from fstpy.std_reader import StandardFileReader, compute, compute_async
+from fstpy.utils import to_numpy
 from test import TEST_PATH
 
 pytestmark = [pytest.mark.std_reader, pytest.mark.unit_tests]
@@ -153,3 +159,171 @@ def test_12(input_file4):
     """don't try to find an interval for ^^,>> that have all their IPs encoded."""
     std_file = StandardFileReader(input_file4, decode_metadata=True)
     std_file.to_pandas()
+
+
+def test_13(input_file, input_file2):
+    """Test opening multiple files with worker processes gives the same result as the serial scan"""
+    serial_df = StandardFileReader([input_file, input_file2]).to_pandas()
+    parallel_df = StandardFileReader([input_file, input_file2], num_workers=2).to_pandas()
+    assert len(parallel_df.index) == 2009
+    assert parallel_df.columns.equals(serial_df.columns)
+    pd.testing.assert_frame_equal(
+        serial_df.drop(columns="d").reset_index(drop=True), parallel_df.drop(columns="d").reset_index(drop=True)
+    )
+    assert [d.name for d in serial_df.d] == [d.name for d in parallel_df.d]
+
+
+def test_14(input_file, tmp_path):
+    """Test selecting the records of a query with fstinl gives the same result as a full scan"""
+    query = 'nomvar in ["UU","TT"] and ip2==0'
+    pushdown_df = StandardFileReader(input_file, query=query).to_pandas()
+    # with a metadata cache the whole file is scanned before the query is applied
+    full_scan_df = StandardFileReader(input_file, query=query, metadata_cache=tmp_path / "cache").to_pandas()
+    pd.testing.assert_frame_equal(
+        pushdown_df.drop(columns="d").reset_index(drop=True), full_scan_df.drop(columns="d").reset_index(drop=True)
+    )
+
+
+def test_15():
+    """Test only the simple predicates of a query are used to select records"""
+    from fstpy.std_io import get_query_criteria
+
+    assert get_query_criteria('nomvar in ["UU","VV"] and ip1==12000 and etiket=="R1_V710_N"') == {
+        "nomvar": ["UU", "VV"],
+        "ip1": [12000],
+    }
+    assert get_query_criteria('(nomvar=="UU") & (ip2>0)') == {"nomvar": ["UU"]}
+    assert get_query_criteria('nomvar=="UU" or ip1==12000') is None
+
+
+def test_16(input_file):
+    """Test the file stays open between record reads and is closed by release_file"""
+    from fstpy.std_io import _FILE_POOL, release_file
+
+    df = StandardFileReader(input_file, query='nomvar=="UU"').to_pandas()
+    path = os.path.abspath(str(input_file))
+    df = compute(df)
+    assert len(df.index) == 89
+    assert path in _FILE_POOL.files
+    release_file(path)
+    assert path not in _FILE_POOL.files
+
+
+def test_17(input_file):
+    """Test reading the records file by file gives the same arrays as computing them one by one"""
+    df = StandardFileReader(input_file, query='nomvar in ["UU","TT"]').to_pandas()
+    # a modified array can't be read directly from the file
+    df.at[df.index[0], "d"] = df.at[df.index[0], "d"] * 2
+    expected = [to_numpy(d) for d in df.d]
+    computed_df = compute(df)
+    for arr, expected_arr in zip(computed_df.d, expected):
+        np.testing.assert_array_equal(arr, expected_arr)
+
+
+def test_18(input_file):
+    """Test decoding the records in worker processes gives the same arrays"""
+    df = StandardFileReader(input_file, query='nomvar in ["UU","TT"]').to_pandas()
+    serial_df = compute(df)
+    parallel_df = compute(df, num_workers=2)
+    for arr, expected_arr in zip(parallel_df.d, serial_df.d):
+        assert arr.dtype == expected_arr.dtype
+        assert arr.flags.f_contiguous == expected_arr.flags.f_contiguous
+        np.testing.assert_array_equal(arr, expected_arr)
+
+
+def test_19(input_file, input_file2):
+    """Test iter_pandas gives the records of to_pandas, file by file"""
+    df = StandardFileReader([input_file, input_file2]).to_pandas()
+    df_list = list(StandardFileReader([input_file, input_file2]).iter_pandas())
+    assert len(df_list) == 2
+    assert sum(len(chunk_df.index) for chunk_df in df_list) == len(df.index)
+
+
+def test_20(input_file):
+    """Test iter_pandas chunks by number of records have the metadata of their grids"""
+    df = StandardFileReader(input_file, decode_metadata=True).to_pandas()
+    meta_data = StandardFileReader.meta_data
+    num_data = len(df.loc[~df.nomvar.isin(meta_data)].index)
+    df_list = list(StandardFileReader(input_file, decode_metadata=True).iter_pandas(chunk=100))
+    assert len(df_list) == -(-num_data // 100)
+    for chunk_df in df_list:
+        assert len(chunk_df.columns) == len(df.columns)
+        data_df = chunk_df.loc[~chunk_df.nomvar.isin(meta_data)]
+        assert len(data_df.index) <= 100
+        assert set(chunk_df.loc[chunk_df.nomvar.isin(meta_data)].grid) <= set(data_df.grid)
+    assert sum(len(c.loc[~c.nomvar.isin(meta_data)].index) for c in df_list) == num_data
+
+
+def test_21(input_file):
+    """Test reading a window gives the same values as slicing the whole fields"""
+    query = 'nomvar in ["UU","P0"]'
+    window = (10, 30, 5, 25)
+    df = compute(StandardFileReader(input_file, query=query).to_pandas())
+    window_df = compute(StandardFileReader(input_file, query=query, window=window).to_pandas())
+    assert len(window_df.index) == len(df.index)
+    for row, window_row in zip(df.itertuples(), window_df.itertuples()):
+        if row.nomvar in ["!!", "HY", "!!SF", "^>"]:
+            np.testing.assert_array_equal(window_row.d, row.d)
+        elif row.nomvar == ">>":
+            np.testing.assert_array_equal(window_row.d, row.d[10:30])
+            assert window_row.ni == 20
+        elif row.nomvar == "^^":
+            np.testing.assert_array_equal(window_row.d, row.d[:, 5:25])
+            assert window_row.nj == 20
+        else:
+            np.testing.assert_array_equal(window_row.d, row.d[10:30, 5:25])
+            assert (window_row.ni, window_row.nj) == (20, 20)
+
+
+def test_22(input_file, input_file2):
+    """Test the async api gives the same result as the blocking api"""
+    import asyncio
+
+    async def read(path):
+        df = await StandardFileReader(path, query='nomvar=="UU"').to_pandas_async()
+        return await compute_async(df)
+
+    async def read_all():
+        return await asyncio.gather(read(input_file), read(input_file2))
+
+    df_list = asyncio.run(read_all())
+    for path, df in zip([input_file, input_file2], df_list):
+        expected_df = compute(StandardFileReader(path, query='nomvar=="UU"').to_pandas())
+        pd.testing.assert_frame_equal(df.drop(columns="d"), expected_df.drop(columns="d"))
+        for arr, expected_arr in zip(df.d, expected_df.d):
+            np.testing.assert_array_equal(arr, expected_arr)
+
+
+def test_23(input_file, input_file2):
+    """Test the compact mode stores the string columns as categoricals with the same values"""
+    df = StandardFileReader([input_file, input_file2], decode_metadata=True).to_pandas()
+    compact_df = StandardFileReader([input_file, input_file2], decode_metadata=True, compact=True).to_pandas()
+    basic_compact_df = StandardFileReader([input_file, input_file2], compact=True).to_pandas()
+    for col in ["nomvar", "typvar", "etiket", "grtyp", "grid", "unit", "vctype"]:
+        assert isinstance(compact_df[col].dtype, pd.CategoricalDtype)
+        assert compact_df[col].astype(object).tolist() == df[col].tolist()
+    for col in ["nomvar", "typvar", "etiket", "grtyp", "grid"]:
+        assert isinstance(basic_compact_df[col].dtype, pd.CategoricalDtype)
+
+
+def test_24(input_file2, monkeypatch):
+    """Test the blocks of records fit in the memory budget and compute by blocks gives the same arrays"""
+    from fstpy.utils import get_records_nbytes, get_row_blocks
+
+    df = StandardFileReader(input_file2).to_pandas()
+    nbytes = get_records_nbytes(df)
+    numeric = ~df.datyp.isin([3, 7]).to_numpy()
+    assert nbytes[numeric].tolist() == [arr.nbytes for arr in df.d.loc[numeric]]
+
+    max_bytes = int(nbytes.max())
+    blocks = get_row_blocks(df, max_bytes)
+    assert blocks[0][0] == 0 and blocks[-1][1] == len(df.index)
+    for (start, end), (next_start, _) in zip(blocks, blocks[1:] + [(len(df.index), None)]):
+        assert end == next_start
+        assert nbytes[start:end].sum() <= max_bytes
+
+    expected_df = compute(df)
+    monkeypatch.setattr("fstpy.utils.FSTPY_BLOCK_MAX_BYTES", max_bytes)
+    block_df = compute(df)
+    for arr, expected_arr in zip(block_df.d, expected_df.d):
+        np.testing.assert_array_equal(arr, expected_arr)
@@ -1,14 +1,18 @@
 # -*- coding: utf-8 -*-
-import pytest
+import filecmp
+import secrets
+import shutil
+import tempfile
 import warnings
-from test import TMP_PATH, TEST_PATH
 from pathlib import Path
-import tempfile
+
+import numpy as np
+import pytest
+from ci_fstcomp import fstcomp
+
 import fstpy
 from fstpy.utils import delete_file
-from ci_fstcomp import fstcomp
-import secrets
-import numpy as np
+from test import TEST_PATH, TMP_PATH
 
 pytestmark = [pytest.mark.std_writer, pytest.mark.unit_tests]
 
@@ -427,6 +431,200 @@ def test_12(plugin_test_dir):
     )
 
 
+def test_13(plugin_test_dir):
+    """Test writing a dataframe read in compact mode gives the same file as the source"""
+    source0 = plugin_test_dir + "UUVVTT5x5_fileSrc.std"
+    df = fstpy.StandardFileReader(source0, compact=True).to_pandas()
+
+    results_file = "".join([TMP_PATH, secrets.token_hex(16), "test_13.std"])
+    fstpy.delete_file(results_file)
+    fstpy.StandardFileWriter(results_file, df).to_fst()
+
+    res = fstcomp(results_file, source0, columns=list_of_columns)
+    fstpy.delete_file(results_file)
+    assert res
+
+
+def test_14(input_file):
+    """Test writing with worker processes gives a file identical to the one written without workers"""
+    df = fstpy.StandardFileReader(input_file).to_pandas()
+
+    results_file = "".join([TMP_PATH, secrets.token_hex(16), "test_14.std"])
+    parallel_results_file = "".join([TMP_PATH, secrets.token_hex(16), "test_14_parallel.std"])
+    fstpy.StandardFileWriter(results_file, df).to_fst()
+    fstpy.StandardFileWriter(parallel_results_file, df, num_workers=2).to_fst()
+
+    res = filecmp.cmp(results_file, parallel_results_file, shallow=False)
+    fstpy.delete_file(results_file)
+    fstpy.delete_file(parallel_results_file)
+    assert res
+
+
+def test_15(input_file, monkeypatch):
+    """Test writing through a small queue of materialized records gives the same file as the source"""
+    monkeypatch.setattr(fstpy.std_writer, "FSTPY_WRITE_QUEUE_DEPTH", 2)
+    df = fstpy.StandardFileReader(input_file).to_pandas()
+
+    results_file = "".join([TMP_PATH, secrets.token_hex(16), "test_15.std"])
+    fstpy.StandardFileWriter(results_file, df).to_fst()
+
+    res = fstcomp(results_file, input_file, columns=list_of_columns)
+    fstpy.delete_file(results_file)
+    assert res
+
+
+def test_16(input_file):
+    """Test unmodified records are copied with their packed data and modified ones are encoded again"""
+    df = fstpy.StandardFileReader(input_file, query='nomvar in ["TT", "UU"]').to_pandas()
+    assert all([source is not None for source in fstpy.std_io.get_unmodified_records(df)])
+    df.loc[df.nomvar == "UU", "etiket"] = "MODIFIED"
+    sources = fstpy.std_io.get_unmodified_records(df)
+    assert [source is not None for source in sources] == (df.nomvar == "TT").tolist()
+
+    results_file = "".join([TMP_PATH, secrets.token_hex(16), "test_16.std"])
+    fstpy.StandardFileWriter(results_file, df).to_fst()
+
+    res_df = fstpy.StandardFileReader(results_file, query='nomvar in ["TT", "UU"]').to_pandas()
+    assert res_df.loc[res_df.nomvar == "UU"].etiket.unique().tolist() == ["MODIFIED"]
+    df = fstpy.compute(df).sort_values(["nomvar", "ip1"]).reset_index(drop=True)
+    res_df = fstpy.compute(res_df).sort_values(["nomvar", "ip1"]).reset_index(drop=True)
+    fstpy.delete_file(results_file)
+    for arr, expected_arr in zip(res_df.d, df.d):
+        np.testing.assert_array_equal(arr, expected_arr)
+
+
+def test_17(input_file):
+    """Test updating the headers of the records of a file in update mode"""
+    results_file = "".join([TMP_PATH, secrets.token_hex(16), "test_17.std"])
+    shutil.copy(input_file, results_file)
+    df = fstpy.StandardFileReader(results_file, query='nomvar=="TT"').to_pandas()
+    df["etiket"] = "UPDATED"
+    df["ip3"] = 7
+    fstpy.StandardFileWriter(results_file, df, mode="update", overwrite=True).to_fst()
+
+    res_df = fstpy.StandardFileReader(results_file).to_pandas()
+    fstpy.delete_file(results_file)
+    tt_df = res_df.loc[res_df.nomvar == "TT"]
+    assert len(tt_df.index) == len(df.index)
+    assert tt_df.etiket.unique().tolist() == ["UPDATED"]
+    assert tt_df.ip3.unique().tolist() == [7]
+    assert "UPDATED" not in res_df.loc[res_df.nomvar != "TT"].etiket.unique()
+
+
+def test_18(input_file, tmp_path):
+    """Test writing one file per nomvar, each file gets the metadata it needs"""
+    df = fstpy.StandardFileReader(input_file, query='nomvar in ["TT", "UU", ">>", "^^", "!!", "P0"]').to_pandas()
+    filenames = fstpy.ShardedStandardFileWriter(
+        str(tmp_path / "shard_{key}.std"), df, partition="nomvar", num_workers=2
+    ).to_fst()
+    assert sorted(filenames.keys()) == ["TT", "UU"]
+
+    for key, filename in filenames.items():
+        res_df = fstpy.StandardFileReader(filename).to_pandas()
+        expected_df = fstpy.metadata_cleanup(df.loc[~df.nomvar.isin(["TT", "UU"]) | (df.nomvar == key)], False)
+        assert sorted(res_df.nomvar.tolist()) == sorted(expected_df.nomvar.tolist())
+
+
+def test_19(input_file, tmp_path):
+    """Test records without a partition key raise an error instead of being left out of the shards"""
+    df = fstpy.StandardFileReader(input_file, query='nomvar in ["TT", "UU", ">>", "^^"]').to_pandas()
+    df["member"] = np.where(df.nomvar == "TT", "001", None)
+    with pytest.raises(fstpy.StandardFileWriterError):
+        fstpy.ShardedStandardFileWriter(str(tmp_path / "shard_{key}.std"), df, partition="member").to_fst()
+    assert not list(tmp_path.iterdir())
+
+
+def test_20(monkeypatch):
+    """Test the records are materialized by chunks no larger than the writer queue"""
+    import queue
+    import threading
+
+    import pandas as pd
+
+    from fstpy import std_writer
+
+    chunks = []
+
+    def compute_arrays(arrays, num_workers=None):
+        chunks.append(len(arrays))
+        return arrays
+
+    monkeypatch.setattr(std_writer, "compute_arrays", compute_arrays)
+    df = pd.DataFrame({"d": [np.full((2, 2), i, dtype="float32") for i in range(10)]})
+    records = queue.Queue(maxsize=3)
+    producer = threading.Thread(
+        target=std_writer.produce_records, args=(df, [(0, 7), (7, 10)], None, records, threading.Event())
+    )
+    producer.start()
+    arrays = [records.get() for _ in range(10)]
+    producer.join()
+    assert chunks == [3, 3, 1, 3]
+    for i, arr in enumerate(arrays):
+        np.testing.assert_array_equal(arr, np.full((2, 2), i, dtype="float32"))
+
+
+@pytest.mark.parametrize("case", ["rewrite", "duplicates", "copy_error"])
+def test_21(input_file, tmp_path, monkeypatch, case):
+    """Test no placeholder is left in the file when the unmodified records can't be copied by position"""
+    import pandas as pd
+
+    from fstpy import std_writer
+
+    df = fstpy.StandardFileReader(input_file, query='nomvar=="TT"').to_pandas()
+    results_file = str(tmp_path / "test_21.std")
+    rewrite = None
+    if case == "rewrite":
+        # the records already in the file are replaced
+        fstpy.StandardFileWriter(results_file, df).to_fst()
+        rewrite = True
+    elif case == "duplicates":
+        df = pd.concat([df, df], ignore_index=True)
+        rewrite = False
+    else:
+
+        def copy_records_data(path, offset, sources):
+            raise fstpy.std_xdf.XdfError("copy failed")
+
+        monkeypatch.setattr(std_writer, "copy_records_data", copy_records_data)
+    fstpy.StandardFileWriter(results_file, df, rewrite=rewrite).to_fst()
+
+    columns = ["typvar", "etiket", "ip1", "ip2", "ip3", "dateo", "deet", "npas"]
+    expected_df = fstpy.compute(df.drop_duplicates(subset=columns))
+    res_df = fstpy.compute(fstpy.StandardFileReader(results_file, query='nomvar=="TT"').to_pandas())
+    assert len(res_df.index) == len(df.index)
+    expected = {tuple(row[columns]): row.d for _, row in expected_df.iterrows()}
+    for _, row in res_df.iterrows():
+        np.testing.assert_array_equal(row.d, expected[tuple(row[columns])])
+
+
+def test_22(input_file):
+    """Test records packed by worker processes give a file identical to the one written without workers"""
+    df = fstpy.StandardFileReader(input_file, query='nomvar in ["TT", "UU", "VV"]').to_pandas()
+    df = fstpy.compute(df)
+    df["d"] = [arr * 2 for arr in df.d]
+    # packed without compression, the workers pack them
+    df["datyp"] = 1
+
+    results_file = "".join([TMP_PATH, secrets.token_hex(16), "test_22.std"])
+    parallel_results_file = "".join([TMP_PATH, secrets.token_hex(16), "test_22_parallel.std"])
+    fstpy.StandardFileWriter(results_file, df).to_fst()
+    fstpy.StandardFileWriter(parallel_results_file, df, num_workers=2).to_fst()
+
+    res = filecmp.cmp(results_file, parallel_results_file, shallow=False)
+    fstpy.delete_file(results_file)
+    fstpy.delete_file(parallel_results_file)
+    assert res
+
+
+def test_23(input_file):
+    """Test a missing header value raises an error naming its column"""
+    df = fstpy.StandardFileReader(input_file, query='nomvar=="TT"').to_pandas()
+    df["ip3"] = df.ip3.astype(object)
+    df.loc[df.index[0], "ip3"] = None
+    with pytest.raises(fstpy.StandardFileWriterError, match="ip3"):
+        fstpy.std_writer.RecordHeaders(df)
+
+
 # #     std_file_writer = StandardFileWriter(tmp_file,df)
 # #     std_file_writer.to_fst()
 
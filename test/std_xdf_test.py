@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from fstpy import std_io
+from fstpy.rmn_interface import RmnInterface
+from fstpy.std_io import get_basic_dataframe, get_records_metadata, map_records, read_records
+from fstpy.std_xdf import XdfError, get_xdf_records, read_directory_entries
+from test import TEST_PATH
+
+pytestmark = [pytest.mark.std_reader, pytest.mark.unit_tests]
+
+
+@pytest.fixture(
+    scope="module",
+    params=[
+        "/ReaderStd/testsFiles/source_data_5005.std",
+        "/ReaderStd/testsFiles/input_big_fileSrc.std",
+        "/ReaderStd/testsFiles/2022020400_144",
+        "/ReaderStd/testsFiles/nwatl.fstd",
+        "forecast",
+    ],
+)
+def input_file(request, tmp_path_factory):
+    if request.param == "forecast":
+        return write_forecast_file(str(tmp_path_factory.mktemp("xdf") / "forecast.std"))
+    return TEST_PATH + request.param
+
+
+def write_forecast_file(path: str) -> str:
+    """Writes records whose dateo differs from datev, with old and new style date stamps"""
+    file_id = RmnInterface.open_file(path, RmnInterface.FST_RW)
+    try:
+        for dateo in [RmnInterface.date_to_stamp(20220204, 0), RmnInterface.date_to_stamp(19950101, 12000000)]:
+            for deet, npas in [(300, 0), (300, 12), (450, 7), (3600, 48)]:
+                meta = {
+                    "nomvar": "TT",
+                    "typvar": "P",
+                    "etiket": "FORECAST",
+                    "ni": 4,
+                    "nj": 3,
+                    "nk": 1,
+                    "dateo": dateo,
+                    "ip1": 0,
+                    "ip2": deet * npas // 3600,
+                    "ip3": 0,
+                    "deet": deet,
+                    "npas": npas,
+                    "datyp": 5,
+                    "nbits": 32,
+                    "grtyp": "X",
+                    "ig1": 0,
+                    "ig2": 0,
+                    "ig3": 0,
+                    "ig4": 0,
+                }
+                data = np.full((4, 3), npas, dtype=np.float32, order="F")
+                RmnInterface.write_record(file_id, data, meta, rewrite=False)
+    finally:
+        RmnInterface.close_file(file_id)
+    return path
+
+
+columns = [
+    "nomvar",
+    "typvar",
+    "etiket",
+    "ni",
+    "nj",
+    "nk",
+    "dateo",
+    "ip1",
+    "ip2",
+    "ip3",
+    "deet",
+    "npas",
+    "datyp",
+    "nbits",
+    "grtyp",
+    "ig1",
+    "ig2",
+    "ig3",
+    "ig4",
+    "datev",
+    "swa",
+    "lng",
+    "key",
+]
+
+
+def test_1(input_file, monkeypatch):
+    """Test the XDF directory gives the same metadata as fstprm and is used instead of fstprm"""
+    xdf_df = get_xdf_records(input_file)
+    prm_df = get_records_metadata(input_file)
+    prm_df = prm_df.loc[prm_df.dltf == 0].sort_values("key").reset_index(drop=True)
+    xdf_df = xdf_df.sort_values("key").reset_index(drop=True)
+
+    for col in ["nomvar", "typvar", "etiket", "grtyp"]:
+        xdf_df[col] = xdf_df[col].str.strip()
+        prm_df[col] = prm_df[col].str.strip()
+
+    pd.testing.assert_frame_equal(xdf_df[columns], prm_df[columns], check_dtype=False)
+
+    def fail_get_records_metadata(path, criteria=None):
+        raise AssertionError(f"fell back to fstprm for {path}")
+
+    monkeypatch.setattr(std_io, "FSTPY_XDF_HEADERS", True)
+    monkeypatch.setattr(std_io, "get_records_metadata", fail_get_records_metadata)
+    assert len(get_basic_dataframe(input_file).index) == len(xdf_df.index)
+
+
+def test_2(tmp_path):
+    """Test a file that is not an XDF file raises XdfError"""
+    not_fst = tmp_path / "not_fst.txt"
+    not_fst.write_text("not a standard file" * 20)
+    with pytest.raises(XdfError):
+        read_directory_entries(str(not_fst))
+
+
+def test_3(input_file):
+    """Test memory mapped IEEE records have the same values as fstluk"""
+    df = get_basic_dataframe(input_file)
+    df = df.loc[(df.datyp == 5) & df.nbits.isin([32, 64])]
+    if df.empty:
+        pytest.skip("no uncompressed IEEE records")
+    layouts = list(zip(df.datyp, df.nbits, df.swa, df.lng, df["shape"]))
+    mapped = map_records(input_file, layouts)
+    expected = read_records(input_file, df.key.to_list())
+    assert all(arr is not None for arr in mapped)
+    for arr, expected_arr in zip(mapped, expected):
+        assert arr.flags.f_contiguous
+        np.testing.assert_array_equal(arr, expected_arr)